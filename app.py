@@ -3,33 +3,73 @@ Baby Jukebox — Application principale Flask.
 
 Démarre :
   1. La base de données SQLite via SQLAlchemy
-  2. Le lecteur audio VLC
+  2. Le lecteur audio (VLC, ou ffmpeg → ALSA)
   3. Le thread daemon RFID RC522
   4. Le serveur Flask
 """
 
 from __future__ import annotations
 
+import atexit
 import os
 import logging
+import threading
+import time
 import uuid
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from urllib.parse import unquote
 
 from flask import (
     Flask,
+    Response,
     render_template,
     request,
     redirect,
     url_for,
     flash,
     jsonify,
+    abort,
+    send_from_directory,
 )
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from werkzeug.utils import secure_filename
 
-from models import db, Audio, Playlist, Tag
-from player import Player
+from models import db, Audio, Playlist, Tag, ensure_schema, playlist_audio, set_playlist_order
+from maintenance import MaintenanceScheduler
+from library_batch import MAX_OPERATIONS, apply_batch, BatchError
+from provisioning import Provisioner, ProvisioningError, resolve_targets
+from library_archive import (
+    build_export_plan,
+    iter_export,
+    receive_archive,
+    merge_into_library,
+    ArchiveError,
+)
+from library_sync import (
+    MAX_CHANGES,
+    changes_since,
+    compact_change_log,
+    install_change_log,
+    snapshot as library_snapshot,
+)
+from play_history import (
+    PlayHistory,
+    counters as history_counters,
+    prune_history,
+    recent_events,
+    recent_start_counts,
+)
+from player import create_player
+from hot_cache import HotCache
+from loudness import DEFAULT_TARGET_LUFS, LoudnessAnalyzer
+from state_journal import StateJournal
+from thumbnails import FORMATS as THUMB_FORMATS, SIZES as THUMB_SIZES, ThumbnailStore
 from rfid_reader import RFIDReader
+import memory_report
+import profiling
+import yt_worker
 
 # ---------------------------------------------------------------------------
 # Configuration
@@ -37,6 +77,7 @@ from rfid_reader import RFIDReader
 
 BASE_DIR = Path(__file__).parent
 UPLOAD_FOLDER = BASE_DIR / "uploads"
+THUMB_FOLDER = BASE_DIR / "thumbnails"
 ALLOWED_EXTENSIONS = {"mp3", "ogg", "wav", "flac", "m4a"}
 
 # Fichier de cookies Netscape optionnel pour contourner les 403 YouTube.
@@ -44,6 +85,62 @@ ALLOWED_EXTENSIONS = {"mp3", "ogg", "wav", "flac", "m4a"}
 # puis copier sur le Pi : scp cookies.txt pi@<IP>:/home/pi/baby-jukebox/youtube_cookies.txt
 YT_COOKIES_FILE = BASE_DIR / "youtube_cookies.txt"
 
+# Format des téléchargements YouTube :
+#   native   : flux audio d'origine (m4a/opus), lisible dès la fin du téléchargement
+#   mp3      : réencodage MP3 192k pendant le téléchargement (CPU du Pi occupé)
+#   deferred : natif, puis réencodage MP3 par la maintenance de fond
+YT_AUDIO_FORMAT = os.environ.get("JUKEBOX_YT_AUDIO", "native")
+
+# Retrait du tag : mise en pause (désactivée par défaut) et reprise au
+# retour du même tag (activée par défaut).
+PAUSE_ON_REMOVE = os.environ.get("JUKEBOX_PAUSE_ON_REMOVE", "0") == "1"
+RESUME_ON_RETURN = os.environ.get("JUKEBOX_RESUME_ON_RETURN", "1") == "1"
+
+# Cache RAM (tmpfs) des fichiers les plus scannés, en Mo — 0 pour désactiver.
+# Désactivé par défaut en mode basse mémoire (le tmpfs consomme de la RAM).
+RAM_CACHE_DIR = Path("/dev/shm/baby-jukebox-cache")
+
+# Profil basse mémoire (Pi Zero 2W, 512 Mo) : yt-dlp en sous-processus,
+# VLC allégé, caches bornés. Activer avec JUKEBOX_LOW_MEMORY=1.
+LOW_MEMORY = os.environ.get("JUKEBOX_LOW_MEMORY", "0") == "1"
+
+# Moteur de lecture : "vlc" (défaut), "pipe" (ffmpeg → aplay, sans libvlc),
+# "null" ou "file:<chemin>" (sans carte son). Voir pipe_player.py.
+AUDIO_BACKEND = os.environ.get("JUKEBOX_AUDIO_BACKEND", "vlc")
+
+RAM_CACHE_MB = int(os.environ.get("JUKEBOX_RAM_CACHE_MB", "0" if LOW_MEMORY else "64"))
+
+# Reprise à chaud après un redémarrage du worker (timeout Gunicorn, crash) :
+# la lecture en cours est relancée si elle date de moins de N secondes.
+# 0 pour désactiver.
+STATE_JOURNAL_FILE = BASE_DIR / "player_state.jsonl"
+RESUME_MAX_AGE = int(os.environ.get("JUKEBOX_RESUME_MAX_AGE", "300"))
+
+# Maintenance de fond (GC, VACUUM, intégrité) : après N secondes sans lecture
+# ni requête HTTP, au plus une fois par jour, éventuellement limitée à une
+# plage horaire "début-fin" (ex. "2-5" = de 2 h à 5 h 59).
+MAINTENANCE_IDLE = int(os.environ.get("JUKEBOX_MAINTENANCE_IDLE", "900"))
+_hours = os.environ.get("JUKEBOX_MAINTENANCE_HOURS", "").strip()
+MAINTENANCE_HOURS = tuple(int(h) for h in _hours.split("-", 1)) if _hours else None
+
+# Normalisation de sonie : cible EBU R128 (LUFS) et nombre maximal
+# d'analyses ffmpeg simultanées.
+LOUDNESS_TARGET = float(os.environ.get("JUKEBOX_LOUDNESS_TARGET", str(DEFAULT_TARGET_LUFS)))
+LOUDNESS_WORKERS = int(os.environ.get("JUKEBOX_LOUDNESS_WORKERS", "1" if LOW_MEMORY else "2"))
+
+# Synchronisation des clients : les traces d'entités supprimées sont gardées
+# N jours dans le journal des modifications ; un client plus ancien repart
+# d'un snapshot complet.
+SYNC_RETENTION_DAYS = float(os.environ.get("JUKEBOX_SYNC_RETENTION_DAYS", "30"))
+
+# Historique d'écoute : délai maximal (s) avant écriture des événements en
+# base (= fenêtre de perte en cas de coupure) et durée de conservation.
+HISTORY_FLUSH = float(os.environ.get("JUKEBOX_HISTORY_FLUSH", "2"))
+HISTORY_DAYS = float(os.environ.get("JUKEBOX_HISTORY_DAYS", "365"))
+
+# Démarrage du worker : référence pour mesurer le délai redémarrage → son
+_WORKER_STARTED = time.monotonic()
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(name)s — %(message)s",
@@ -56,17 +153,136 @@ app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR / 'jukebox.db'}"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["UPLOAD_FOLDER"] = str(UPLOAD_FOLDER)
 app.config["MAX_CONTENT_LENGTH"] = 100 * 1024 * 1024  # 100 Mo max par upload
+if LOW_MEMORY:
+    # Cache de requêtes compilées SQLAlchemy (500 par défaut)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"query_cache_size": 50}
 
 db.init_app(app)
 
+if LOW_MEMORY:
+    @event.listens_for(Engine, "connect")
+    def _sqlite_low_memory(dbapi_conn, _record):
+        # Cache de pages SQLite limité à 512 Ko par connexion (2 Mo par défaut)
+        dbapi_conn.execute("PRAGMA cache_size = -512")
+
+if os.environ.get("JUKEBOX_TRACEMALLOC", "0") == "1":
+    memory_report.start_tracing()
+
+# Profilage HTTP/SQL : aucun hook enregistré (coût nul) sans JUKEBOX_PROFILING=1
+profiler = profiling.RequestProfiler()
+if os.environ.get("JUKEBOX_PROFILING", "0") == "1":
+    profiler.init_app(app)
+
 # ---------------------------------------------------------------------------
 # Singletons partagés entre Flask et le thread RFID
 # ---------------------------------------------------------------------------
 
-player = Player()
+hot_cache = HotCache(
+    RAM_CACHE_DIR,
+    RAM_CACHE_MB * 1024 * 1024 if RAM_CACHE_DIR.parent.is_dir() else 0,
+    # Copies encore en file chez le lecteur (créé juste après)
+    in_use=lambda: player.queued_paths(),
+)
+# Gain de sonie par nom de fichier, lu par le lecteur à chaque début de piste
+# (chargé au démarrage, mis à jour à chaque analyse)
+_track_gains: dict[str, float] = {}
+history = PlayHistory(
+    BASE_DIR / "jukebox.db",
+    capacity=1024 if LOW_MEMORY else 4096,
+    flush_interval=HISTORY_FLUSH,
+)
+player = create_player(
+    AUDIO_BACKEND,
+    low_memory=LOW_MEMORY,
+    resolve_path=hot_cache.resolve,
+    gain_for=_track_gains.get,
+    on_track_start=lambda name: history.record("start", media=name),
+)
+thumbnails = ThumbnailStore(THUMB_FOLDER)
+journal = StateJournal(STATE_JOURNAL_FILE, snapshot=player.snapshot)
+
+
+def _store_loudness(audio_id: int, lufs: float | None, gain_db: float) -> None:
+    """Enregistre le résultat d'une analyse de sonie (thread du pool)."""
+    with app.app_context():
+        audio = db.session.get(Audio, audio_id)
+        if audio is None:
+            return  # supprimé pendant l'analyse
+        audio.loudness_lufs = lufs
+        audio.gain_db = gain_db
+        db.session.commit()
+        _track_gains[os.path.basename(audio.file_path)] = gain_db
+
+
+loudness = LoudnessAnalyzer(_store_loudness, workers=LOUDNESS_WORKERS, target=LOUDNESS_TARGET)
 
-# Dernier tag RFID scanné qui n'est pas encore assigné en base
-_last_unassigned_tag: str | None = None
+
+def _maintenance_busy() -> bool:
+    """Lecture ou téléchargement YouTube en cours : pas de maintenance."""
+    if player.get_state() in ("Playing", "Opening", "Buffering"):
+        return True
+    return any(job.get("status") == "pending" for job in list(_yt_jobs.values()))
+
+
+maintenance = MaintenanceScheduler(
+    BASE_DIR / "jukebox.db",
+    UPLOAD_FOLDER,
+    is_busy=_maintenance_busy,
+    idle_seconds=MAINTENANCE_IDLE,
+    hours=MAINTENANCE_HOURS,
+)
+maintenance.add_task(
+    "gc_thumbnails",
+    lambda ctx: thumbnails.prune(
+        {os.path.basename(fp) for (fp,) in ctx.conn.execute("SELECT file_path FROM audio")}
+    ),
+)
+
+
+def _reencode_youtube(ctx) -> dict:
+    """Tâche de maintenance (JUKEBOX_YT_AUDIO=deferred) : téléchargements natifs → MP3."""
+    rows = ctx.conn.execute("SELECT id, file_path FROM audio").fetchall()
+    done = []
+    for audio_id, file_path in rows:
+        if not yt_worker.is_native_download(file_path):
+            continue
+        ctx.check()
+        src = Path(audio_abs_path(file_path))
+        dest = src.with_suffix(".mp3")
+        if dest.exists() or not src.is_file():
+            continue
+        try:
+            yt_worker.transcode_mp3(str(src), str(dest), check=ctx.check)
+        except yt_worker.YtWorkerError as e:
+            logger.warning(f"Maintenance : réencodage impossible de {src.name} : {e}")
+            continue
+        ctx.conn.execute("UPDATE audio SET file_path = ? WHERE id = ?", (dest.name, audio_id))
+        ctx.conn.commit()
+        hot_cache.invalidate(str(src))
+        thumbnails.rename(src.name, dest.name)
+        if src.name in _track_gains:
+            _track_gains[dest.name] = _track_gains.pop(src.name)
+        src.unlink(missing_ok=True)
+        done.append(dest.name)
+    if done:
+        logger.info(f"Maintenance : {len(done)} téléchargement(s) YouTube réencodé(s) en MP3")
+    return {"files": done}
+
+
+if YT_AUDIO_FORMAT == "deferred":
+    maintenance.add_task("reencode_youtube", _reencode_youtube)
+maintenance.add_task("prune_history", lambda ctx: prune_history(ctx, HISTORY_DAYS * 86400))
+maintenance.add_task("compact_changes", lambda ctx: compact_change_log(ctx, SYNC_RETENTION_DAYS * 86400))
+
+# Tags RFID scannés pas encore assignés en base, et association en série
+provisioning = Provisioner()
+
+# Thread RFID (créé dans create_app)
+rfid_reader: RFIDReader | None = None
+
+# Tag dont la lecture est en cours, et pause déclenchée par son retrait
+_playing_tag: str | None = None
+_paused_by_removal = False
 
 # ---------------------------------------------------------------------------
 # YouTube — exécuteur de téléchargement (1 worker : file d'attente FIFO)
@@ -74,15 +290,44 @@ _last_unassigned_tag: str | None = None
 
 _yt_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="yt-dl")
 _yt_jobs: dict[str, dict] = {}  # job_id → {status, audio_name?, message?}
+_YT_JOBS_MAX = 20 if LOW_MEMORY else 100
 
 
 def on_tag_detected(rfid_id: str):
     """
-    Callback appelé par le thread RFID.
+    Callback appelé par le thread RFID à chaque pose d'un tag.
     Vérifie si le tag est en base ; si oui, lance la lecture.
-    Sinon, mémorise l'ID pour la page d'association.
+    Sinon, met l'ID en file pour la page d'association.
+
+    En mode série (provisioning.py), aucun tag ne lance de lecture : une
+    carte inconnue est liée à la cible suivante, les autres sont ignorées.
+
+    Le même tag reposé pendant sa propre lecture ne relance rien ; s'il avait
+    été mis en pause par son retrait, la lecture reprend (RESUME_ON_RETURN).
     """
-    global _last_unassigned_tag
+    global _playing_tag, _paused_by_removal
+
+    # La maintenance de fond rend la main (et libère la base) immédiatement
+    maintenance.interrupt()
+    history.record("scan", rfid_id=rfid_id)
+
+    if provisioning.active:
+        with app.app_context():
+            known = db.session.scalar(db.select(Tag.id).where(Tag.rfid_id == rfid_id)) is not None
+        outcome = provisioning.capture(rfid_id, known)
+        logger.info(f"Association en série : tag {rfid_id} → {outcome}")
+        return
+
+    if rfid_id == _playing_tag:
+        state = player.get_state()
+        if state == "Paused" and _paused_by_removal and RESUME_ON_RETURN:
+            logger.info(f"Tag {rfid_id} reposé → reprise de la lecture")
+            player.set_pause(False)
+            _paused_by_removal = False
+            return
+        if state in ("Playing", "Opening", "Buffering"):
+            logger.info(f"Tag {rfid_id} reposé pendant sa lecture → ignoré")
+            return
 
     with app.app_context():
         tag = Tag.query.filter_by(rfid_id=rfid_id).first()
@@ -93,58 +338,124 @@ def on_tag_detected(rfid_id: str):
                     logger.error(f"Tag {rfid_id} → fichier introuvable : {path}")
                     return
                 logger.info(f"Tag {rfid_id} → lecture audio '{tag.audio.name}' ({path})")
-                player.play_file(path)
+                hot_cache.record_scan([path])
+                _record_skip()
+                if player.play_file(path):
+                    _playing_tag, _paused_by_removal = rfid_id, False
+                    journal.record("play", tag=rfid_id, audio_id=tag.audio_id)
             elif tag.playlist_id and tag.playlist:
-                files = [audio_abs_path(a.file_path) for a in tag.playlist.audios]
-                missing = [f for f in files if not os.path.isfile(f)]
-                if missing:
-                    logger.warning(f"Playlist : {len(missing)} fichier(s) introuvable(s) : {missing}")
-                files = [f for f in files if os.path.isfile(f)]
-                if not files:
-                    logger.error(f"Tag {rfid_id} → playlist '{tag.playlist.name}' vide ou tous les fichiers manquants")
-                    return
-                logger.info(f"Tag {rfid_id} → lecture playlist '{tag.playlist.name}' ({len(files)} pistes)")
-                player.play_playlist(files)
+                playlist = tag.playlist
+                # Pas de stat() ici : le lecteur vérifie les fichiers au fil de l'eau
+                files = [audio_abs_path(a.file_path) for a in playlist.audios]
+                logger.info(f"Tag {rfid_id} → lecture playlist '{playlist.name}' ({len(files)} pistes)")
+                # Seules les premières pistes conditionnent le délai scan → son
+                if not playlist.shuffle:
+                    hot_cache.record_scan(files[:3])
+                _record_skip()
+                if player.play_playlist(files, shuffle=playlist.shuffle, repeat=playlist.repeat):
+                    _playing_tag, _paused_by_removal = rfid_id, False
+                    journal.record("play", tag=rfid_id, playlist_id=playlist.id)
+                else:
+                    logger.error(f"Tag {rfid_id} → playlist '{playlist.name}' vide ou tous les fichiers manquants")
             else:
                 logger.warning(f"Tag {rfid_id} en base mais sans audio ni playlist associé")
         else:
             logger.info(f"Tag inconnu : {rfid_id} — mémorisé pour assignation")
-            _last_unassigned_tag = rfid_id
-
+            provisioning.capture(rfid_id, known=False)
 
-# ---------------------------------------------------------------------------
-# Helpers
-# ---------------------------------------------------------------------------
 
-def allowed_file(filename: str) -> bool:
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+def on_tag_removed(rfid_id: str):
+    """Callback appelé par le thread RFID quand le tag posé est retiré."""
+    global _paused_by_removal
 
+    if PAUSE_ON_REMOVE and rfid_id == _playing_tag and player.get_state() == "Playing":
+        logger.info(f"Tag {rfid_id} retiré → pause")
+        player.set_pause(True)
+        _paused_by_removal = True
 
-def _yt_base_opts() -> dict:
-    """Options yt-dlp communes : clients et cookies si disponibles.
 
-    Clients retenus :
-    - ios         : pas de PO token, pas de SABR — le plus fiable en 2025/2026
-    - tv_embedded : fallback, fonctionne sur les vidéos embarquables
-    NE PAS utiliser :
-    - web/mweb    : SABR forcing depuis 2025 (yt-dlp #12482), URLs directes supprimées
-    - android     : blacklisté par YouTube depuis fin 2024
+def _warm_restart() -> None:
+    """Reprend la lecture interrompue par un redémarrage du worker.
 
-    IMPORTANT : mettre à jour yt-dlp régulièrement.
-    En cas d'erreur "no longer supported" ou 403 :
-      pip install -U yt-dlp && systemctl restart baby-jukebox
+    L'état vient du journal (state_journal.py) : tag, audio ou playlist,
+    piste et position. Rien n'est repris si la lecture était arrêtée, en
+    pause, terminée, ou plus ancienne que JUKEBOX_RESUME_MAX_AGE.
     """
-    cookies_present = YT_COOKIES_FILE.exists()
+    global _playing_tag
+
+    state = journal.load()
+    if not state:
+        return
+    age = time.time() - state.get("t", 0)
+    if RESUME_MAX_AGE <= 0 or age > RESUME_MAX_AGE or state.get("state", "Playing") not in ("Playing", "Opening", "Buffering"):
+        logger.info(f"Reprise à chaud ignorée (état {state.get('state')}, il y a {age:.0f} s)")
+        journal.record("stop")
+        return
+
+    start_ms = int(state.get("time_ms") or 0)
+    started = False
+    if state.get("audio_id"):
+        audio = db.session.get(Audio, state["audio_id"])
+        if audio:
+            started = player.play_file(audio_abs_path(audio.file_path), start_ms=start_ms)
+    elif state.get("playlist_id"):
+        playlist = db.session.get(Playlist, state["playlist_id"])
+        if playlist:
+            files = [audio_abs_path(a.file_path) for a in playlist.audios]
+            names = [os.path.basename(f) for f in files]
+            media = state.get("media")
+            if media not in names and media:
+                # Journal écrit avant le décodage des MRL ('mon%20fichier.mp3')
+                media = unquote(media)
+            index = names.index(media) if media in names else None
+            started = player.play_playlist(
+                files,
+                shuffle=playlist.shuffle,
+                repeat=playlist.repeat,
+                start_index=index,
+                start_ms=start_ms if index is not None else 0,
+            )
+    if not started:
+        journal.record("stop")
+        return
+
+    # Le tag encore posé sur le lecteur ne relancera pas la lecture au début
+    _playing_tag = state.get("tag")
+    journal.record("play", **{k: state[k] for k in ("tag", "audio_id", "playlist_id") if state.get(k)})
+    logger.info(f"Reprise à chaud : {state.get('media')} à {start_ms // 1000} s")
+
+    def _measure():
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            if player.get_state() == "Playing":
+                elapsed = time.monotonic() - _WORKER_STARTED
+                logger.info(f"Reprise à chaud : son {elapsed * 1000:.0f} ms après le démarrage du worker")
+                return
+            time.sleep(0.02)
+        logger.warning("Reprise à chaud : pas de son après 10 s")
+
+    threading.Thread(target=_measure, daemon=True, name="warm-restart").start()
+
+
+def _record_skip() -> None:
+    """Historique : la piste en cours est interrompue avant sa fin."""
+    snap = player.snapshot()
+    if snap["state"] in ("Playing", "Paused") and player.get_time_info()["position"] < 0.95:
+        history.record("skip", media=snap["media"], position_ms=snap["time_ms"])
+
+
+def _forget_playing_tag():
+    """Lecture lancée depuis l'interface web : plus aucun tag n'en est à l'origine."""
+    global _playing_tag, _paused_by_removal
+    _playing_tag, _paused_by_removal = None, False
 
-    opts: dict = {
-        "quiet": True,
-        "no_warnings": True,
-        "extractor_args": {"youtube": {"player_client": ["ios", "tv_embedded"]}},
-    }
-    if cookies_present:
-        opts["cookiefile"] = str(YT_COOKIES_FILE)
-        logger.info("YouTube : cookies chargés depuis youtube_cookies.txt")
-    return opts
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def allowed_file(filename: str) -> bool:
+    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
 def _fmt_duration(seconds) -> str:
@@ -156,57 +467,51 @@ def _fmt_duration(seconds) -> str:
     return f"{h}:{m:02d}:{s:02d}" if h else f"{m}:{s:02d}"
 
 
+def _yt_call(command: str, **kwargs):
+    """Appelle yt_worker en direct, ou dans un sous-processus en mode basse mémoire."""
+    kwargs["cookies_file"] = str(YT_COOKIES_FILE) if YT_COOKIES_FILE.exists() else None
+    if LOW_MEMORY:
+        timeout = yt_worker.SEARCH_TIMEOUT if command == "search" else yt_worker.DOWNLOAD_TIMEOUT
+        return yt_worker.run_isolated(command, timeout=timeout, **kwargs)
+    return getattr(yt_worker, command)(**kwargs)
+
+
+def _set_yt_job(job_id: str, job: dict) -> None:
+    """Met à jour un job en bornant le nombre de jobs gardés en mémoire."""
+    _yt_jobs[job_id] = job
+    while len(_yt_jobs) > _YT_JOBS_MAX:
+        _yt_jobs.pop(next(iter(_yt_jobs)), None)
+
+
 def _download_youtube(job_id: str, url: str) -> None:
     """Télécharge l'audio d'une vidéo YouTube et l'enregistre en base.
     Tourne dans le thread pool yt-dl — ne pas appeler directement depuis Flask.
     Requiert ffmpeg installé sur le système (sudo apt install ffmpeg).
     """
     try:
-        import yt_dlp  # type: ignore
-
-        ydl_opts = _yt_base_opts() | {
-            # m4a (tv_embedded/iOS) en priorité, puis n'importe quel audio, puis flux complet
-            # Aucune restriction de format : yt-dlp prend ce qui est disponible
-            # ffmpeg se charge de l'extraction audio quelle que soit la source
-            'format': 'bestaudio/best',
-            'quiet': False,
-            'no_warnings': False,
-            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/119.0.0.0 Safari/537.36',
-            'nocheckcertificate': True,
-            "postprocessors": [{
-                "key": "FFmpegExtractAudio",
-                "preferredcodec": "mp3",
-                "preferredquality": "192",
-            }],
-            # Nomme le fichier par l'ID vidéo → nom prévisible, pas de conflit
-            "outtmpl": str(UPLOAD_FOLDER / "%(id)s.%(ext)s"),
-            "nooverwrites": True,
-        }
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            video_id = info["id"]
-            title = info["title"]
-
-        dest_mp3 = UPLOAD_FOLDER / f"{video_id}.mp3"
+        info = _yt_call(
+            "download", url=url, dest_dir=str(UPLOAD_FOLDER), transcode=YT_AUDIO_FORMAT == "mp3"
+        )
+        title = info["title"]
+        dest = UPLOAD_FOLDER / info["file"]
 
         with app.app_context():
-            if not Audio.query.filter_by(file_path=dest_mp3.name).first():
-                audio = Audio(name=title, file_path=dest_mp3.name)
+            if not Audio.query.filter_by(file_path=dest.name).first():
+                audio = Audio(name=title, file_path=dest.name)
                 db.session.add(audio)
                 db.session.commit()
+                loudness.submit(audio.id, str(dest))
 
-        # Nettoyage : on garde seulement les 100 derniers jobs en mémoire
-        if len(_yt_jobs) > 100:
-            oldest = list(_yt_jobs.keys())[0]
-            _yt_jobs.pop(oldest, None)
-
-        _yt_jobs[job_id] = {"status": "done", "audio_name": title}
-        logger.info(f"YouTube téléchargé : '{title}' ({dest_mp3.name})")
+        if info.get("thumbnail"):
+            thumbnails.schedule_remote(str(dest), info["thumbnail"])
+        else:
+            thumbnails.schedule_extract(str(dest))
+        _set_yt_job(job_id, {"status": "done", "audio_name": title, "seconds": info.get("seconds")})
+        logger.info(f"YouTube téléchargé : '{title}' ({dest.name}), lisible en {info.get('seconds')} s")
 
     except Exception as e:
         logger.error(f"Erreur téléchargement YouTube (job {job_id}) : {e}")
-        _yt_jobs[job_id] = {"status": "error", "message": str(e)}
+        _set_yt_job(job_id, {"status": "error", "message": str(e)})
 
 
 def audio_abs_path(file_path: str) -> str:
@@ -225,6 +530,36 @@ def audio_abs_path(file_path: str) -> str:
     return str(UPLOAD_FOLDER / p)
 
 
+def _backfill_analysis() -> None:
+    """Planifie pochettes et analyse de sonie pour les audios jamais traités."""
+    rows = db.session.query(Audio.id, Audio.file_path, Audio.gain_db).all()
+    thumbnails.backfill([audio_abs_path(fp) for _, fp, _ in rows])
+    for _, fp, gain in rows:
+        if gain is not None:
+            _track_gains[os.path.basename(fp)] = gain
+    loudness.backfill([(aid, audio_abs_path(fp)) for aid, fp, gain in rows if gain is None])
+
+
+@app.context_processor
+def _thumbnail_helper():
+    def thumbnail(file_path: str, size: int = THUMB_SIZES[0]) -> dict | None:
+        """URLs versionnées {"webp", "jpg"} de la vignette d'un audio, ou None."""
+        found = thumbnails.lookup(file_path)
+        if found is None:
+            return None
+        version, has_webp = found
+        key = thumbnails.key(file_path)
+        urls = {
+            fmt: url_for("thumbnail_file", key=key, size=size, fmt=fmt, v=version)
+            for fmt in THUMB_FORMATS
+        }
+        if not has_webp:
+            urls["webp"] = None
+        return urls
+
+    return {"thumbnail": thumbnail}
+
+
 # ---------------------------------------------------------------------------
 # Routes — Accueil / Lecteur
 # ---------------------------------------------------------------------------
@@ -250,18 +585,22 @@ def player_pause():
 
 @app.route("/player/stop", methods=["POST"])
 def player_stop():
+    _record_skip()
     player.stop()
+    journal.record("stop")
     return redirect(url_for("index"))
 
 
 @app.route("/player/next", methods=["POST"])
 def player_next():
+    _record_skip()
     player.next_track()
     return redirect(url_for("index"))
 
 
 @app.route("/player/prev", methods=["POST"])
 def player_prev():
+    _record_skip()
     player.prev_track()
     return redirect(url_for("index"))
 
@@ -273,7 +612,10 @@ def play_audio(audio_id: int):
     if not os.path.isfile(path):
         flash(f"Fichier introuvable : {path}", "error")
         return redirect(url_for("upload"))
-    player.play_file(path)
+    _forget_playing_tag()
+    _record_skip()
+    if player.play_file(path):
+        journal.record("play", audio_id=audio.id)
     flash(f"Lecture : {audio.name}", "success")
     return redirect(url_for("index"))
 
@@ -281,11 +623,13 @@ def play_audio(audio_id: int):
 @app.route("/play/playlist/<int:playlist_id>", methods=["POST"])
 def play_playlist(playlist_id: int):
     playlist = db.get_or_404(Playlist, playlist_id)
-    files = [audio_abs_path(a.file_path) for a in playlist.audios if os.path.isfile(audio_abs_path(a.file_path))]
-    if not files:
+    files = [audio_abs_path(a.file_path) for a in playlist.audios]
+    _forget_playing_tag()
+    _record_skip()
+    if not player.play_playlist(files, shuffle=playlist.shuffle, repeat=playlist.repeat):
         flash(f"Aucune piste disponible dans '{playlist.name}'.", "error")
         return redirect(url_for("playlists"))
-    player.play_playlist(files)
+    journal.record("play", playlist_id=playlist.id)
     flash(f"Lecture playlist : {playlist.name} ({len(files)} pistes)", "success")
     return redirect(url_for("index"))
 
@@ -300,23 +644,141 @@ def api_status():
     return jsonify(
         state=player.get_state(),
         media=player.get_current_media_name(),
+        tag_present=rfid_reader.present_tag if rfid_reader else None,
+        gain_db=player.gain_db,
         **player.get_time_info(),
     )
 
 
 @app.route("/api/last-tag")
 def api_last_tag():
-    """Retourne le dernier tag non assigné détecté."""
-    return jsonify(tag_id=_last_unassigned_tag)
+    """Retourne le dernier tag non assigné détecté, et la file des suivants."""
+    return jsonify(tag_id=provisioning.last_unknown(), queue=provisioning.unknown())
 
 
 @app.route("/api/clear-last-tag", methods=["POST"])
 def api_clear_last_tag():
-    global _last_unassigned_tag
-    _last_unassigned_tag = None
+    """Oublie tous les tags inconnus en file (pas seulement le dernier affiché)."""
+    provisioning.clear_unknown()
     return jsonify(ok=True)
 
 
+@app.route("/api/history/stats")
+def api_history_stats():
+    """Tags les plus scannés, audios les plus écoutés / passés, état de l'écrivain."""
+    history.flush()  # compteurs à jour sans attendre le prochain lot
+    limit = min(request.args.get("limit", 20, type=int), 200)
+    return jsonify(**history_counters(limit), writer=history.stats())
+
+
+@app.route("/api/history/events")
+def api_history_events():
+    """Derniers événements (scan, start, skip), du plus récent au plus ancien."""
+    history.flush()
+    limit = min(request.args.get("limit", 50, type=int), 500)
+    return jsonify(events=recent_events(limit))
+
+
+@app.route("/api/loudness/stats")
+def api_loudness_stats():
+    """Avancement et débit de l'analyse de sonie (pistes/min, x temps réel)."""
+    return jsonify(**loudness.stats())
+
+
+@app.route("/api/cache/stats")
+def api_cache_stats():
+    """Occupation et taux de succès du cache RAM des fichiers audio."""
+    return jsonify(**hot_cache.stats())
+
+
+# Requêtes qui n'interrompent pas la maintenance : polling des pages
+# (statut, dernier tag, série, téléchargements YouTube), fichiers statiques et
+# vignettes (servis avec la page qui, elle, interrompt), suivi de la maintenance.
+# Sinon une page ouverte la relancerait sans fin sans jamais lui laisser de repos.
+_PASSIVE_ENDPOINTS = frozenset({
+    "static", "thumbnail_file",
+    "api_status", "api_last_tag", "api_provisioning", "youtube_job_status",
+    "api_maintenance", "api_maintenance_run",
+})
+
+
+@app.before_request
+def _signal_activity():
+    """Une requête HTTP (page, action) interrompt la maintenance, sauf le polling et les fichiers statiques."""
+    if request.endpoint not in _PASSIVE_ENDPOINTS:
+        maintenance.interrupt()
+
+
+@app.route("/api/maintenance")
+def api_maintenance():
+    """État du planificateur de maintenance et rapport de la dernière série."""
+    return jsonify(**maintenance.status())
+
+
+@app.route("/api/maintenance/run", methods=["POST"])
+def api_maintenance_run():
+    """Lance une série de maintenance sans attendre la période calme."""
+    maintenance.run_now()
+    return jsonify(ok=True), 202
+
+
+@app.route("/api/debug/state-journal")
+def api_debug_state_journal():
+    """Journal de reprise : taille, coût d'écriture, état qui serait repris."""
+    return jsonify(**journal.stats(), resume_max_age=RESUME_MAX_AGE)
+
+
+@app.route("/api/debug/memory")
+def api_debug_memory():
+    """RSS du worker ventilé par sous-système (natif, Python, modules, caches)."""
+    cache = hot_cache.stats()
+    caches = {
+        "yt_jobs": {"size": len(_yt_jobs), "max": _YT_JOBS_MAX},
+        "ram_cache": {"bytes": cache["used_bytes"], "files": cache["files"]},
+    }
+    return jsonify(low_memory=LOW_MEMORY, audio_backend=AUDIO_BACKEND, **memory_report.report(caches))
+
+
+@app.route("/api/debug/memory/tracing", methods=["POST"])
+def api_debug_memory_tracing():
+    """Active / désactive tracemalloc à chaud : {"enabled": true|false}."""
+    enabled = bool((request.get_json(silent=True) or {}).get("enabled"))
+    if enabled:
+        memory_report.start_tracing()
+    else:
+        memory_report.stop_tracing()
+    return jsonify(tracing=enabled)
+
+
+@app.route("/api/admin/profiling")
+def api_admin_profiling():
+    """Temps par endpoint, requêtes SQL et requêtes HTTP les plus lentes."""
+    return jsonify(**profiler.report())
+
+
+@app.route("/api/admin/profiling/reset", methods=["POST"])
+def api_admin_profiling_reset():
+    profiler.reset()
+    return jsonify(ok=True)
+
+
+@app.route("/api/admin/profile")
+def api_admin_profile():
+    """Échantillonne les piles de tous les threads pendant ?seconds=N (max 60).
+
+    ?format=collapsed renvoie le format texte de flamegraph.pl / speedscope :
+      curl 'http://<IP>:5000/api/admin/profile?seconds=10&format=collapsed' | flamegraph.pl > out.svg
+    """
+    seconds = request.args.get("seconds", 5, type=float)
+    try:
+        result = profiling.sample_stacks(seconds)
+    except profiling.SamplerBusy as e:
+        return jsonify(error=str(e)), 409
+    if request.args.get("format") == "collapsed":
+        return Response(profiling.collapsed(result), mimetype="text/plain")
+    return jsonify(**result)
+
+
 # ---------------------------------------------------------------------------
 # Routes — YouTube
 # ---------------------------------------------------------------------------
@@ -328,20 +790,16 @@ def youtube_search():
     if not q:
         return jsonify(results=[])
     try:
-        import yt_dlp  # type: ignore
-
-        ydl_opts = _yt_base_opts() | {"extract_flat": True}
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(f"ytsearch8:{q}", download=False)
+        entries = _yt_call("search", query=q)
 
         results = []
-        for entry in (info.get("entries") or []):
-            vid_id = entry.get("id", "")
+        for entry in entries:
+            vid_id = entry["id"]
             results.append({
                 "id": vid_id,
-                "title": entry.get("title", "Sans titre"),
-                "duration": _fmt_duration(entry.get("duration")),
-                "uploader": entry.get("uploader") or entry.get("channel") or "",
+                "title": entry["title"] or "Sans titre",
+                "duration": _fmt_duration(entry["duration"]),
+                "uploader": entry["uploader"],
                 # Thumbnail standard YouTube — pas besoin de l'extraire via yt-dlp
                 "thumbnail": f"https://img.youtube.com/vi/{vid_id}/mqdefault.jpg",
                 "url": f"https://www.youtube.com/watch?v={vid_id}",
@@ -366,7 +824,7 @@ def youtube_download():
         url = f"https://www.youtube.com/watch?v={url}"
 
     job_id = uuid.uuid4().hex[:10]
-    _yt_jobs[job_id] = {"status": "pending"}
+    _set_yt_job(job_id, {"status": "pending"})
     _yt_executor.submit(_download_youtube, job_id, url)
     return jsonify(job_id=job_id)
 
@@ -409,6 +867,21 @@ def upload_youtube_cookies():
     return redirect(url_for("upload"))
 
 
+# ---------------------------------------------------------------------------
+# Routes — Vignettes
+# ---------------------------------------------------------------------------
+
+@app.route("/thumbs/<key>/<int:size>.<fmt>")
+def thumbnail_file(key: str, size: int, fmt: str):
+    """Vignette pré-générée. L'URL porte ?v=<version> : cache navigateur d'un an."""
+    if size not in THUMB_SIZES or fmt not in THUMB_FORMATS:
+        abort(404)
+    response = send_from_directory(THUMB_FOLDER, f"{key}/{size}.{fmt}", max_age=365 * 24 * 3600)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
 # ---------------------------------------------------------------------------
 # Routes — Upload
 # ---------------------------------------------------------------------------
@@ -422,6 +895,7 @@ def upload():
             return redirect(request.url)
 
         saved = 0
+        new_files = []
         for file in files:
             if file and allowed_file(file.filename):
                 filename = secure_filename(file.filename)
@@ -443,9 +917,13 @@ def upload():
                         file_path=dest.name,
                     )
                     db.session.add(audio)
+                    new_files.append((audio, str(dest)))
                     saved += 1
 
         db.session.commit()
+        for audio, path in new_files:
+            thumbnails.schedule_extract(path)
+            loudness.submit(audio.id, path)
         flash(f"{saved} fichier(s) importé(s) avec succès.", "success")
         return redirect(url_for("upload"))
 
@@ -456,11 +934,17 @@ def upload():
 @app.route("/audio/<int:audio_id>/delete", methods=["POST"])
 def delete_audio(audio_id: int):
     audio = db.get_or_404(Audio, audio_id)
-    # Supprime le fichier physique
+    # Supprime le fichier physique (et sa copie éventuelle en cache RAM)
+    hot_cache.invalidate(audio_abs_path(audio.file_path))
+    thumbnails.remove(audio.file_path)
+    _track_gains.pop(os.path.basename(audio.file_path), None)
     try:
         Path(audio_abs_path(audio.file_path)).unlink(missing_ok=True)
     except Exception as e:
         logger.warning(f"Impossible de supprimer le fichier {audio.file_path} : {e}")
+    # Pistes de playlists et tags qui pointaient vers cet audio
+    db.session.execute(playlist_audio.delete().where(playlist_audio.c.audio_id == audio.id))
+    Tag.query.filter_by(audio_id=audio.id).delete()
     db.session.delete(audio)
     db.session.commit()
     flash(f"'{audio.name}' supprimé.", "success")
@@ -493,6 +977,8 @@ def create_playlist():
             playlist.audios.append(audio)
 
     db.session.add(playlist)
+    db.session.flush()
+    set_playlist_order(playlist.id, [a.id for a in playlist.audios])
     db.session.commit()
     flash(f"Playlist '{name}' créée avec {len(playlist.audios)} piste(s).", "success")
     return redirect(url_for("playlists"))
@@ -501,6 +987,8 @@ def create_playlist():
 @app.route("/playlists/<int:playlist_id>/delete", methods=["POST"])
 def delete_playlist(playlist_id: int):
     playlist = db.get_or_404(Playlist, playlist_id)
+    db.session.execute(playlist_audio.delete().where(playlist_audio.c.playlist_id == playlist.id))
+    Tag.query.filter_by(playlist_id=playlist.id).delete()
     db.session.delete(playlist)
     db.session.commit()
     flash(f"Playlist '{playlist.name}' supprimée.", "success")
@@ -516,12 +1004,16 @@ def edit_playlist(playlist_id: int):
         name = request.form.get("name", "").strip()
         if name:
             playlist.name = name
+        playlist.shuffle = request.form.get("shuffle") == "1"
+        playlist.repeat = request.form.get("repeat") == "1"
         audio_ids = request.form.getlist("audio_ids")
         playlist.audios = []
         for aid in audio_ids:
             audio = db.session.get(Audio, int(aid))
             if audio:
                 playlist.audios.append(audio)
+        db.session.flush()
+        set_playlist_order(playlist.id, [a.id for a in playlist.audios])
         db.session.commit()
         flash(f"Playlist '{playlist.name}' mise à jour.", "success")
         return redirect(url_for("playlists"))
@@ -543,7 +1035,8 @@ def assign():
         tags=tags,
         audios=audios,
         playlists=all_playlists,
-        last_tag=_last_unassigned_tag,
+        last_tag=provisioning.last_unknown(),
+        provisioning=provisioning.state(),
     )
 
 
@@ -593,14 +1086,169 @@ def save_assignment():
     db.session.commit()
     logger.info(f"save_assignment: tag {rfid_id} sauvegardé en base")
 
-    global _last_unassigned_tag
-    if _last_unassigned_tag == rfid_id:
-        _last_unassigned_tag = None
+    provisioning.discard([rfid_id])
 
     flash(f"Tag {rfid_id} associé avec succès.", "success")
     return redirect(url_for("assign"))
 
 
+# Association en série : la page /assign interroge l'état toutes les 500 ms
+@app.route("/api/provisioning")
+def api_provisioning():
+    """État de la série ; {"version"} seul si rien n'a changé depuis ?since=."""
+    since = request.args.get("since", type=int)
+    if since is not None and since == provisioning.version:
+        return jsonify(version=since)
+    return jsonify(**provisioning.state())
+
+
+@app.route("/api/provisioning/start", methods=["POST"])
+def api_provisioning_start():
+    """Démarre une série. Corps JSON : {"targets": ["audio:4", "playlist:2", …]}."""
+    payload = request.get_json(silent=True) or {}
+    try:
+        provisioning.start(resolve_targets(payload.get("targets")))
+    except ProvisioningError as e:
+        return jsonify(error=str(e)), 400
+    logger.info(f"Association en série démarrée : {len(payload['targets'])} cible(s)")
+    return jsonify(**provisioning.state())
+
+
+@app.route("/api/provisioning/targets", methods=["POST"])
+def api_provisioning_targets():
+    """Ajoute des cibles à la série en cours (même corps que /start)."""
+    payload = request.get_json(silent=True) or {}
+    try:
+        provisioning.add_targets(resolve_targets(payload.get("targets")))
+    except ProvisioningError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(**provisioning.state())
+
+
+@app.route("/api/provisioning/undo", methods=["POST"])
+def api_provisioning_undo():
+    binding = provisioning.undo()
+    if binding is None:
+        return jsonify(error="Aucune liaison à annuler"), 400
+    logger.info(f"Association en série : liaison {binding['rfid_id']} → {binding['target']} annulée")
+    return jsonify(**provisioning.state())
+
+
+def _commit_provisioning() -> dict:
+    """Écrit les liaisons en attente par lots (une transaction par lot de MAX_OPERATIONS).
+
+    provisioning.commit_lock est tenu de bout en bout : pas d'annulation ni
+    de second enregistrement des mêmes liaisons pendant l'écriture.
+    """
+    with provisioning.commit_lock:
+        bindings = provisioning.pending()
+        applied = failed = 0
+        for start in range(0, len(bindings), MAX_OPERATIONS):
+            chunk = bindings[start:start + MAX_OPERATIONS]
+            outcome = apply_batch(
+                [{"op": "assign_tag", "rfid_id": b["rfid_id"], "target": b["target"]} for b in chunk]
+            )
+            provisioning.committed(chunk, outcome["results"])
+            applied += outcome["applied"]
+            failed += outcome["failed"]
+    return {"applied": applied, "failed": failed}
+
+
+@app.route("/api/provisioning/commit", methods=["POST"])
+def api_provisioning_commit():
+    try:
+        outcome = _commit_provisioning()
+    except BatchError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(**outcome, **provisioning.state())
+
+
+@app.route("/api/provisioning/stop", methods=["POST"])
+def api_provisioning_stop():
+    """Termine la série, en enregistrant d'abord les liaisons (sauf {"commit": false})."""
+    payload = request.get_json(silent=True) or {}
+    try:
+        outcome = _commit_provisioning() if payload.get("commit", True) else {"applied": 0, "failed": 0}
+    except BatchError as e:
+        return jsonify(error=str(e)), 400
+    provisioning.stop()
+    logger.info(f"Association en série terminée : {outcome['applied']} tag(s) enregistré(s)")
+    return jsonify(**outcome, **provisioning.state())
+
+
+@app.route("/api/library/batch", methods=["POST"])
+def api_library_batch():
+    """Applique un lot d'opérations (tags, playlists) en une seule transaction.
+
+    Corps JSON : {"operations": [...], "atomic": false} — voir library_batch.py.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify(error="Corps JSON attendu"), 400
+    try:
+        outcome = apply_batch(payload.get("operations"), atomic=bool(payload.get("atomic")))
+    except BatchError as e:
+        return jsonify(error=str(e)), 400
+
+    # Caches mis à jour une seule fois pour tout le lot
+    provisioning.discard(outcome.pop("assigned_rfids"))
+
+    status = 400 if payload.get("atomic") and not outcome["ok"] else 200
+    return jsonify(**outcome), status
+
+
+@app.route("/api/library/snapshot")
+def api_library_snapshot():
+    """Bibliothèque complète pour une première synchronisation (voir library_sync.py)."""
+    return jsonify(**library_snapshot())
+
+
+@app.route("/api/library/changes")
+def api_library_changes():
+    """Modifications depuis ?since=<seq> : entités à jour et identifiants supprimés."""
+    since = request.args.get("since", type=int)
+    if since is None:
+        return jsonify(error="Paramètre 'since' manquant ou invalide"), 400
+    return jsonify(**changes_since(since, request.args.get("limit", MAX_CHANGES, type=int)))
+
+
+@app.route("/api/library/export")
+def api_library_export():
+    """Sauvegarde complète (base + fichiers audio) en archive tar streamée."""
+    plan = build_export_plan(audio_abs_path)
+    filename = f"baby-jukebox-{time.strftime('%Y%m%d-%H%M')}.tar"
+    return Response(
+        iter_export(plan),
+        mimetype="application/x-tar",
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Content-Length": str(plan.content_length()),
+        },
+    )
+
+
+@app.route("/api/library/import", methods=["POST"])
+def api_library_import():
+    """Restaure une archive d'export (corps brut : curl --data-binary @backup.tar)."""
+    # Une archive peut faire plusieurs Go : pas de limite MAX_CONTENT_LENGTH ici,
+    # le flux est lu au fil de l'eau sans être mis en mémoire ni sur disque.
+    request.max_content_length = None
+    if request.mimetype == "multipart/form-data":
+        return jsonify(error="Envoyer l'archive en corps brut (application/x-tar)"), 400
+    try:
+        received = receive_archive(request.stream, UPLOAD_FOLDER)
+    except ArchiveError as e:
+        logger.warning(f"Import bibliothèque refusé : {e}")
+        return jsonify(error=str(e)), 400
+    try:
+        report = merge_into_library(received)
+    except Exception as e:
+        logger.error(f"Import bibliothèque : fusion impossible : {e}")
+        return jsonify(error=f"Fusion impossible : {e}"), 500
+    _backfill_analysis()
+    return jsonify(**report)
+
+
 @app.route("/assign/<int:tag_id>/delete", methods=["POST"])
 def delete_tag(tag_id: int):
     tag = db.get_or_404(Tag, tag_id)
@@ -619,10 +1267,21 @@ def create_app():
     UPLOAD_FOLDER.mkdir(exist_ok=True)
     with app.app_context():
         db.create_all()
+        ensure_schema()
+        install_change_log()
         logger.info("Base de données initialisée")
-
-    rfid = RFIDReader(on_tag_detected=on_tag_detected)
-    rfid.start()
+        _backfill_analysis()
+        # Cache RAM amorcé avec les fichiers les plus écoutés du dernier mois
+        hot_cache.seed({audio_abs_path(fp): n for fp, n in recent_start_counts().items()})
+        _warm_restart()
+    history.start()
+    atexit.register(history.close)
+    journal.start()
+    maintenance.start()
+
+    global rfid_reader
+    rfid_reader = RFIDReader(on_tag_detected=on_tag_detected, on_tag_removed=on_tag_removed)
+    rfid_reader.start()
 
     return app
 
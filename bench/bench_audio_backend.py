@@ -0,0 +1,141 @@
+"""
+Benchmark des moteurs de lecture (JUKEBOX_AUDIO_BACKEND).
+
+Pour chaque moteur, un processus Python neuf crée le lecteur
+(player.create_player) et lance un fichier. On mesure :
+  - le temps de création du lecteur (import + initialisation) ;
+  - le délai play → premier échantillon : passage du périphérique ALSA à
+    l'état RUNNING (/proc/asound/…/status) pour vlc et pipe, premiers
+    octets écrits pour file ;
+  - la RSS totale (processus Python + ffmpeg/aplay) et le CPU moyen pendant
+    la lecture, sur tout le groupe de processus.
+
+Usage (sur le Pi, service arrêté pour libérer la carte son) :
+    sudo systemctl stop baby-jukebox
+    python bench/bench_audio_backend.py --audio uploads/comptine.mp3 --backends vlc pipe file --seconds 15
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = str(Path(__file__).resolve().parent.parent)
+
+_CHILD = """
+import glob, json, os, sys, time
+sys.path.insert(0, {root!r})
+start = time.monotonic()
+from player import create_player
+player = create_player({backend!r})
+ready = time.monotonic()
+
+def alsa_running():
+    for status in glob.glob("/proc/asound/card*/pcm*p/sub*/status"):
+        try:
+            with open(status) as f:
+                if "state: RUNNING" in f.read():
+                    return True
+        except OSError:
+            pass
+    return False
+
+sink = {backend!r}[5:] if {backend!r}.startswith("file:") else None
+if sink is None and alsa_running():
+    sys.exit("Carte son déjà utilisée : arrêter le service avant la mesure")
+t = time.monotonic()
+player.play_file({audio!r})
+deadline = t + 10
+while time.monotonic() < deadline:
+    if sink is not None:
+        if os.path.exists(sink) and os.path.getsize(sink) > 0:
+            break
+    elif alsa_running():
+        break
+    time.sleep(0.002)
+else:
+    sys.exit("Pas de son après 10 s")
+first = time.monotonic()
+print(json.dumps({{"init_ms": (ready - start) * 1000, "first_sample_ms": (first - t) * 1000}}), flush=True)
+time.sleep(3600)
+"""
+
+
+def _group_stats(pgid: int) -> tuple[int, float]:
+    """(RSS totale en octets, temps CPU en s) des processus du groupe."""
+    rss, cpu = 0, 0.0
+    page, tick = os.sysconf("SC_PAGE_SIZE"), os.sysconf("SC_CLK_TCK")
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(fields[2]) != pgid:
+                continue
+            cpu += (int(fields[11]) + int(fields[12])) / tick
+            with open(f"/proc/{entry.name}/statm") as f:
+                rss += int(f.read().split()[1]) * page
+        except (OSError, IndexError, ValueError):
+            continue
+    return rss, cpu
+
+
+def run(backend: str, audio: Path, seconds: float) -> dict:
+    code = _CHILD.format(root=ROOT, backend=backend, audio=str(audio.resolve()))
+    proc = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE, text=True, start_new_session=True)
+    try:
+        line = proc.stdout.readline()
+        if not line:
+            proc.wait()
+            sys.exit(f"{backend} : pas de lecture (code {proc.returncode})")
+        result = json.loads(line)
+        time.sleep(1)  # laisse passer le démarrage
+        _, cpu_start = _group_stats(proc.pid)
+        t, rss_max = time.monotonic(), 0
+        while time.monotonic() - t < seconds:
+            time.sleep(0.5)
+            rss_max = max(rss_max, _group_stats(proc.pid)[0])
+        _, cpu_end = _group_stats(proc.pid)
+        result["rss_mb"] = rss_max / 1e6
+        result["cpu_pct"] = (cpu_end - cpu_start) / (time.monotonic() - t) * 100
+        return result
+    finally:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--audio", type=Path, required=True)
+    parser.add_argument("--backends", nargs="+", default=["vlc", "pipe", "file"],
+                        help="vlc, pipe, file (PCM dans un fichier temporaire)")
+    parser.add_argument("--seconds", type=float, default=10, help="durée de mesure CPU/RSS par essai")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.backends:
+            backend = f"file:{tmp}/out.raw" if name == "file" else name
+            runs = []
+            for _ in range(args.runs):
+                Path(tmp, "out.raw").unlink(missing_ok=True)
+                runs.append(run(backend, args.audio, args.seconds))
+            print(f"\n--- {name} ---")
+            print(f"Création du lecteur        : médiane {statistics.median(r['init_ms'] for r in runs):.0f} ms")
+            print(f"play → premier échantillon : médiane {statistics.median(r['first_sample_ms'] for r in runs):.0f} ms"
+                  f" / max {max(r['first_sample_ms'] for r in runs):.0f} ms")
+            print(f"RSS totale                 : {statistics.median(r['rss_mb'] for r in runs):.1f} Mo")
+            print(f"CPU pendant la lecture     : {statistics.median(r['cpu_pct'] for r in runs):.1f} %")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark export / import streamé de la bibliothèque (library_archive).
+
+Génère une bibliothèque synthétique dans un dossier temporaire, puis mesure :
+  - export : débit de iter_export() vers /dev/null
+  - import : débit de receive_archive() alimenté directement par l'export
+    (dossier de destination vide → tous les fichiers sont écrits)
+  - pic de RSS du processus (ru_maxrss) après chaque phase
+
+Usage (sur le Pi, dans le venv) :
+    python bench/bench_library_archive.py --size-mb 5120 --file-mb 8
+    python bench/bench_library_archive.py --size-mb 5120 --dir /home/pi/bench-lib
+
+--dir permet de réutiliser une bibliothèque déjà générée (carte SD réelle
+plutôt que /tmp, souvent en RAM).
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from library_archive import ExportPlan, iter_export, receive_archive  # noqa: E402
+
+
+class _IterReader(io.RawIOBase):
+    """Expose un itérateur de bytes comme un flux lisible (request.stream)."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buf:
+            try:
+                self._buf = next(self._chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _make_library(folder: Path, size_mb: int, file_mb: int) -> list[Path]:
+    folder.mkdir(parents=True, exist_ok=True)
+    block = os.urandom(1024 * 1024)
+    paths = []
+    for i in range(max(1, size_mb // file_mb)):
+        path = folder / f"track_{i:05d}.mp3"
+        if not path.exists() or path.stat().st_size != file_mb * 1024 * 1024:
+            with open(path, "wb") as f:
+                for _ in range(file_mb):
+                    f.write(block)
+        paths.append(path)
+    return paths
+
+
+def _plan(paths: list[Path]) -> ExportPlan:
+    files = [(f"audio/{p.name}", p, p.stat().st_size) for p in paths]
+    manifest = {
+        "format": 1,
+        "created": int(time.time()),
+        "audios": [
+            {"id": i, "name": p.stem, "file": name, "size": size}
+            for i, (name, p, size) in enumerate(files, start=1)
+        ],
+        "playlists": [],
+        "tags": [],
+    }
+    return ExportPlan(manifest, files, db_snapshot=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=5120, help="taille totale de la bibliothèque")
+    parser.add_argument("--file-mb", type=int, default=8, help="taille de chaque fichier")
+    parser.add_argument("--dir", type=Path, help="dossier de la bibliothèque synthétique")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        library = args.dir or Path(tmp) / "library"
+        paths = _make_library(library, args.size_mb, args.file_mb)
+        plan = _plan(paths)
+        total = plan.content_length()
+        print(f"Bibliothèque : {len(paths)} fichiers, {total / 1e6:.0f} Mo d'archive")
+        print(f"RSS de départ       : {_peak_rss_mb():.1f} Mo")
+
+        start = time.perf_counter()
+        sent = 0
+        with open(os.devnull, "wb") as sink:
+            for chunk in iter_export(plan):
+                sink.write(chunk)
+                sent += len(chunk)
+        elapsed = time.perf_counter() - start
+        assert sent == total, (sent, total)
+        print(f"Export             : {sent / 1e6 / elapsed:.1f} Mo/s ({elapsed:.1f} s) — pic RSS {_peak_rss_mb():.1f} Mo")
+
+        dest = Path(tmp) / "restore"
+        dest.mkdir()
+        start = time.perf_counter()
+        received = receive_archive(_IterReader(iter_export(plan)), dest)
+        elapsed = time.perf_counter() - start
+        errors = [n for n, f in received["files"].items() if f["status"] == "error"]
+        print(f"Export → import    : {total / 1e6 / elapsed:.1f} Mo/s ({elapsed:.1f} s) — pic RSS {_peak_rss_mb():.1f} Mo")
+        print(f"Fichiers restaurés : {len(received['files']) - len(errors)}, erreurs : {len(errors)}")
+
+
+if __name__ == "__main__":
+    main()
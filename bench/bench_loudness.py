@@ -0,0 +1,78 @@
+"""
+Benchmark de l'analyse de sonie (loudness.LoudnessAnalyzer).
+
+Analyse les fichiers audio d'un dossier avec 1, 2… N processus ffmpeg
+simultanés et affiche, pour chaque taille de pool :
+  - le débit en pistes/min ;
+  - la vitesse par rapport à la durée des pistes (x temps réel) ;
+  - la répartition des sonies mesurées et des gains calculés.
+
+Aucun fichier n'est modifié et la base n'est pas touchée.
+
+Usage (sur le Pi 4, lecture arrêtée) :
+    python bench/bench_loudness.py --dir uploads --workers 1 2 3 --limit 40
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from loudness import LoudnessAnalyzer  # noqa: E402
+
+_EXTENSIONS = {".mp3", ".ogg", ".wav", ".flac", ".m4a", ".webm", ".opus"}
+
+
+def run(files: list[Path], workers: int) -> dict:
+    results: list[tuple[float | None, float]] = []
+    lock = threading.Lock()
+
+    def store(_audio_id, lufs, gain):
+        with lock:
+            results.append((lufs, gain))
+
+    analyzer = LoudnessAnalyzer(store, workers=workers)
+    start = time.monotonic()
+    analyzer.backfill([(i, str(f)) for i, f in enumerate(files)])
+    while analyzer.stats()["pending"]:
+        time.sleep(0.2)
+    wall = time.monotonic() - start
+    stats = analyzer.stats()
+    return {"wall": wall, "stats": stats, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", type=Path, default=Path("uploads"))
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--limit", type=int, default=30, help="nombre maximal de fichiers analysés")
+    args = parser.parse_args()
+
+    files = sorted(p for p in args.dir.iterdir() if p.suffix.lower() in _EXTENSIONS)[: args.limit]
+    if not files:
+        sys.exit(f"Aucun fichier audio dans {args.dir}")
+    print(f"{len(files)} fichier(s) dans {args.dir}")
+
+    for workers in args.workers:
+        out = run(files, workers)
+        stats = out["stats"]
+        measured = [lufs for lufs, _ in out["results"] if lufs is not None]
+        gains = [gain for lufs, gain in out["results"] if lufs is not None]
+        print(f"\n--- {workers} processus ffmpeg ---")
+        print(f"Durée totale       : {out['wall']:.1f} s ({stats['failed']} échec(s))")
+        print(f"Débit              : {len(files) / out['wall'] * 60:.1f} pistes/min")
+        print(f"Vitesse            : x{stats['realtime_factor']} temps réel par processus")
+        if measured:
+            print(f"Sonie mesurée      : {min(measured):.1f} … {max(measured):.1f} LUFS"
+                  f" (médiane {statistics.median(measured):.1f})")
+            print(f"Gains appliqués    : {min(gains):+.1f} … {max(gains):+.1f} dB")
+
+
+if __name__ == "__main__":
+    main()
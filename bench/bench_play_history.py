@@ -0,0 +1,102 @@
+"""
+Benchmark de l'historique d'écoute (play_history.py).
+
+Compare, pour N scans enregistrés :
+  - l'INSERT synchrone + commit à chaque scan (ce que l'on évite dans
+    on_tag_detected : un fsync de la carte SD sur le chemin scan → son) ;
+  - PlayHistory.record() côté appelant (dépôt dans le tampon) ;
+  - le coût d'écriture des lots par le thread écrivain (par lot et par
+    événement), avec la fenêtre de perte correspondante.
+
+Usage (sur la carte SD du Pi pour des chiffres représentatifs) :
+    python bench/bench_play_history.py --dir /home/pi/baby-jukebox --scans 500
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine  # noqa: E402
+
+from models import db  # noqa: E402
+from play_history import PlayHistory  # noqa: E402
+
+
+def _pct(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[max(0, int(len(values) * p) - 1)]
+
+
+def _fresh_db(directory: Path) -> Path:
+    path = directory / "bench_history.db"
+    path.unlink(missing_ok=True)
+    engine = create_engine(f"sqlite:///{path}")
+    db.metadata.create_all(engine)
+    engine.dispose()
+    return path
+
+
+def bench_sync(path: Path, scans: int) -> list[float]:
+    conn = sqlite3.connect(path)
+    costs = []
+    for i in range(scans):
+        start = time.perf_counter()
+        conn.execute(
+            "INSERT INTO play_event (ts, kind, rfid_id) VALUES (?, 'scan', ?)", (time.time(), f"{i % 40:09d}")
+        )
+        conn.commit()
+        costs.append((time.perf_counter() - start) * 1e6)
+    conn.close()
+    return costs
+
+
+def bench_buffered(path: Path, scans: int, interval: float) -> tuple[list[float], dict]:
+    history = PlayHistory(path, flush_interval=interval)
+    history.start()
+    costs = []
+    for i in range(scans):
+        start = time.perf_counter()
+        history.record("scan", rfid_id=f"{i % 40:09d}")
+        costs.append((time.perf_counter() - start) * 1e6)
+        history.record("start", media=f"piste-{i % 200}.mp3")
+        if i % 25 == 0:
+            time.sleep(interval / 4)  # laisse passer quelques lots
+    history.close()
+    return costs, history.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", type=Path, default=Path(tempfile.gettempdir()),
+                        help="dossier de la base de test (mettre la carte SD, pas /tmp)")
+    parser.add_argument("--scans", type=int, default=300)
+    parser.add_argument("--interval", type=float, default=0.2, help="délai entre deux lots (s)")
+    args = parser.parse_args()
+
+    path = _fresh_db(args.dir)
+    sync = bench_sync(path, args.scans)
+    print(f"INSERT + commit par scan : médiane {statistics.median(sync):.0f} µs / p99 {_pct(sync, 0.99):.0f} µs"
+          f" / max {max(sync):.0f} µs")
+
+    path = _fresh_db(args.dir)
+    calls, stats = bench_buffered(path, args.scans, args.interval)
+    written = stats["written"]
+    print(f"record() appelant        : médiane {statistics.median(calls):.1f} µs / p99 {_pct(calls, 0.99):.1f} µs"
+          f" / max {max(calls):.1f} µs")
+    print(f"Écrivain                 : {written} événements en {stats['batches']} lot(s),"
+          f" {stats['flush_avg_ms']} ms par lot (max {stats['flush_max_ms']} ms),"
+          f" {stats['flush_avg_ms'] * stats['batches'] / written * 1000:.0f} µs par événement")
+    print(f"Perdus                   : {stats['dropped']} (fenêtre de perte : {args.interval} s)")
+    path.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
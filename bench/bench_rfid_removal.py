@@ -0,0 +1,80 @@
+"""
+Benchmark de la détection de retrait de tag (RFIDReader + MockMFRC522).
+
+Pour chaque essai : pose d'un tag, attente de on_tag_detected, attente
+aléatoire, retrait, puis mesure du délai jusqu'à on_tag_removed.
+Affiche aussi le nombre d'échanges SPI par seconde tag posé.
+
+Usage :
+    python bench/bench_rfid_removal.py --trials 50 --spi-delay-ms 1.5
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rfid_reader import RFIDReader, MockMFRC522  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=30)
+    parser.add_argument("--spi-delay-ms", type=float, default=1.0, help="durée simulée d'un échange SPI")
+    args = parser.parse_args()
+
+    mock = MockMFRC522(spi_delay=args.spi_delay_ms / 1000)
+    detected = threading.Event()
+    removed = threading.Event()
+    removed_at: list[float] = []
+
+    def on_detected(_uid):
+        detected.set()
+
+    def on_removed(_uid):
+        removed_at.append(time.perf_counter())
+        removed.set()
+
+    reader = RFIDReader(on_detected, on_removed, reader_factory=lambda: mock)
+    reader.start()
+
+    latencies = []
+    rates = []
+    for i in range(args.trials):
+        detected.clear()
+        removed.clear()
+        mock.place([0x12, 0x34, 0x56, i % 256])
+        if not detected.wait(2.0):
+            sys.exit("Tag jamais détecté")
+
+        # Tag posé : mesure du trafic SPI de surveillance
+        hold = random.uniform(0.3, 0.6)
+        before, t0 = mock.transceives, time.perf_counter()
+        time.sleep(hold)
+        rates.append((mock.transceives - before) / (time.perf_counter() - t0))
+
+        start = time.perf_counter()
+        mock.remove()
+        if not removed.wait(2.0):
+            sys.exit("Retrait jamais détecté")
+        latencies.append((removed_at[-1] - start) * 1000)
+        time.sleep(0.15)
+
+    reader.stop()
+    latencies.sort()
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"Essais              : {len(latencies)}")
+    print(f"Latence de retrait  : min {latencies[0]:.0f} ms / médiane {statistics.median(latencies):.0f} ms"
+          f" / p95 {p95:.0f} ms / max {latencies[-1]:.0f} ms")
+    print(f"Échanges SPI tag posé : {statistics.mean(rates):.1f} /s")
+
+
+if __name__ == "__main__":
+    main()
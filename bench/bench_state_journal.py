@@ -0,0 +1,135 @@
+"""
+Benchmark du journal d'état (state_journal.py) et de la reprise à chaud.
+
+Mesures :
+  - coût de record() pour l'appelant (dépôt dans la file, sans disque) ;
+  - coût d'écriture du thread écrivain : événements (avec fdatasync) et
+    positions (sans) ;
+  - durée de load() sur un journal plein (juste avant compaction) ;
+  - avec --audio : délai redémarrage → son. Un processus Python neuf
+    importe le lecteur, relit le journal et relance le fichier à la position
+    enregistrée ; le délai est mesuré du lancement du processus jusqu'à
+    l'état VLC « Playing ».
+
+Usage (à lancer sur la carte SD du Pi pour des chiffres représentatifs) :
+    python bench/bench_state_journal.py --dir /home/pi/baby-jukebox
+    python bench/bench_state_journal.py --audio uploads/comptine.mp3 --restarts 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from state_journal import StateJournal  # noqa: E402
+
+
+def _pct(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[max(0, int(len(values) * p) - 1)]
+
+
+def bench_journal(directory: Path, records: int):
+    path = directory / "bench_state.jsonl"
+    path.unlink(missing_ok=True)
+    position = {"state": "Playing", "media": "comptine.mp3", "time_ms": 0}
+    journal = StateJournal(path, snapshot=lambda: dict(position), interval=0.001)
+    journal.start()
+
+    # Coût pour l'appelant : le thread RFID / la requête HTTP
+    calls = []
+    for i in range(records):
+        start = time.perf_counter()
+        journal.record("play", tag=f"{i:09d}", playlist_id=i % 50)
+        calls.append((time.perf_counter() - start) * 1e6)
+        position["time_ms"] += 250
+        if i % 10 == 0:
+            time.sleep(0.002)  # laisse le thread écrire des positions
+    journal.close(timeout=60)
+    stats = journal.stats()
+
+    print(f"record() appelant    : médiane {statistics.median(calls):.1f} µs / p99 {_pct(calls, 0.99):.1f} µs"
+          f" / max {max(calls):.1f} µs")
+    print(f"Écritures            : {stats['records']} (perdues : {stats['dropped']}),"
+          f" moyenne {stats['write_avg_ms']} ms, max {stats['write_max_ms']} ms")
+    print(f"Compactions          : {stats['compactions']}")
+
+    # Journal plein : pire cas de relecture au démarrage
+    line = json.dumps({"t": time.time(), "ev": "pos", **position}, separators=(",", ":")) + "\n"
+    with open(path, "w") as f:
+        f.write(json.dumps({"t": time.time(), "ev": "play", "tag": "1", "playlist_id": 1}) + "\n")
+        f.write(line * (64 * 1024 // len(line)))
+    loads = []
+    for _ in range(20):
+        start = time.perf_counter()
+        StateJournal(path).load()
+        loads.append((time.perf_counter() - start) * 1000)
+    print(f"load() journal 64 Ko : médiane {statistics.median(loads):.2f} ms")
+    path.unlink(missing_ok=True)
+
+
+_CHILD = """
+import sys, time
+sys.path.insert(0, {root!r})
+from player import Player
+from state_journal import StateJournal
+state = StateJournal({journal!r}).load()
+player = Player()
+player.play_file({audio!r}, start_ms=state["time_ms"])
+deadline = time.monotonic() + 10
+while player.get_state() != "Playing" and time.monotonic() < deadline:
+    time.sleep(0.005)
+print(player.get_state(), player.snapshot()["time_ms"])
+"""
+
+
+def bench_restart(audio: Path, restarts: int, offset_ms: int):
+    root = str(Path(__file__).resolve().parent.parent)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "state.jsonl"
+        path.write_text(
+            json.dumps({"t": time.time(), "ev": "play", "audio_id": 1}) + "\n"
+            + json.dumps({"t": time.time(), "ev": "pos", "state": "Playing",
+                          "media": audio.name, "time_ms": offset_ms}) + "\n"
+        )
+        code = _CHILD.format(root=root, journal=str(path), audio=str(audio.resolve()))
+        delays = []
+        for _ in range(restarts):
+            start = time.perf_counter()
+            proc = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE, text=True)
+            # Le son est là dès la première ligne écrite par l'enfant
+            out = proc.stdout.readline().split()
+            delays.append((time.perf_counter() - start) * 1000)
+            proc.kill()
+            proc.wait()
+            if not out or out[0] != "Playing":
+                sys.exit(f"Pas de lecture dans le processus relancé ({out})")
+        print(f"Redémarrage → son    : médiane {statistics.median(delays):.0f} ms / max {max(delays):.0f} ms"
+              f" (reprise à {offset_ms // 1000} s, position lue : {int(out[1]) // 1000} s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", type=Path, default=Path(tempfile.gettempdir()),
+                        help="dossier du journal de test (mettre la carte SD, pas /tmp)")
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--audio", type=Path, help="fichier audio pour mesurer la reprise (VLC requis)")
+    parser.add_argument("--restarts", type=int, default=5)
+    parser.add_argument("--offset-s", type=int, default=42)
+    args = parser.parse_args()
+
+    bench_journal(args.dir, args.records)
+    if args.audio:
+        bench_restart(args.audio, args.restarts, args.offset_s * 1000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark de l'import YouTube : format natif contre réencodage MP3.
+
+Pour chaque mode, télécharge la même vidéo dans un dossier temporaire
+(yt_worker.download, comme le worker) et mesure :
+  - le délai lancement → fichier lisible ;
+  - le temps CPU consommé (processus + enfants : ffmpeg) ;
+  - la taille et le format du fichier obtenu.
+Avec --deferred, mesure aussi le réencodage différé (transcode_mp3) du
+fichier natif, tel que le ferait la maintenance de fond.
+
+Usage (sur le Pi, lecture en cours pour mesurer l'impact réel) :
+    python bench/bench_youtube_ingest.py --url https://www.youtube.com/watch?v=<id> --runs 3 --deferred
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import yt_worker  # noqa: E402
+
+
+def _cpu() -> float:
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def measure(url: str, transcode: bool, cookies: str | None, deferred: bool) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        cpu, start = _cpu(), time.monotonic()
+        info = yt_worker.download(url=url, dest_dir=tmp, cookies_file=cookies, transcode=transcode)
+        wall, cpu = time.monotonic() - start, _cpu() - cpu
+        path = Path(tmp) / info["file"]
+        result = {"wall": wall, "cpu": cpu, "file": info["file"], "size": path.stat().st_size}
+        if deferred and not transcode:
+            cpu, start = _cpu(), time.monotonic()
+            yt_worker.transcode_mp3(str(path), str(path.with_suffix(".mp3")))
+            result["deferred_wall"] = time.monotonic() - start
+            result["deferred_cpu"] = _cpu() - cpu
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--cookies", help="fichier cookies.txt (youtube_cookies.txt)")
+    parser.add_argument("--deferred", action="store_true", help="mesurer aussi le réencodage différé")
+    args = parser.parse_args()
+
+    for label, transcode in (("natif", False), ("mp3", True)):
+        runs = [measure(args.url, transcode, args.cookies, args.deferred) for _ in range(args.runs)]
+        print(f"\n--- {label} ({runs[0]['file']}, {runs[0]['size'] / 1e6:.1f} Mo) ---")
+        print(f"Téléchargement → lisible : médiane {statistics.median(r['wall'] for r in runs):.1f} s"
+              f" / max {max(r['wall'] for r in runs):.1f} s")
+        print(f"Temps CPU                : médiane {statistics.median(r['cpu'] for r in runs):.1f} s")
+        if "deferred_wall" in runs[0]:
+            print(f"Réencodage différé       : médiane {statistics.median(r['deferred_wall'] for r in runs):.1f} s"
+                  f" ({statistics.median(r['deferred_cpu'] for r in runs):.1f} s CPU, nice 19)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Cache RAM (tmpfs) des fichiers audio les plus scannés.
+
+Chaque scan de tag incrémente un compteur de fréquence par fichier. Un thread
+de fond copie dans /dev/shm les fichiers les plus fréquents, dans la limite
+d'un budget en octets ; quand la place manque, l'entrée la moins fréquente
+(LFU), puis la moins récemment utilisée (LRU), est évincée — seulement si le
+nouveau fichier est plus fréquent qu'elle.
+
+Le lecteur passe chaque chemin par resolve() : copie en RAM si elle est
+présente et à jour (même taille et mtime que l'original), original sinon.
+Les fichiers en cache gardent leur nom (un sous-dossier par copie) pour
+que get_current_media_name() affiche toujours le même nom.
+
+Une copie invalidée ou évincée alors que le lecteur l'a encore en file
+(media list VLC, voir Player.queued_paths) n'est pas supprimée tout de suite :
+elle est mise de côté, compte toujours dans le budget, et supprimée dès que le
+lecteur ne la référence plus.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import itertools
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Laisse VLC bufferiser la lecture en cours avant de relire le fichier pour la copie
+_FILL_DELAY = 3.0
+
+# Vieillissement des compteurs : divisés par 2 tous les N scans, pour que
+# les favoris d'hier laissent la place à ceux d'aujourd'hui.
+_AGING_PERIOD = 500
+
+# Intervalle de nettoyage des copies mises de côté (s)
+_SWEEP_INTERVAL = 30.0
+
+
+class HotCache:
+    def __init__(self, cache_dir: Path, budget_bytes: int, min_scans: int = 2, in_use=None):
+        """
+        :param cache_dir: dossier en tmpfs (vidé au démarrage)
+        :param budget_bytes: taille totale maximale des copies ; 0 = cache désactivé
+        :param min_scans: nombre de scans avant qu'un fichier soit candidat
+        :param in_use: callable() → chemins que le lecteur peut encore ouvrir
+            (Player.queued_paths) ; appelé sans verrou du cache. Par défaut,
+            aucun : les copies sont supprimées aussitôt.
+        """
+        self._dir = Path(cache_dir)
+        self._budget = budget_bytes
+        self._min_scans = min_scans
+        self._lock = threading.Lock()
+        self._counts: dict[str, float] = {}     # chemin source → fréquence
+        self._entries: dict[str, dict] = {}     # chemin source → {copy, size, mtime_ns, last_used}
+        self._retired: list[dict] = []          # copies retirées encore en file chez le lecteur
+        self._in_use = in_use or frozenset
+        self._seq = itertools.count()
+        self._used = 0
+        self._scans = 0
+        self._hits = 0
+        self._misses = 0
+        self._queue: queue.Queue[str] = queue.Queue()
+        self._thread: threading.Thread | None = None
+
+        if self.enabled:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir.mkdir(parents=True, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, daemon=True, name="hot-cache")
+            self._thread.start()
+            logger.info(f"Cache RAM : {self._dir} ({budget_bytes // (1024 * 1024)} Mo)")
+
+    @property
+    def enabled(self) -> bool:
+        return self._budget > 0
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def record_scan(self, paths: list[str]):
+        """Compte un scan pour ces fichiers et planifie leur mise en cache."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._scans += 1
+            if self._scans % _AGING_PERIOD == 0:
+                self._counts = {p: c / 2 for p, c in self._counts.items() if c >= 1}
+            for path in paths:
+                self._counts[path] = self._counts.get(path, 0) + 1
+        for path in paths:
+            self._queue.put(path)
+
+    def seed(self, counts: dict[str, float]):
+        """Initialise les fréquences (ex: historique des scans au démarrage)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            for path, n in counts.items():
+                self._counts[path] = self._counts.get(path, 0) + n
+        for path, _ in sorted(counts.items(), key=lambda kv: -kv[1]):
+            self._queue.put(path)
+
+    def resolve(self, path: str) -> str:
+        """Chemin à donner au lecteur : la copie en RAM si valide, sinon l'original."""
+        if not self.enabled:
+            return path
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                self._misses += 1
+                return path
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        if st is None or (st.st_size, st.st_mtime_ns) != (entry["size"], entry["mtime_ns"]):
+            self.invalidate(path)
+            with self._lock:
+                self._misses += 1
+            return path
+        with self._lock:
+            self._hits += 1
+            entry["last_used"] = time.monotonic()
+        return entry["copy"]
+
+    def invalidate(self, path: str):
+        """Retire la copie d'un fichier (modifié ou supprimé de la bibliothèque).
+
+        resolve() ne la renvoie plus ; elle est supprimée dès que le lecteur
+        ne l'a plus en file (_sweep).
+        """
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is None:
+                return
+            self._retired.append(entry)
+        self._sweep()
+
+    def _sweep(self):
+        """Supprime les copies retirées que le lecteur ne référence plus."""
+        in_use = self._in_use()
+        with self._lock:
+            done = [e for e in self._retired if e["copy"] not in in_use]
+            if not done:
+                return
+            self._retired = [e for e in self._retired if e["copy"] in in_use]
+            self._used -= sum(e["size"] for e in done)
+        for entry in done:
+            shutil.rmtree(Path(entry["copy"]).parent, ignore_errors=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "dir": str(self._dir),
+                "budget_bytes": self._budget,
+                "used_bytes": self._used,
+                "files": len(self._entries),
+                "retired": len(self._retired),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else None,
+                "scans": self._scans,
+                "cached": sorted(
+                    ({"file": os.path.basename(p), "scans": round(self._counts.get(p, 0), 1)}
+                     for p in self._entries),
+                    key=lambda e: -e["scans"],
+                ),
+            }
+
+    # ------------------------------------------------------------------
+    # Remplissage en tâche de fond
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        try:
+            # Thread de fond peu prioritaire (nice propre au thread sous Linux)
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            try:
+                path = self._queue.get(timeout=_SWEEP_INTERVAL)
+            except queue.Empty:
+                if self._retired:
+                    self._sweep()
+                continue
+            with self._lock:
+                if path in self._entries:
+                    continue  # déjà en cache (validité revérifiée à chaque resolve)
+            time.sleep(_FILL_DELAY)
+            try:
+                self._admit(path)
+            except Exception as e:
+                logger.warning(f"Cache RAM : échec de mise en cache de {path} : {e}")
+
+    def _admit(self, path: str):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        in_use = self._in_use()
+        with self._lock:
+            score = self._counts.get(path, 0)
+            entry = self._entries.get(path)
+            if entry is not None and (entry["size"], entry["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+                return
+            if score < self._min_scans or st.st_size > self._budget:
+                return
+            # Victimes : les moins fréquentes puis les moins récentes, tant
+            # qu'elles sont moins fréquentes que le candidat. Une copie en file
+            # chez le lecteur ne libère pas sa place : elle n'est pas candidate.
+            victims = []
+            free = self._budget - self._used
+            if entry is not None and entry["copy"] not in in_use:
+                free += entry["size"]
+            ranked = sorted(
+                (p for p in self._entries if p != path and self._entries[p]["copy"] not in in_use),
+                key=lambda p: (self._counts.get(p, 0), self._entries[p]["last_used"]),
+            )
+            for victim in ranked:
+                if free >= st.st_size:
+                    break
+                if self._counts.get(victim, 0) >= score:
+                    return
+                victims.append(victim)
+                free += self._entries[victim]["size"]
+            if free < st.st_size:
+                return
+
+        for victim in victims:
+            self.invalidate(victim)
+        self.invalidate(path)
+
+        # Un dossier par copie : une ancienne copie du même fichier peut encore
+        # attendre sa suppression
+        folder = self._dir / f"{hashlib.sha1(path.encode()).hexdigest()[:16]}-{next(self._seq)}"
+        folder.mkdir()
+        copy = folder / os.path.basename(path)
+        tmp = folder / f".{copy.name}.part"
+        try:
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, copy)
+        except BaseException:
+            # tmpfs plein, source illisible… : pas de copie partielle en RAM
+            shutil.rmtree(folder, ignore_errors=True)
+            raise
+
+        with self._lock:
+            self._entries[path] = {
+                "copy": str(copy),
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "last_used": time.monotonic(),
+            }
+            self._used += st.st_size
+        logger.info(f"Cache RAM : {os.path.basename(path)} ajouté ({st.st_size // 1024} Ko)")
@@ -0,0 +1,528 @@
+"""
+Sauvegarde / restauration de la bibliothèque en archive tar streamée.
+
+Export (/api/library/export) :
+  - L'archive est générée à la volée, morceau par morceau : aucun fichier
+    temporaire sur la carte SD et une mémoire constante (un bloc de lecture),
+    quelle que soit la taille de la bibliothèque.
+  - Les en-têtes tar sont calculés à l'avance : la taille totale est connue
+    (Content-Length), ce qui permet une barre de progression côté client.
+  - Contenu, dans cet ordre :
+        manifest.json     description logique (audios, playlists, tags)
+        jukebox.db        copie cohérente de la base SQLite (restauration manuelle)
+        audio/<fichier>   fichiers audio
+        checksums.sha256  empreintes calculées pendant l'envoi (format sha256sum)
+
+Import (/api/library/import) :
+  - Lecture streamée du tar (mode 'r|') : chaque fichier est comparé au fil
+    de l'eau avec un éventuel fichier local de même nom ; identique → rien
+    n'est écrit, sinon il est écrit dans un fichier '.import-*.part'.
+  - Les empreintes de checksums.sha256 sont vérifiées en fin d'archive avant
+    de renommer les fichiers reçus.
+  - Les audios, playlists et tags sont ensuite fusionnés dans la bibliothèque
+    existante (ids remappés) dans UNE transaction.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tarfile
+import time
+from pathlib import Path
+
+from werkzeug.utils import secure_filename
+
+from models import db, Audio, Playlist, Tag, playlist_audio
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT = 1
+CHUNK_SIZE = 256 * 1024
+MANIFEST_MAX_SIZE = 16 * 1024 * 1024
+TMP_PREFIX = ".import-"
+
+_BLOCK = tarfile.BLOCKSIZE
+_SHA256_HEX_LEN = 64
+
+
+def _padding(size: int) -> int:
+    return -size % _BLOCK
+
+
+def _tar_header(name: str, size: int, mtime: float) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    return info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+class ExportPlan:
+    """Contenu d'une archive d'export, figé avant le début du streaming.
+
+    Ne contient que des métadonnées : les fichiers audio sont lus pendant
+    l'itération, par blocs de CHUNK_SIZE.
+    """
+
+    def __init__(self, manifest: dict, files: list[tuple[str, Path, int]], db_snapshot: bytes | None):
+        self.manifest_bytes = json.dumps(manifest, ensure_ascii=False, indent=1).encode()
+        self.files = files  # (nom dans l'archive, chemin local, taille)
+        self.db_snapshot = db_snapshot
+        self.created = time.time()
+
+    def _checksums_size(self) -> int:
+        # Une ligne par fichier : "<sha256>  <nom>\n"
+        return sum(_SHA256_HEX_LEN + 2 + len(name.encode()) + 1 for name, _, _ in self.files)
+
+    def content_length(self) -> int:
+        """Taille exacte de l'archive produite par iter_export()."""
+        members = [("manifest.json", len(self.manifest_bytes))]
+        if self.db_snapshot is not None:
+            members.append(("jukebox.db", len(self.db_snapshot)))
+        members += [(name, size) for name, _, size in self.files]
+        members.append(("checksums.sha256", self._checksums_size()))
+        total = 2 * _BLOCK  # deux blocs nuls de fin d'archive
+        for name, size in members:
+            total += len(_tar_header(name, size, self.created)) + size + _padding(size)
+        return total
+
+
+def build_export_plan(resolve_path) -> ExportPlan:
+    """Construit le plan d'export depuis la base (requiert un app context).
+
+    :param resolve_path: callable(file_path) → chemin absolu (audio_abs_path)
+    """
+    audios = Audio.query.order_by(Audio.id).all()
+    files: list[tuple[str, Path, int]] = []
+    manifest_audios = []
+    # Un même fichier référencé par plusieurs audios n'est archivé qu'une fois
+    members_by_file: dict[tuple[int, int], str] = {}
+    taken: set[str] = set()
+    for audio in audios:
+        path = Path(resolve_path(audio.file_path))
+        try:
+            st = path.stat()
+        except OSError:
+            logger.warning(f"Export : fichier introuvable, ignoré : {path}")
+            continue
+        size = st.st_size
+        member = members_by_file.get((st.st_dev, st.st_ino))
+        if member is None:
+            # Deux fichiers de même nom (anciens chemins absolus) : suffixe _1, _2…
+            # comme à l'upload, pour ne pas écraser l'un par l'autre dans l'archive
+            member, counter = f"audio/{path.name}", 1
+            while member in taken:
+                member = f"audio/{path.stem}_{counter}{path.suffix}"
+                counter += 1
+            taken.add(member)
+            members_by_file[(st.st_dev, st.st_ino)] = member
+            files.append((member, path, size))
+        manifest_audios.append({
+            "id": audio.id,
+            "name": audio.name,
+            "file": member,
+            "size": size,
+        })
+
+    members: dict[int, list[int]] = {}
+    rows = db.session.execute(
+        db.select(playlist_audio.c.playlist_id, playlist_audio.c.audio_id)
+        .order_by(playlist_audio.c.playlist_id, playlist_audio.c.position, playlist_audio.c.audio_id)
+    )
+    for pid, aid in rows:
+        members.setdefault(pid, []).append(aid)
+
+    manifest = {
+        "format": ARCHIVE_FORMAT,
+        "created": int(time.time()),
+        "audios": manifest_audios,
+        "playlists": [
+            {
+                "id": pl.id,
+                "name": pl.name,
+                "shuffle": pl.shuffle,
+                "repeat": pl.repeat,
+                "audio_ids": members.get(pl.id, []),
+            }
+            for pl in Playlist.query.order_by(Playlist.id)
+        ],
+        "tags": [
+            {"rfid_id": t.rfid_id, "audio_id": t.audio_id, "playlist_id": t.playlist_id}
+            for t in Tag.query.order_by(Tag.id)
+        ],
+    }
+    return ExportPlan(manifest, files, _db_snapshot())
+
+
+def _db_snapshot() -> bytes | None:
+    """Copie cohérente de la base SQLite (quelques centaines de Ko)."""
+    raw = db.engine.raw_connection()
+    try:
+        return raw.driver_connection.serialize()
+    except AttributeError:  # Python < 3.11
+        logger.warning("Export : sqlite3.serialize indisponible, jukebox.db non inclus")
+        return None
+    finally:
+        raw.close()
+
+
+def iter_export(plan: ExportPlan):
+    """Génère l'archive tar morceau par morceau (mémoire constante)."""
+    yield _tar_header("manifest.json", len(plan.manifest_bytes), plan.created)
+    yield plan.manifest_bytes + b"\0" * _padding(len(plan.manifest_bytes))
+
+    if plan.db_snapshot is not None:
+        yield _tar_header("jukebox.db", len(plan.db_snapshot), plan.created)
+        yield plan.db_snapshot + b"\0" * _padding(len(plan.db_snapshot))
+
+    checksums = []
+    for name, path, size in plan.files:
+        yield _tar_header(name, size, plan.created)
+        digest = hashlib.sha256()
+        remaining = size
+        try:
+            with open(path, "rb") as f:
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    digest.update(chunk)
+                    yield chunk
+        except OSError as e:
+            logger.error(f"Export : lecture impossible de {path} : {e}")
+        if remaining:
+            # Fichier tronqué/supprimé pendant l'export : la taille annoncée est
+            # respectée par des zéros, exclus de l'empreinte → l'import le signalera.
+            logger.error(f"Export : {path} tronqué ({remaining} octets manquants)")
+            zeros = b"\0" * min(CHUNK_SIZE, remaining)
+            while remaining > 0:
+                n = min(len(zeros), remaining)
+                remaining -= n
+                yield zeros[:n]
+        yield b"\0" * _padding(size)
+        checksums.append(f"{digest.hexdigest()}  {name}\n")
+
+    trailer = "".join(checksums).encode()
+    yield _tar_header("checksums.sha256", len(trailer), plan.created)
+    yield trailer + b"\0" * _padding(len(trailer))
+    yield b"\0" * (2 * _BLOCK)
+
+
+# ---------------------------------------------------------------------------
+# Import — réception des fichiers
+# ---------------------------------------------------------------------------
+
+class ArchiveError(ValueError):
+    """Archive invalide ou incomplète."""
+
+
+def _receive_member(src, size: int, local: Path, tmp: Path) -> tuple[str, bool]:
+    """Consomme un membre du tar en calculant son sha256.
+
+    Si `local` existe avec la même taille, le flux est comparé au fichier
+    local bloc par bloc sans rien écrire ; dès la première différence, la
+    partie déjà comparée (identique) est recopiée depuis le fichier local
+    vers `tmp` et la suite y est écrite.
+
+    :return: (sha256, True si `tmp` a été écrit)
+    """
+    digest = hashlib.sha256()
+    local_f = None
+    out = None
+    offset = 0
+    try:
+        if local.is_file() and local.stat().st_size == size:
+            local_f = open(local, "rb")
+        else:
+            out = open(tmp, "wb")
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            if local_f is not None:
+                if local_f.read(len(chunk)) == chunk:
+                    offset += len(chunk)
+                    continue
+                # Contenu différent : bascule en écriture
+                out = open(tmp, "wb")
+                local_f.seek(0)
+                remaining = offset
+                while remaining > 0:
+                    block = local_f.read(min(CHUNK_SIZE, remaining))
+                    out.write(block)
+                    remaining -= len(block)
+                local_f.close()
+                local_f = None
+            out.write(chunk)
+    finally:
+        if local_f is not None:
+            local_f.close()
+        if out is not None:
+            out.close()
+    return digest.hexdigest(), out is not None
+
+
+def receive_archive(stream, upload_folder: Path) -> dict:
+    """Extrait une archive d'export depuis un flux (sans la stocker).
+
+    Les fichiers reçus restent en '.import-*.part' tant que les empreintes
+    ne sont pas vérifiées.
+
+    :return: {"manifest", "files": {membre: {"path", "status", "error"?}}, "bytes"}
+    """
+    manifest = None
+    received: dict[str, dict] = {}  # membre → {"sha256", "tmp"|None, "local"}
+    checksums: dict[str, str] | None = None
+    total = 0
+
+    try:
+        with tarfile.open(fileobj=stream, mode="r|") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                src = tar.extractfile(member)
+                total += member.size
+                if member.name == "manifest.json":
+                    if member.size > MANIFEST_MAX_SIZE:
+                        raise ArchiveError("manifest.json trop volumineux")
+                    manifest = json.loads(src.read().decode())
+                elif member.name == "checksums.sha256":
+                    if member.size > MANIFEST_MAX_SIZE:
+                        raise ArchiveError("checksums.sha256 trop volumineux")
+                    checksums = {}
+                    for line in src.read().decode().splitlines():
+                        digest, _, name = line.partition("  ")
+                        checksums[name] = digest
+                elif member.name.startswith("audio/"):
+                    filename = secure_filename(member.name[len("audio/"):])
+                    if not filename:
+                        continue
+                    local = upload_folder / filename
+                    tmp = upload_folder / f"{TMP_PREFIX}{filename}.part"
+                    digest, written = _receive_member(src, member.size, local, tmp)
+                    received[member.name] = {
+                        "sha256": digest,
+                        "tmp": tmp if written else None,
+                        "local": local,
+                    }
+                # jukebox.db et membres inconnus : ignorés (simplement consommés)
+    except (tarfile.TarError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        _discard(received)
+        raise ArchiveError(f"Archive illisible : {e}")
+    except Exception:
+        _discard(received)
+        raise
+
+    if manifest is None or manifest.get("format") != ARCHIVE_FORMAT:
+        _discard(received)
+        raise ArchiveError("manifest.json absent ou format non supporté")
+    if checksums is None:
+        _discard(received)
+        raise ArchiveError("checksums.sha256 absent : archive incomplète")
+    try:
+        _check_manifest(manifest)
+    except ArchiveError:
+        _discard(received)
+        raise
+
+    files: dict[str, dict] = {}
+    for name, entry in received.items():
+        if checksums.get(name) != entry["sha256"]:
+            _discard({name: entry})
+            files[name] = {"status": "error", "error": "empreinte sha256 invalide"}
+        elif entry["tmp"] is None:
+            files[name] = {"status": "present", "path": entry["local"]}
+        else:
+            dest = _unique_path(entry["local"])
+            os.replace(entry["tmp"], dest)
+            files[name] = {"status": "imported", "path": dest}
+    return {"manifest": manifest, "files": files, "bytes": total}
+
+
+# Champs obligatoires des entrées du manifest, et leur type
+_MANIFEST_FIELDS = {
+    "audios": {"id": int, "name": str, "file": str},
+    "playlists": {"id": int, "name": str},
+    "tags": {"rfid_id": str},
+}
+
+
+def _check_manifest(manifest: dict):
+    """Vérifie la forme du manifest avant toute écriture (ArchiveError sinon)."""
+    for section, fields in _MANIFEST_FIELDS.items():
+        entries = manifest.get(section, [])
+        if not isinstance(entries, list):
+            raise ArchiveError(f"manifest.json : '{section}' doit être une liste")
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                raise ArchiveError(f"manifest.json : {section}[{index}] invalide")
+            for field, kind in fields.items():
+                value = entry.get(field)
+                if not isinstance(value, kind) or isinstance(value, bool):
+                    raise ArchiveError(f"manifest.json : {section}[{index}].{field} manquant ou invalide")
+            if section == "playlists":
+                audio_ids = entry.get("audio_ids", [])
+                if not isinstance(audio_ids, list) or not all(_is_id(a) for a in audio_ids):
+                    raise ArchiveError(f"manifest.json : {section}[{index}].audio_ids invalide")
+            elif section == "tags":
+                for field in ("audio_id", "playlist_id"):
+                    if entry.get(field) is not None and not _is_id(entry[field]):
+                        raise ArchiveError(f"manifest.json : {section}[{index}].{field} invalide")
+
+
+def _is_id(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _discard(received: dict):
+    for entry in received.values():
+        if entry.get("tmp") is not None:
+            Path(entry["tmp"]).unlink(missing_ok=True)
+
+
+def _unique_path(dest: Path) -> Path:
+    """Même règle que l'upload : suffixe _1, _2… si le nom est déjà pris."""
+    counter = 1
+    stem = dest.stem
+    while dest.exists():
+        dest = dest.with_name(f"{stem}_{counter}{dest.suffix}")
+        counter += 1
+    return dest
+
+
+# ---------------------------------------------------------------------------
+# Import — fusion en base
+# ---------------------------------------------------------------------------
+
+def merge_into_library(received: dict) -> dict:
+    """Fusionne le manifest dans la bibliothèque existante (une transaction).
+
+    - Audio : réutilisé si un Audio pointe déjà sur le même fichier, créé sinon.
+    - Playlist : réutilisée si une playlist de même nom a exactement les
+      mêmes pistes (réimport idempotent), créée sinon.
+    - Tag : créé s'il n'existe pas ; un tag déjà associé localement est conservé.
+
+    En cas d'échec, la transaction est annulée et les fichiers importés par
+    cette archive sont supprimés (aucun fichier sans Audio dans uploads/).
+    """
+    try:
+        return _merge(received["manifest"], received["files"], received["bytes"])
+    except Exception:
+        db.session.rollback()
+        for result in received["files"].values():
+            if result["status"] == "imported":
+                result["path"].unlink(missing_ok=True)
+        raise
+
+
+def _merge(manifest: dict, files: dict, total_bytes: int) -> dict:
+    # --- Audios ----------------------------------------------------------
+    wanted: dict[int, tuple[str, str]] = {}  # ancien id → (nom, fichier)
+    for entry in manifest.get("audios", []):
+        result = files.get(entry.get("file"))
+        if result and result["status"] != "error":
+            wanted[entry["id"]] = (entry["name"], result["path"].name)
+
+    existing = {}
+    if wanted:
+        names = [f for _, f in wanted.values()]
+        existing = {a.file_path: a for a in Audio.query.filter(Audio.file_path.in_(names))}
+    audio_map: dict[int, Audio] = {}
+    for old_id, (name, filename) in wanted.items():
+        audio = existing.get(filename)
+        if audio is None:
+            audio = existing[filename] = Audio(name=name, file_path=filename)
+            db.session.add(audio)
+        audio_map[old_id] = audio
+
+    # --- Playlists -------------------------------------------------------
+    local_members: dict[int, list[int]] = {}
+    for pid, aid in db.session.execute(
+        db.select(playlist_audio.c.playlist_id, playlist_audio.c.audio_id)
+        .order_by(playlist_audio.c.playlist_id, playlist_audio.c.position, playlist_audio.c.audio_id)
+    ):
+        local_members.setdefault(pid, []).append(aid)
+    local_by_name: dict[str, list[Playlist]] = {}
+    for pl in Playlist.query.all():
+        local_by_name.setdefault(pl.name, []).append(pl)
+
+    db.session.flush()  # ids des nouveaux audios
+    playlist_map: dict[int, Playlist] = {}
+    new_members: list[tuple[Playlist, list[int]]] = []
+    reused_playlists = 0
+    for entry in manifest.get("playlists", []):
+        ids = [audio_map[a].id for a in entry.get("audio_ids", []) if a in audio_map]
+        match = next(
+            (pl for pl in local_by_name.get(entry["name"], []) if local_members.get(pl.id, []) == ids),
+            None,
+        )
+        if match is not None:
+            playlist_map[entry["id"]] = match
+            reused_playlists += 1
+            continue
+        playlist = Playlist(
+            name=entry["name"],
+            shuffle=bool(entry.get("shuffle", False)),
+            repeat=bool(entry.get("repeat", False)),
+        )
+        db.session.add(playlist)
+        playlist_map[entry["id"]] = playlist
+        new_members.append((playlist, ids))
+
+    db.session.flush()  # ids des nouvelles playlists
+    rows = [
+        {"playlist_id": pl.id, "audio_id": aid, "position": pos}
+        for pl, ids in new_members
+        for pos, aid in enumerate(ids)
+    ]
+    if rows:
+        db.session.execute(playlist_audio.insert(), rows)
+
+    # --- Tags ------------------------------------------------------------
+    manifest_tags = manifest.get("tags", [])
+    known_tags = {
+        t.rfid_id
+        for t in Tag.query.filter(Tag.rfid_id.in_([t["rfid_id"] for t in manifest_tags]))
+    } if manifest_tags else set()
+    tags_created = tags_skipped = 0
+    for entry in manifest_tags:
+        if entry["rfid_id"] in known_tags:
+            tags_skipped += 1
+            continue
+        tag = Tag(rfid_id=entry["rfid_id"])
+        if entry.get("audio_id") in audio_map:
+            tag.audio_id = audio_map[entry["audio_id"]].id
+        elif entry.get("playlist_id") in playlist_map:
+            tag.playlist_id = playlist_map[entry["playlist_id"]].id
+        else:
+            tags_skipped += 1
+            continue
+        db.session.add(tag)
+        known_tags.add(tag.rfid_id)
+        tags_created += 1
+
+    db.session.commit()
+
+    statuses = [f["status"] for f in files.values()]
+    report = {
+        "files_imported": statuses.count("imported"),
+        "files_present": statuses.count("present"),
+        "files_error": [name for name, f in files.items() if f["status"] == "error"],
+        "audios": len(audio_map),
+        "playlists_created": len(new_members),
+        "playlists_reused": reused_playlists,
+        "tags_created": tags_created,
+        "tags_skipped": tags_skipped,
+        "bytes": total_bytes,
+    }
+    logger.info(f"Import bibliothèque : {report}")
+    return report
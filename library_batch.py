@@ -0,0 +1,363 @@
+"""
+Opérations en lot sur la bibliothèque (API JSON /api/library/batch).
+
+Une requête contient une liste ordonnée d'opérations :
+
+  {"op": "assign_tag",      "rfid_id": "123", "target": "audio:4"}
+  {"op": "delete_tag",      "rfid_id": "123"}
+  {"op": "create_playlist", "name": "Dodo", "audio_ids": [4, 2], "ref": "p1"}
+  {"op": "update_playlist", "id": 3, "name": "Réveil", "audio_ids": [1, 2],
+                            "shuffle": true, "repeat": false}
+  {"op": "reorder_playlist","id": 3, "audio_ids": [2, 1]}
+  {"op": "delete_playlist", "id": 3}
+
+Une playlist créée dans le même lot peut être ciblée par sa référence :
+"target": "playlist:@p1".
+
+Fonctionnement :
+  - Validation groupée : une requête IN par table (audios, playlists, tags)
+    au lieu d'un SELECT par ligne.
+  - Tout est appliqué dans UNE transaction, avec UN commit final.
+  - Les pistes des playlists sont réécrites en fin de lot par deux requêtes
+    (DELETE + INSERT executemany), quel que soit le nombre d'opérations.
+  - Chaque opération reçoit son propre résultat ({"ok": true/false, ...}).
+    En mode atomic, la moindre erreur annule l'ensemble du lot.
+"""
+
+from __future__ import annotations
+
+import logging
+
+from models import db, Audio, Playlist, Tag, playlist_audio
+
+logger = logging.getLogger(__name__)
+
+# Garde-fou : un lot reste une requête HTTP raisonnable sur un Raspberry Pi
+MAX_OPERATIONS = 1000
+
+OPERATIONS = {
+    "assign_tag",
+    "delete_tag",
+    "create_playlist",
+    "update_playlist",
+    "reorder_playlist",
+    "delete_playlist",
+}
+
+
+class BatchError(ValueError):
+    """Opération invalide — le message est renvoyé tel quel au client."""
+
+
+# ---------------------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------------------
+
+def _int(value, field: str) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BatchError(f"'{field}' doit être un entier")
+
+
+def _int_list(value, field: str) -> list[int]:
+    if not isinstance(value, list):
+        raise BatchError(f"'{field}' doit être une liste d'entiers")
+    ids = [_int(v, field) for v in value]
+    if len(set(ids)) != len(ids):
+        raise BatchError(f"'{field}' contient des doublons")
+    return ids
+
+
+def _parse_target(raw) -> tuple[str, int | str]:
+    """'audio:4' → ('audio', 4) ; 'playlist:@p1' → ('playlist', '@p1')."""
+    if not isinstance(raw, str) or ":" not in raw:
+        raise BatchError("'target' doit être de la forme 'audio:ID' ou 'playlist:ID'")
+    target_type, _, target_id = raw.partition(":")
+    if target_type not in ("audio", "playlist"):
+        raise BatchError(f"Type de cible invalide '{target_type}'")
+    if target_type == "playlist" and target_id.startswith("@"):
+        return target_type, target_id
+    return target_type, _int(target_id, "target")
+
+
+def _parse(op) -> dict:
+    """Normalise une opération brute (dict JSON) ou lève BatchError."""
+    if not isinstance(op, dict):
+        raise BatchError("Opération invalide (objet JSON attendu)")
+    kind = op.get("op")
+    if kind not in OPERATIONS:
+        raise BatchError(f"Opération inconnue '{kind}'")
+
+    parsed: dict = {"op": kind}
+    if kind in ("assign_tag", "delete_tag"):
+        rfid_id = str(op.get("rfid_id") or "").strip()
+        if not rfid_id:
+            raise BatchError("'rfid_id' manquant")
+        parsed["rfid_id"] = rfid_id
+        if kind == "assign_tag":
+            parsed["target"] = _parse_target(op.get("target"))
+        return parsed
+
+    if kind != "create_playlist":
+        parsed["id"] = _int(op.get("id"), "id")
+
+    if kind in ("create_playlist", "update_playlist"):
+        name = op.get("name")
+        if name is not None:
+            name = str(name).strip()
+            if not name:
+                raise BatchError("'name' ne peut pas être vide")
+        elif kind == "create_playlist":
+            raise BatchError("'name' manquant")
+        parsed["name"] = name
+        if kind == "create_playlist":
+            parsed["ref"] = op.get("ref")
+        for mode in ("shuffle", "repeat"):
+            if mode in op:
+                if not isinstance(op[mode], bool):
+                    raise BatchError(f"'{mode}' doit être un booléen")
+                parsed[mode] = op[mode]
+
+    if kind in ("create_playlist", "update_playlist", "reorder_playlist"):
+        if "audio_ids" in op:
+            parsed["audio_ids"] = _int_list(op["audio_ids"], "audio_ids")
+        elif kind == "reorder_playlist":
+            raise BatchError("'audio_ids' manquant")
+    return parsed
+
+
+# ---------------------------------------------------------------------------
+# Application
+# ---------------------------------------------------------------------------
+
+def apply_batch(operations: list, atomic: bool = False) -> dict:
+    """Applique un lot d'opérations dans une seule transaction.
+
+    :param operations: liste d'opérations JSON (voir docstring du module)
+    :param atomic: si True, une seule opération en erreur annule tout le lot
+    :return: {"ok", "applied", "failed", "results", "assigned_rfids"}
+    """
+    if not isinstance(operations, list):
+        raise BatchError("'operations' doit être une liste")
+    if len(operations) > MAX_OPERATIONS:
+        raise BatchError(f"Lot trop gros ({len(operations)} > {MAX_OPERATIONS} opérations)")
+
+    parsed: list[dict | BatchError] = []
+    for op in operations:
+        try:
+            parsed.append(_parse(op))
+        except BatchError as e:
+            parsed.append(e)
+    valid = [p for p in parsed if isinstance(p, dict)]
+
+    # --- Validation groupée : une requête par table ---------------------
+    audio_ids: set[int] = set()
+    playlist_ids: set[int] = set()
+    rfid_ids: set[str] = set()
+    for p in valid:
+        audio_ids.update(p.get("audio_ids") or ())
+        if "id" in p:
+            playlist_ids.add(p["id"])
+        if "rfid_id" in p:
+            rfid_ids.add(p["rfid_id"])
+        if "target" in p:
+            target_type, target_id = p["target"]
+            if target_type == "audio":
+                audio_ids.add(target_id)
+            elif isinstance(target_id, int):
+                playlist_ids.add(target_id)
+
+    known_audios: set[int] = set()
+    if audio_ids:
+        known_audios = set(db.session.scalars(db.select(Audio.id).where(Audio.id.in_(audio_ids))))
+    playlists: dict[int, Playlist] = {}
+    if playlist_ids:
+        playlists = {pl.id: pl for pl in Playlist.query.filter(Playlist.id.in_(playlist_ids))}
+    tags: dict[str, Tag] = {}
+    if rfid_ids:
+        tags = {t.rfid_id: t for t in Tag.query.filter(Tag.rfid_id.in_(rfid_ids))}
+
+    # Membres actuels des playlists réordonnées (une requête)
+    reorder_ids = {p["id"] for p in valid if p["op"] == "reorder_playlist"}
+    members: dict[int, list[int]] = {}
+    if reorder_ids:
+        rows = db.session.execute(
+            db.select(playlist_audio.c.playlist_id, playlist_audio.c.audio_id)
+            .where(playlist_audio.c.playlist_id.in_(reorder_ids))
+        )
+        for pid, aid in rows:
+            members.setdefault(pid, []).append(aid)
+
+    # --- Application séquentielle en mémoire ----------------------------
+    refs: dict[str, Playlist] = {}
+    created: list[tuple[Playlist, list[int]]] = []
+    created_results: list[tuple[dict, Playlist]] = []  # id connu après le flush
+    pending_members: dict[int, list[int]] = {}  # playlist_id → pistes ordonnées
+    deleted_playlists: set[int] = set()
+    assigned: dict[str, tuple[str, int | Playlist] | None] = {}  # None = suppression
+    assign_results: dict[str, dict] = {}  # rfid_id → résultat de son dernier assign_tag
+    results: list[dict] = []
+
+    def check_audios(ids: list[int]):
+        unknown = [aid for aid in ids if aid not in known_audios]
+        if unknown:
+            raise BatchError(f"Audio(s) introuvable(s) : {unknown}")
+
+    def get_playlist(pid: int) -> Playlist:
+        if pid in deleted_playlists or pid not in playlists:
+            raise BatchError(f"Playlist {pid} introuvable")
+        return playlists[pid]
+
+    for index, p in enumerate(parsed):
+        if isinstance(p, BatchError):
+            results.append({"index": index, "ok": False, "error": str(p)})
+            continue
+        try:
+            kind = p["op"]
+            result: dict = {"index": index, "ok": True, "op": kind}
+
+            if kind == "assign_tag":
+                target_type, target_id = p["target"]
+                if target_type == "audio":
+                    check_audios([target_id])
+                    target = target_id
+                elif isinstance(target_id, str):
+                    if target_id[1:] not in refs:
+                        raise BatchError(f"Référence de playlist inconnue '{target_id}'")
+                    target = refs[target_id[1:]]
+                else:
+                    get_playlist(target_id)
+                    target = target_id
+                assigned[p["rfid_id"]] = (target_type, target)
+                assign_results[p["rfid_id"]] = result
+                result["rfid_id"] = p["rfid_id"]
+
+            elif kind == "delete_tag":
+                rfid_id = p["rfid_id"]
+                if assigned.get(rfid_id) is None and rfid_id not in tags:
+                    raise BatchError(f"Tag {rfid_id} introuvable")
+                if assigned.get(rfid_id) is None and rfid_id in assigned:
+                    raise BatchError(f"Tag {rfid_id} déjà supprimé dans ce lot")
+                assigned[rfid_id] = None  # suppression appliquée en fin de lot
+                result["rfid_id"] = rfid_id
+
+            elif kind == "create_playlist":
+                ids = p.get("audio_ids") or []
+                check_audios(ids)
+                ref = p.get("ref")
+                if ref is not None and str(ref) in refs:
+                    raise BatchError(f"Référence '{ref}' déjà utilisée dans ce lot")
+                playlist = Playlist(name=p["name"], shuffle=p.get("shuffle", False), repeat=p.get("repeat", False))
+                db.session.add(playlist)
+                created.append((playlist, ids))
+                created_results.append((result, playlist))
+                if ref is not None:
+                    refs[str(ref)] = playlist
+                    result["ref"] = ref
+
+            elif kind == "update_playlist":
+                playlist = get_playlist(p["id"])
+                if "audio_ids" in p:
+                    check_audios(p["audio_ids"])
+                    pending_members[playlist.id] = p["audio_ids"]
+                if p.get("name"):
+                    playlist.name = p["name"]
+                for mode in ("shuffle", "repeat"):
+                    if mode in p:
+                        setattr(playlist, mode, p[mode])
+                result["id"] = playlist.id
+
+            elif kind == "reorder_playlist":
+                playlist = get_playlist(p["id"])
+                current = pending_members.get(playlist.id, members.get(playlist.id, []))
+                if sorted(current) != sorted(p["audio_ids"]):
+                    raise BatchError("'audio_ids' doit contenir exactement les pistes de la playlist")
+                pending_members[playlist.id] = p["audio_ids"]
+                result["id"] = playlist.id
+
+            elif kind == "delete_playlist":
+                playlist = get_playlist(p["id"])
+                deleted_playlists.add(playlist.id)
+                pending_members.pop(playlist.id, None)
+                # Une association plus haut dans le lot vers cette playlist
+                # n'est pas appliquée : elle est signalée en échec
+                for rfid_id, target in list(assigned.items()):
+                    if target == ("playlist", playlist.id):
+                        assigned.pop(rfid_id)
+                        assign_results[rfid_id].update(
+                            ok=False, error=f"Playlist {playlist.id} supprimée plus loin dans le lot"
+                        )
+                result["id"] = playlist.id
+
+            results.append(result)
+        except BatchError as e:
+            results.append({"index": index, "ok": False, "error": str(e)})
+
+    failed = sum(1 for r in results if not r["ok"])
+    if atomic and failed:
+        db.session.rollback()
+        return {"ok": False, "applied": 0, "failed": failed, "results": results, "assigned_rfids": []}
+
+    # --- Écriture groupée ------------------------------------------------
+    try:
+        for rfid_id, assignment in assigned.items():
+            tag = tags.get(rfid_id)
+            if assignment is None:
+                if tag is not None:
+                    db.session.delete(tag)
+                continue
+            target_type, target = assignment
+            if tag is None:
+                tag = tags[rfid_id] = Tag(rfid_id=rfid_id)
+                db.session.add(tag)
+            if target_type == "audio":
+                tag.audio_id, tag.playlist_id = target, None
+            else:
+                tag.audio_id = None
+                if isinstance(target, Playlist):
+                    tag.playlist = target
+                else:
+                    tag.playlist_id = target
+
+        if deleted_playlists:
+            # Pas de FK en cascade : comme la page Playlists, les tags pointant
+            # sur une playlist supprimée sont supprimés (sinon tags sans cible),
+            # avant la playlist, que le backref Playlist.tags détacherait
+            db.session.execute(db.delete(Tag).where(Tag.playlist_id.in_(deleted_playlists)))
+            for pid in deleted_playlists:
+                db.session.delete(playlists[pid])
+
+        # Un seul flush : attribue les ids des nouvelles playlists et des tags
+        db.session.flush()
+        for playlist, ids in created:
+            pending_members[playlist.id] = ids
+        for result, playlist in created_results:
+            result["id"] = playlist.id
+
+        touched = set(pending_members) | deleted_playlists
+        if touched:
+            db.session.execute(
+                playlist_audio.delete().where(playlist_audio.c.playlist_id.in_(touched))
+            )
+        rows = [
+            {"playlist_id": pid, "audio_id": aid, "position": pos}
+            for pid, ids in pending_members.items()
+            for pos, aid in enumerate(ids)
+        ]
+        if rows:
+            db.session.execute(playlist_audio.insert(), rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    applied = len(results) - failed
+    logger.info(f"Lot bibliothèque : {applied} opération(s) appliquée(s), {failed} en erreur")
+    return {
+        "ok": failed == 0,
+        "applied": applied,
+        "failed": failed,
+        "results": results,
+        "assigned_rfids": [rfid_id for rfid_id, a in assigned.items() if a is not None],
+    }
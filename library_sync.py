@@ -0,0 +1,224 @@
+"""
+Synchronisation incrémentale de la bibliothèque (/api/library/changes).
+
+Un client (interface web, application) garde une copie locale :
+
+  1. GET /api/library/snapshot          → {"seq": 42, "audios": [...], "playlists": [...], "tags": [...]}
+  2. GET /api/library/changes?since=42  → {"seq": 45, "more": false, "reset": false,
+                                            "upsert": {"audio": [...], "playlist": [...], "tag": [...]},
+                                            "delete": {"audio": [3], "playlist": [], "tag": [7]}}
+
+Journal des modifications (table change_log) :
+  - Alimenté par des triggers SQLite sur audio, playlist, playlist_audio et
+    tag : toutes les écritures sont couvertes, qu'elles passent par l'ORM,
+    par des requêtes groupées (library_batch) ou par la maintenance (sqlite3).
+  - Une ligne par entité (entity, entity_id) : INSERT OR REPLACE lui donne
+    un nouveau numéro seq à chaque modification. Le journal ne grossit donc
+    qu'avec le nombre d'entités, pas avec le nombre d'écritures.
+  - Une modification de playlist_audio est enregistrée comme une
+    modification de la playlist : le client reçoit sa liste audio_ids à jour.
+  - L'état est résolu à la lecture : une entité encore présente est
+    renvoyée en "upsert" (valeur courante), une entité disparue en "delete".
+
+Compaction (tâche de maintenance compact_changes) : les lignes d'entités
+supprimées depuis plus de `retention` secondes sont effacées et le seuil
+min_seq est relevé. Un client dont since < min_seq reçoit "reset": true
+et repart d'un snapshot.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+
+from models import db, Audio, Playlist, Tag, playlist_audio
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximal d'entités par réponse de /api/library/changes
+MAX_CHANGES = 500
+
+ENTITIES = ("audio", "playlist", "tag")
+
+# Table, entité journalisée, expression de l'identifiant (NEW/OLD)
+_TRIGGERS = [
+    ("audio", "audio", "id"),
+    ("playlist", "playlist", "id"),
+    ("tag", "tag", "id"),
+    ("playlist_audio", "playlist", "playlist_id"),
+]
+
+_DDL = [
+    "CREATE TABLE IF NOT EXISTS change_log ("
+    " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+    " entity TEXT NOT NULL,"
+    " entity_id INTEGER NOT NULL,"
+    " changed_at REAL NOT NULL,"
+    " UNIQUE (entity, entity_id))",
+    "CREATE TABLE IF NOT EXISTS change_log_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+]
+
+
+# Horodatage Unix en secondes (unixepoch() n'existe qu'à partir de SQLite 3.38)
+_NOW = "(julianday('now') - 2440587.5) * 86400.0"
+
+
+def _trigger_ddl(name: str, event: str, table: str, entity: str, row_id: str, when: str = "") -> str:
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS change_log_{name} AFTER {event} ON {table}{when} BEGIN"
+        f" INSERT OR REPLACE INTO change_log (entity, entity_id, changed_at)"
+        f" VALUES ('{entity}', {row_id}, {_NOW});"
+        f" END"
+    )
+
+
+def install_change_log():
+    """Crée la table change_log et ses triggers s'ils n'existent pas."""
+    statements = list(_DDL)
+    for table, entity, column in _TRIGGERS:
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            row = "OLD" if event == "DELETE" else "NEW"
+            statements.append(_trigger_ddl(f"{table}_{event.lower()}", event, table, entity, f"{row}.{column}"))
+    # Ligne déplacée d'une playlist à une autre : l'ancienne change aussi
+    statements.append(_trigger_ddl(
+        "playlist_audio_move",
+        "UPDATE OF playlist_id",
+        "playlist_audio",
+        "playlist",
+        "OLD.playlist_id",
+        when=" WHEN OLD.playlist_id != NEW.playlist_id",
+    ))
+    for ddl in statements:
+        db.session.execute(db.text(ddl))
+    db.session.commit()
+
+
+# ---------------------------------------------------------------------------
+# Lecture
+# ---------------------------------------------------------------------------
+
+def _current_seq() -> int:
+    # sqlite_sequence plutôt que MAX(seq) : la compaction peut effacer les
+    # dernières lignes, le compteur AUTOINCREMENT ne recule jamais
+    return db.session.execute(
+        db.text("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'change_log'")
+    ).scalar()
+
+
+def _min_seq() -> int:
+    return db.session.execute(
+        db.text("SELECT COALESCE(MAX(value), 0) FROM change_log_meta WHERE name = 'min_seq'")
+    ).scalar()
+
+
+def _members(playlist_ids=None) -> dict[int, list[int]]:
+    query = db.select(playlist_audio.c.playlist_id, playlist_audio.c.audio_id).order_by(
+        playlist_audio.c.playlist_id, playlist_audio.c.position, playlist_audio.c.audio_id
+    )
+    if playlist_ids is not None:
+        query = query.where(playlist_audio.c.playlist_id.in_(playlist_ids))
+    members: dict[int, list[int]] = {}
+    for pid, aid in db.session.execute(query):
+        members.setdefault(pid, []).append(aid)
+    return members
+
+
+def _playlist_dict(playlist: Playlist, members: dict[int, list[int]]) -> dict:
+    return {
+        "id": playlist.id,
+        "name": playlist.name,
+        "shuffle": playlist.shuffle,
+        "repeat": playlist.repeat,
+        "audio_ids": members.get(playlist.id, []),
+    }
+
+
+def _tag_dict(tag: Tag) -> dict:
+    # Pas de libellé : le client le retrouve dans sa copie (évite deux jointures)
+    return {"id": tag.id, "rfid_id": tag.rfid_id, "audio_id": tag.audio_id, "playlist_id": tag.playlist_id}
+
+
+def snapshot() -> dict:
+    """Bibliothèque complète et numéro de séquence à partir duquel synchroniser.
+
+    seq est lu AVANT les données : une écriture concurrente sera au pire
+    renvoyée deux fois (snapshot + changes), jamais perdue.
+    """
+    seq = _current_seq()
+    members = _members()
+    return {
+        "seq": seq,
+        "audios": [a.to_dict() for a in Audio.query.order_by(Audio.id)],
+        "playlists": [_playlist_dict(p, members) for p in Playlist.query.order_by(Playlist.id)],
+        "tags": [_tag_dict(t) for t in Tag.query.order_by(Tag.id)],
+    }
+
+
+def changes_since(since: int, limit: int = MAX_CHANGES) -> dict:
+    """Modifications postérieures à `since` (au plus `limit` entités)."""
+    limit = max(1, min(limit, MAX_CHANGES))
+    current = _current_seq()
+    # Journal compacté depuis, ou copie faite sur une autre base (restauration)
+    if since < _min_seq() or since > current:
+        return {"seq": current, "reset": True, "more": False}
+
+    rows = db.session.execute(
+        db.text("SELECT seq, entity, entity_id FROM change_log WHERE seq > :since ORDER BY seq LIMIT :limit"),
+        {"since": since, "limit": limit + 1},
+    ).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    ids: dict[str, set[int]] = {entity: set() for entity in ENTITIES}
+    for _, entity, entity_id in rows:
+        if entity in ids:
+            ids[entity].add(entity_id)
+
+    # Une requête IN par table pour les valeurs courantes
+    audios = Audio.query.filter(Audio.id.in_(ids["audio"])).all() if ids["audio"] else []
+    playlists = Playlist.query.filter(Playlist.id.in_(ids["playlist"])).all() if ids["playlist"] else []
+    tags = Tag.query.filter(Tag.id.in_(ids["tag"])).all() if ids["tag"] else []
+    members = _members([p.id for p in playlists]) if playlists else {}
+
+    upsert = {
+        "audio": [a.to_dict() for a in audios],
+        "playlist": [_playlist_dict(p, members) for p in playlists],
+        "tag": [_tag_dict(t) for t in tags],
+    }
+    found = {entity: {item["id"] for item in upsert[entity]} for entity in ENTITIES}
+    return {
+        "seq": rows[-1][0] if rows else since,
+        "reset": False,
+        "more": more,
+        "upsert": upsert,
+        "delete": {entity: sorted(ids[entity] - found[entity]) for entity in ENTITIES},
+    }
+
+
+# ---------------------------------------------------------------------------
+# Compaction (tâche de maintenance, connexion sqlite3 dédiée)
+# ---------------------------------------------------------------------------
+
+def compact_change_log(ctx, retention: float) -> dict:
+    """Efface les traces d'entités supprimées depuis plus de `retention` secondes."""
+    conn = ctx.conn
+    tombstones = (
+        "changed_at < ? AND ("
+        " (entity = 'audio' AND entity_id NOT IN (SELECT id FROM audio))"
+        " OR (entity = 'playlist' AND entity_id NOT IN (SELECT id FROM playlist))"
+        " OR (entity = 'tag' AND entity_id NOT IN (SELECT id FROM tag)))"
+    )
+    cutoff = time.time() - retention
+    horizon = conn.execute(f"SELECT MAX(seq) FROM change_log WHERE {tombstones}", (cutoff,)).fetchone()[0]
+    if horizon is None:
+        return {"removed": 0}
+    ctx.check()
+    removed = conn.execute(f"DELETE FROM change_log WHERE seq <= ? AND {tombstones}", (horizon, cutoff)).rowcount
+    conn.execute(
+        "INSERT INTO change_log_meta (name, value) VALUES ('min_seq', ?)"
+        " ON CONFLICT (name) DO UPDATE SET value = MAX(value, excluded.value)",
+        (horizon,),
+    )
+    conn.commit()
+    logger.info(f"Journal des modifications : {removed} suppression(s) compactée(s), min_seq={horizon}")
+    return {"removed": removed, "min_seq": horizon}
@@ -0,0 +1,168 @@
+"""
+Analyse de sonie EBU R128 et gain par piste.
+
+Chaque audio est analysé une fois par ffmpeg (filtre ebur128, décodage seul,
+aucun fichier réécrit) : sonie intégrée (LUFS) et crête échantillon. Le gain
+à appliquer est calculé pour ramener la piste à la cible (-18 LUFS par
+défaut), borné à ±12 dB et limité pour garder 1 dB de marge sous 0 dBFS.
+Le lecteur l'applique ensuite via le volume VLC.
+
+Les analyses tournent dans un pool borné de threads qui attendent chacun
+un processus ffmpeg (nice 10, un seul thread de décodage) : au plus
+`workers` processus à la fois, pour ne pas affamer la lecture.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TARGET_LUFS = -18.0
+MAX_GAIN_DB = 12.0
+PEAK_MARGIN_DB = 1.0
+_FFMPEG_TIMEOUT = 600
+
+_RE_INTEGRATED = re.compile(r"I:\s+(-?[\d.]+) LUFS")
+_RE_PEAK = re.compile(r"Peak:\s+(-?[\d.]+|-inf) dBFS")
+_RE_DURATION = re.compile(r"Duration: (\d+):(\d+):([\d.]+)")
+
+
+class LoudnessError(RuntimeError):
+    """ffmpeg n'a pas pu mesurer la sonie du fichier.
+
+    transient=True : ffmpeg absent ou trop lent, l'analyse sera retentée au
+    prochain démarrage au lieu d'enregistrer un gain neutre.
+    """
+
+    def __init__(self, message: str, transient: bool = False):
+        super().__init__(message)
+        self.transient = transient
+
+
+def analyze(path: str) -> dict:
+    """Mesure la sonie d'un fichier.
+
+    :return: {"lufs", "peak_db", "duration"} — peak_db None si silence
+    """
+    cmd = [
+        "nice", "-n", "10",
+        "ffmpeg", "-nostdin", "-hide_banner", "-nostats", "-threads", "1",
+        "-i", path, "-map", "0:a:0", "-vn", "-sn", "-dn",
+        "-af", "ebur128=peak=sample:framelog=verbose", "-f", "null", "-",
+    ]
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=_FFMPEG_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise LoudnessError(f"ffmpeg indisponible ou trop lent : {e}", transient=True)
+    if proc.returncode in (126, 127):  # nice n'a pas pu lancer ffmpeg
+        raise LoudnessError(proc.stderr.strip() or "ffmpeg introuvable", transient=True)
+    out = proc.stderr
+    integrated = _RE_INTEGRATED.findall(out)
+    if proc.returncode != 0 or not integrated:
+        raise LoudnessError(out.strip().splitlines()[-1] if out.strip() else f"code {proc.returncode}")
+    peak = _RE_PEAK.findall(out)
+    duration = _RE_DURATION.search(out)
+    return {
+        "lufs": float(integrated[-1]),
+        "peak_db": float(peak[-1]) if peak and peak[-1] != "-inf" else None,
+        "duration": (
+            int(duration[1]) * 3600 + int(duration[2]) * 60 + float(duration[3]) if duration else None
+        ),
+    }
+
+
+def compute_gain(lufs: float, peak_db: float | None, target: float = DEFAULT_TARGET_LUFS) -> float:
+    """Gain (dB) pour atteindre la cible sans saturer."""
+    if lufs <= -70:  # piste silencieuse : ebur128 renvoie -70 LUFS
+        return 0.0
+    gain = max(-MAX_GAIN_DB, min(MAX_GAIN_DB, target - lufs))
+    if peak_db is not None:
+        gain = min(gain, -PEAK_MARGIN_DB - peak_db)
+    return round(gain, 2)
+
+
+class LoudnessAnalyzer:
+    def __init__(self, store, workers: int = 2, target: float = DEFAULT_TARGET_LUFS):
+        """
+        :param store: callable(audio_id, lufs | None, gain_db) appelé depuis le
+            pool à la fin de chaque analyse (None = mesure impossible, gain 0)
+        :param workers: nombre maximal de processus ffmpeg simultanés
+        """
+        self._store = store
+        self._target = target
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="loudness")
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._pending: set[int] = set()
+        self._stats = {"analyzed": 0, "failed": 0, "busy_seconds": 0.0, "audio_seconds": 0.0}
+        self._first_start: float | None = None
+        self._last_end: float | None = None
+
+    def submit(self, audio_id: int, path: str):
+        """Planifie l'analyse d'un audio (ignorée s'il est déjà en file)."""
+        with self._lock:
+            if audio_id in self._pending:
+                return
+            self._pending.add(audio_id)
+        self._executor.submit(self._analyze, audio_id, path)
+
+    def backfill(self, items: list[tuple[int, str]]):
+        for audio_id, path in items:
+            self.submit(audio_id, path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            pending = len(self._pending)
+            wall = (self._last_end - self._first_start) if self._first_start and self._last_end else 0
+        return {
+            "workers": self._workers,
+            "target_lufs": self._target,
+            "pending": pending,
+            "analyzed": s["analyzed"],
+            "failed": s["failed"],
+            # Débit réel du pool (parallélisme compris) depuis la première analyse
+            "tracks_per_min": round(s["analyzed"] / wall * 60, 1) if wall and s["analyzed"] else None,
+            # Vitesse d'analyse par rapport à la durée des pistes (x temps réel)
+            "realtime_factor": (
+                round(s["audio_seconds"] / s["busy_seconds"], 1) if s["audio_seconds"] else None
+            ),
+        }
+
+    def _analyze(self, audio_id: int, path: str):
+        start = time.monotonic()
+        with self._lock:
+            if self._first_start is None:
+                self._first_start = start
+        transient = False
+        try:
+            result = analyze(path)
+        except LoudnessError as e:
+            logger.warning(f"Sonie : analyse impossible pour {path} : {e}")
+            result, transient = None, e.transient
+        elapsed = time.monotonic() - start
+
+        try:
+            if result is None:
+                if not transient:
+                    self._store(audio_id, None, 0.0)
+            else:
+                gain = compute_gain(result["lufs"], result["peak_db"], self._target)
+                self._store(audio_id, result["lufs"], gain)
+                logger.info(f"Sonie : {path} → {result['lufs']} LUFS, gain {gain:+.1f} dB ({elapsed:.1f} s)")
+        except Exception as e:
+            logger.error(f"Sonie : enregistrement impossible pour l'audio {audio_id} : {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(audio_id)
+                self._last_end = time.monotonic()
+                self._stats["analyzed" if result else "failed"] += 1
+                self._stats["busy_seconds"] += elapsed
+                if result and result["duration"]:
+                    self._stats["audio_seconds"] += result["duration"]
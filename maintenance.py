@@ -0,0 +1,339 @@
+"""
+Maintenance de fond pendant les périodes calmes.
+
+Le planificateur (thread unique, nice 19) attend qu'il n'y ait ni lecture
+en cours ni requête HTTP depuis `idle_seconds`, au plus une fois toutes les
+`period` secondes, puis enchaîne les tâches :
+
+  - gc_rows       : lignes orphelines de playlist_audio, tags pointant vers
+                    un audio / une playlist disparus (ou vers rien) ;
+  - gc_files      : fichiers partiels laissés dans uploads/ (.part, .ytdl,
+                    .webm non référencé, .import-*.part) ;
+  - vacuum        : VACUUM incrémental par paquets de pages (passage unique
+                    en auto_vacuum=INCREMENTAL la première fois) ;
+  - integrity     : PRAGMA integrity_check.
+
+D'autres modules peuvent ajouter leurs tâches avec add_task().
+
+Les tâches utilisent leur propre connexion sqlite3 : interrupt() (appelé à
+chaque scan de tag et requête HTTP) interrompt la requête SQL en cours
+(sqlite3.Connection.interrupt) et la tâche s'arrête à sa prochaine
+vérification. La série reprend à la période calme suivante ; les tâches
+sont idempotentes. Une série en erreur (ex: base verrouillée) n'est
+retentée qu'après _FAILURE_BACKOFF.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Pages libérées par appel à incremental_vacuum : rend la main souvent
+_VACUUM_STEP_PAGES = 256
+_CHECK_INTERVAL = 30
+# Après une série en erreur (ex: base verrouillée), délai avant de réessayer
+_FAILURE_BACKOFF = 3600
+# Un fichier partiel plus récent peut appartenir à un téléchargement en cours
+_STRAY_GRACE = 3600
+# Restes de yt-dlp (x.webm.part, x.f251.webm, x.part-Frag3, x.temp.mp3…) et
+# d'imports d'archive interrompus (.import-x.part)
+_STRAY_MARKERS = (".part", ".ytdl", ".temp.")
+_STRAY_SUFFIXES = (".webm",)
+_STRAY_PREFIXES = (".import-",)
+
+
+def _is_stray(name: str) -> bool:
+    return (
+        name.startswith(_STRAY_PREFIXES)
+        or name.endswith(_STRAY_SUFFIXES)
+        or any(marker in name for marker in _STRAY_MARKERS)
+    )
+
+
+class Interrupted(Exception):
+    """Activité détectée : la tâche en cours doit rendre la main."""
+
+
+class MaintenanceContext:
+    """Passé à chaque tâche : connexion SQLite dédiée et point de contrôle."""
+
+    def __init__(self, scheduler: "MaintenanceScheduler", conn: sqlite3.Connection):
+        self._scheduler = scheduler
+        self.conn = conn
+
+    def check(self):
+        """Lève Interrupted si une activité est apparue depuis le début de la série."""
+        scheduler = self._scheduler
+        if scheduler._interrupt.is_set() or scheduler._last_activity > scheduler._series_started:
+            raise Interrupted()
+
+
+class MaintenanceScheduler:
+    def __init__(
+        self,
+        db_path: Path,
+        upload_folder: Path,
+        is_busy=None,
+        idle_seconds: float = 900,
+        period: float = 24 * 3600,
+        hours: tuple[int, int] | None = None,
+    ):
+        """
+        :param is_busy: callable() → True si une lecture ou un téléchargement est en cours
+        :param idle_seconds: durée sans activité HTTP ni scan avant de démarrer
+        :param period: intervalle minimal entre deux séries complètes
+        :param hours: plage horaire autorisée (début, fin) incluses, ex. (2, 5)
+        """
+        self._db_path = Path(db_path)
+        self._upload_folder = Path(upload_folder)
+        self._is_busy = is_busy or (lambda: False)
+        self._idle_seconds = idle_seconds
+        self._period = period
+        self._hours = hours
+        self._tasks: list[tuple[str, object]] = [
+            ("gc_rows", gc_orphan_rows),
+            ("gc_files", lambda ctx: gc_stray_files(ctx, self._upload_folder)),
+            ("vacuum", incremental_vacuum),
+            ("integrity", integrity_check),
+        ]
+        self._lock = threading.Lock()
+        self._interrupt = threading.Event()
+        self._wake = threading.Event()
+        self._forced = False
+        self._conn: sqlite3.Connection | None = None
+        self._last_activity = time.monotonic()
+        self._last_complete: float | None = None
+        self._last_failure: float | None = None
+        self._series_started = 0.0  # time.monotonic() du début de la série en cours
+        self._running: str | None = None
+        self._report: dict | None = None
+        self._thread: threading.Thread | None = None
+
+    def add_task(self, name: str, fn):
+        """Ajoute une tâche fn(ctx) -> dict (exécutée avant integrity_check)."""
+        self._tasks.insert(len(self._tasks) - 1, (name, fn))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="maintenance")
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Signaux d'activité
+    # ------------------------------------------------------------------
+
+    def touch(self):
+        """Activité utilisateur (requête HTTP) : repousse la prochaine série."""
+        self._last_activity = time.monotonic()
+
+    def interrupt(self):
+        """Rend la main immédiatement (scan de tag, requête HTTP)."""
+        self._last_activity = time.monotonic()
+        if self._running is None:
+            return
+        self._interrupt.set()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.interrupt()
+
+    def run_now(self):
+        """Lance une série dès que possible, sans attendre la période calme."""
+        self._forced = True
+        self._wake.set()
+
+    def status(self) -> dict:
+        return {
+            "running": self._running,
+            "idle_for": round(time.monotonic() - self._last_activity),
+            "idle_seconds": self._idle_seconds,
+            "hours": self._hours,
+            "last_complete": self._last_complete,
+            "last_failure": self._last_failure,
+            "tasks": [name for name, _ in self._tasks],
+            "last_report": self._report,
+        }
+
+    # ------------------------------------------------------------------
+    # Thread
+    # ------------------------------------------------------------------
+
+    def _due(self) -> bool:
+        if self._forced:
+            return not self._is_busy()
+        if self._last_complete is not None and time.time() - self._last_complete < self._period:
+            return False
+        if self._last_failure is not None and time.time() - self._last_failure < _FAILURE_BACKOFF:
+            return False
+        if self._hours is not None:
+            start, end = self._hours
+            hour = time.localtime().tm_hour
+            inside = start <= hour <= end if start <= end else (hour >= start or hour <= end)
+            if not inside:
+                return False
+        if time.monotonic() - self._last_activity < self._idle_seconds:
+            return False
+        return not self._is_busy()
+
+    def _run(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            self._wake.wait(_CHECK_INTERVAL)
+            self._wake.clear()
+            checked_at = time.monotonic()
+            if self._due():
+                self._forced = False
+                try:
+                    self._run_series(checked_at)
+                except Exception as e:
+                    # Pas de nouvel essai à chaque réveil (toutes les 30 s)
+                    self._last_failure = time.time()
+                    logger.error(
+                        f"Maintenance : erreur inattendue : {e} — "
+                        f"nouvel essai dans {_FAILURE_BACKOFF // 60} min"
+                    )
+
+    def _run_series(self, checked_at: float):
+        """:param checked_at: time.monotonic() juste avant _due()
+
+        Une activité postérieure à checked_at interrompt la série : un scan
+        arrivé avant que _running soit posé (interrupt() sans effet) est vu
+        par check() avant la première tâche.
+        """
+        self._series_started = checked_at
+        self._running = "starting"
+        self._interrupt.clear()
+        started = time.time()
+        report = {"started": started, "tasks": {}, "interrupted": None, "reclaimed_bytes": 0}
+        try:
+            conn = sqlite3.connect(self._db_path, timeout=5, check_same_thread=False)
+        except sqlite3.Error:
+            self._running = None
+            raise
+        with self._lock:
+            self._conn = conn
+        ctx = MaintenanceContext(self, conn)
+        try:
+            ctx.check()
+            for name, fn in self._tasks:
+                self._running = name
+                ctx.check()
+                task_start = time.perf_counter()
+                result = fn(ctx) or {}
+                result["seconds"] = round(time.perf_counter() - task_start, 3)
+                report["tasks"][name] = result
+                report["reclaimed_bytes"] += result.get("reclaimed_bytes", 0)
+        except (Interrupted, sqlite3.OperationalError) as e:
+            if isinstance(e, sqlite3.OperationalError) and not self._interrupt.is_set():
+                raise
+            conn.rollback()
+            report["interrupted"] = self._running
+            logger.info(f"Maintenance interrompue pendant '{self._running}' (activité détectée)")
+        finally:
+            with self._lock:
+                self._conn = None
+            conn.close()
+            self._running = None
+
+        report["seconds"] = round(time.time() - started, 3)
+        self._report = report
+        if report["interrupted"] is None:
+            self._last_complete = time.time()
+            self._last_failure = None
+            logger.info(
+                f"Maintenance terminée en {report['seconds']} s : "
+                f"{report['reclaimed_bytes'] // 1024} Ko récupérés"
+            )
+
+
+# ---------------------------------------------------------------------------
+# Tâches
+# ---------------------------------------------------------------------------
+
+def gc_orphan_rows(ctx: MaintenanceContext) -> dict:
+    """Supprime les associations qui pointent vers des lignes disparues."""
+    conn = ctx.conn
+    members = conn.execute(
+        "DELETE FROM playlist_audio"
+        " WHERE audio_id NOT IN (SELECT id FROM audio)"
+        " OR playlist_id NOT IN (SELECT id FROM playlist)"
+    ).rowcount
+    ctx.check()
+    tags = conn.execute(
+        "DELETE FROM tag"
+        " WHERE (audio_id IS NOT NULL AND audio_id NOT IN (SELECT id FROM audio))"
+        " OR (playlist_id IS NOT NULL AND playlist_id NOT IN (SELECT id FROM playlist))"
+        " OR (audio_id IS NULL AND playlist_id IS NULL)"
+    ).rowcount
+    conn.commit()
+    if members or tags:
+        logger.info(f"Maintenance : {members} piste(s) de playlist et {tags} tag(s) orphelins supprimés")
+    return {"playlist_rows": members, "tags": tags}
+
+
+def gc_stray_files(ctx: MaintenanceContext, upload_folder: Path) -> dict:
+    """Supprime les fichiers partiels non référencés de plus d'une heure."""
+    known = {os.path.basename(row[0]) for row in ctx.conn.execute("SELECT file_path FROM audio")}
+    now = time.time()
+    removed, reclaimed = [], 0
+    for entry in os.scandir(upload_folder):
+        ctx.check()
+        if not entry.is_file() or entry.name in known:
+            continue
+        if not _is_stray(entry.name):
+            continue
+        st = entry.stat()
+        if now - st.st_mtime < _STRAY_GRACE:
+            continue
+        try:
+            os.unlink(entry.path)
+        except OSError as e:
+            logger.warning(f"Maintenance : impossible de supprimer {entry.name} : {e}")
+            continue
+        removed.append(entry.name)
+        reclaimed += st.st_size
+    if removed:
+        logger.info(f"Maintenance : {len(removed)} fichier(s) partiel(s) supprimé(s) : {removed}")
+    return {"files": removed, "reclaimed_bytes": reclaimed}
+
+
+def incremental_vacuum(ctx: MaintenanceContext) -> dict:
+    """Rend au système les pages libres de la base, par petits paquets."""
+    conn = ctx.conn
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    size_before = conn.execute("PRAGMA page_count").fetchone()[0] * page_size
+    converted = False
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        # Une seule fois : le mode incrémental n'existe qu'après un VACUUM complet
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        converted = True
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    while free > 0:
+        ctx.check()
+        conn.execute(f"PRAGMA incremental_vacuum({_VACUUM_STEP_PAGES})").fetchall()
+        remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if remaining >= free:
+            break
+        free = remaining
+    size_after = conn.execute("PRAGMA page_count").fetchone()[0] * page_size
+    return {
+        "converted_to_incremental": converted,
+        "size_bytes": size_after,
+        "reclaimed_bytes": max(0, size_before - size_after),
+    }
+
+
+def integrity_check(ctx: MaintenanceContext) -> dict:
+    rows = [r[0] for r in ctx.conn.execute("PRAGMA integrity_check(20)")]
+    ok = rows == ["ok"]
+    if not ok:
+        logger.error(f"Maintenance : base corrompue : {rows}")
+    return {"ok": ok, "errors": [] if ok else rows}
@@ -0,0 +1,151 @@
+"""
+Rapport mémoire du worker (/api/debug/memory).
+
+Trois vues complémentaires :
+  - native  : RSS par bibliothèque partagée / zone, lu dans /proc/self/smaps
+              (libvlc et ses plugins, SQLite, interpréteur, tas, anonyme…).
+              C'est la seule vue qui voit la mémoire de libvlc.
+  - python  : allocations Python par sous-système (flask, sqlalchemy, yt_dlp,
+              application…) via tracemalloc. Coûteux : désactivé par défaut,
+              activé par JUKEBOX_TRACEMALLOC=1 ou à la demande.
+  - modules : nombre de modules importés par paquet (yt_dlp chargé ou non).
+"""
+
+from __future__ import annotations
+
+import sys
+import tracemalloc
+from pathlib import Path
+
+_PROJECT_DIR = Path(__file__).resolve().parent
+
+# Sous-systèmes reconnus dans /proc/self/smaps (ordre = priorité)
+_NATIVE_GROUPS = (
+    ("vlc", ("libvlc", "/vlc/")),
+    ("sqlite", ("sqlite",)),
+    ("python", ("python3", "libpython", "lib-dynload")),
+    ("ssl", ("libssl", "libcrypto")),
+    ("libc", ("libc.so", "libc-", "ld-linux", "libm.so", "libstdc++")),
+)
+
+
+def _read_status() -> dict:
+    """VmRSS / VmHWM / VmSwap depuis /proc/self/status, en Ko."""
+    values = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("VmRSS", "VmHWM", "VmSwap"):
+                    values[key] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values
+
+
+def _native_group(pathname: str) -> str:
+    if not pathname:
+        return "anonymous"
+    if pathname == "[heap]":
+        return "heap"
+    if pathname.startswith("[stack"):
+        return "stack"
+    if pathname.startswith("["):
+        return "kernel"
+    for group, needles in _NATIVE_GROUPS:
+        if any(n in pathname for n in needles):
+            return group
+    if pathname.endswith(".so") or ".so." in pathname:
+        return "other_libs"
+    return "files"
+
+
+def native_breakdown() -> dict[str, int]:
+    """RSS (Ko) par sous-système natif, à partir de /proc/self/smaps."""
+    totals: dict[str, int] = {}
+    group = "anonymous"
+    try:
+        with open("/proc/self/smaps") as f:
+            for line in f:
+                first = line.split(None, 5)
+                if not first:
+                    continue
+                if "-" in first[0] and not first[0].endswith(":"):
+                    # Ligne d'en-tête de mapping : adresse perms offset dev inode [chemin]
+                    group = _native_group(first[5].strip() if len(first) > 5 else "")
+                elif first[0] == "Rss:":
+                    totals[group] = totals.get(group, 0) + int(first[1])
+    except OSError:
+        return {}
+    return dict(sorted(totals.items(), key=lambda kv: -kv[1]))
+
+
+def _python_group(filename: str) -> str:
+    path = Path(filename)
+    parts = path.parts
+    for marker in ("site-packages", "dist-packages"):
+        if marker in parts:
+            idx = parts.index(marker)
+            if idx + 1 < len(parts):
+                return parts[idx + 1].split(".")[0].lower()
+    try:
+        path.resolve().relative_to(_PROJECT_DIR)
+        return "app"
+    except (ValueError, OSError):
+        pass
+    if filename.startswith("<"):
+        return "interpreter"
+    return "stdlib"
+
+
+def start_tracing(frames: int = 1):
+    """Active tracemalloc (surcoût CPU et mémoire non négligeable sur Pi)."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def stop_tracing():
+    tracemalloc.stop()
+
+
+def python_breakdown(top: int = 15) -> dict | None:
+    """Allocations Python (Ko) par sous-système, ou None si tracemalloc est inactif."""
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot()
+    totals: dict[str, int] = {}
+    for stat in snapshot.statistics("filename"):
+        group = _python_group(stat.traceback[0].filename)
+        totals[group] = totals.get(group, 0) + stat.size
+    current, peak = tracemalloc.get_traced_memory()
+    groups = sorted(totals.items(), key=lambda kv: -kv[1])[:top]
+    return {
+        "traced_kb": current // 1024,
+        "peak_kb": peak // 1024,
+        "subsystems_kb": {name: size // 1024 for name, size in groups},
+    }
+
+
+def module_counts() -> dict[str, int]:
+    """Nombre de modules importés par paquet de premier niveau."""
+    counts: dict[str, int] = {}
+    for name in list(sys.modules):
+        top = name.split(".")[0]
+        counts[top] = counts.get(top, 0) + 1
+    return dict(sorted(counts.items(), key=lambda kv: -kv[1])[:20])
+
+
+def report(caches: dict | None = None) -> dict:
+    """Rapport complet. `caches` : tailles des caches applicatifs à inclure."""
+    status = _read_status()
+    return {
+        "rss_kb": status.get("VmRSS"),
+        "peak_rss_kb": status.get("VmHWM"),
+        "swap_kb": status.get("VmSwap"),
+        "native_kb": native_breakdown(),
+        "python": python_breakdown(),
+        "modules": module_counts(),
+        "yt_dlp_loaded": "yt_dlp" in sys.modules,
+        "vlc_loaded": "vlc" in sys.modules,
+        "caches": caches or {},
+    }
@@ -3,10 +3,12 @@ from flask_sqlalchemy import SQLAlchemy
 db = SQLAlchemy()
 
 # Table d'association Many-to-Many Playlist <-> Audio
+# 'position' fixe l'ordre des pistes dans la playlist (0 = première).
 playlist_audio = db.Table(
     "playlist_audio",
     db.Column("playlist_id", db.Integer, db.ForeignKey("playlist.id"), primary_key=True),
     db.Column("audio_id", db.Integer, db.ForeignKey("audio.id"), primary_key=True),
+    db.Column("position", db.Integer, nullable=False, default=0, server_default="0"),
 )
 
 
@@ -16,9 +18,19 @@ class Audio(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     file_path = db.Column(db.String(500), nullable=False, unique=True)
+    # Sonie EBU R128 mesurée (None = pas encore analysé ou mesure impossible)
+    # et gain à appliquer à la lecture (None = pas encore analysé)
+    loudness_lufs = db.Column(db.Float, nullable=True)
+    gain_db = db.Column(db.Float, nullable=True)
 
     def to_dict(self):
-        return {"id": self.id, "name": self.name, "file_path": self.file_path}
+        return {
+            "id": self.id,
+            "name": self.name,
+            "file_path": self.file_path,
+            "loudness_lufs": self.loudness_lufs,
+            "gain_db": self.gain_db,
+        }
 
 
 class Playlist(db.Model):
@@ -26,12 +38,23 @@ class Playlist(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
-    audios = db.relationship("Audio", secondary=playlist_audio, backref="playlists", lazy="select")
+    # Modes de lecture appliqués par le lecteur (ordre aléatoire, en boucle)
+    shuffle = db.Column(db.Boolean, nullable=False, default=False, server_default="0")
+    repeat = db.Column(db.Boolean, nullable=False, default=False, server_default="0")
+    audios = db.relationship(
+        "Audio",
+        secondary=playlist_audio,
+        backref="playlists",
+        lazy="select",
+        order_by=[playlist_audio.c.position, playlist_audio.c.audio_id],
+    )
 
     def to_dict(self):
         return {
             "id": self.id,
             "name": self.name,
+            "shuffle": self.shuffle,
+            "repeat": self.repeat,
             "audios": [a.to_dict() for a in self.audios],
         }
 
@@ -56,3 +79,79 @@ class Tag(db.Model):
             "label": self.audio.name if self.audio else (self.playlist.name if self.playlist else None),
             "type": "audio" if self.audio_id else ("playlist" if self.playlist_id else None),
         }
+
+
+# ---------------------------------------------------------------------------
+# Historique d'écoute (écrit par lots par play_history.py)
+# ---------------------------------------------------------------------------
+
+# Événements bruts : scan de tag, début de piste, piste passée. Pas de clé
+# étrangère : l'historique survit à la suppression d'un audio ou d'un tag.
+play_event = db.Table(
+    "play_event",
+    db.Column("id", db.Integer, primary_key=True),
+    db.Column("ts", db.Float, nullable=False, index=True),
+    db.Column("kind", db.String(8), nullable=False),
+    db.Column("rfid_id", db.String(100), nullable=True),
+    db.Column("audio_id", db.Integer, nullable=True),
+    db.Column("media", db.String(500), nullable=True),
+    db.Column("position_ms", db.Integer, nullable=True),
+)
+
+# Compteurs agrégés, mis à jour dans la même transaction que les événements
+tag_stats = db.Table(
+    "tag_stats",
+    db.Column("rfid_id", db.String(100), primary_key=True),
+    db.Column("scans", db.Integer, nullable=False, default=0),
+    db.Column("last_scan", db.Float, nullable=True),
+)
+
+audio_stats = db.Table(
+    "audio_stats",
+    db.Column("audio_id", db.Integer, primary_key=True),
+    db.Column("starts", db.Integer, nullable=False, default=0),
+    db.Column("skips", db.Integer, nullable=False, default=0),
+    db.Column("last_start", db.Float, nullable=True),
+)
+
+
+# ---------------------------------------------------------------------------
+# Schéma — migrations légères
+# ---------------------------------------------------------------------------
+
+# db.create_all() ne modifie pas les tables existantes : les colonnes ajoutées
+# après coup sont listées ici et créées par ALTER TABLE au démarrage.
+# (table, colonne, définition SQL)
+_COLUMN_MIGRATIONS = [
+    ("playlist_audio", "position", "INTEGER NOT NULL DEFAULT 0"),
+    ("playlist", "shuffle", "BOOLEAN NOT NULL DEFAULT 0"),
+    ("playlist", "repeat", "BOOLEAN NOT NULL DEFAULT 0"),
+    ("audio", "loudness_lufs", "FLOAT"),
+    ("audio", "gain_db", "FLOAT"),
+]
+
+
+def ensure_schema():
+    """Ajoute les colonnes manquantes aux tables existantes (SQLite)."""
+    inspector = db.inspect(db.engine)
+    for table, column, ddl in _COLUMN_MIGRATIONS:
+        existing = {c["name"] for c in inspector.get_columns(table)}
+        if column not in existing:
+            db.session.execute(db.text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    db.session.commit()
+
+
+def set_playlist_order(playlist_id: int, audio_ids: list[int]):
+    """Enregistre l'ordre des pistes d'une playlist (une seule requête executemany).
+
+    Les lignes playlist_audio doivent déjà exister (flush préalable).
+    """
+    if not audio_ids:
+        return
+    db.session.execute(
+        playlist_audio.update()
+        .where(playlist_audio.c.playlist_id == db.bindparam("pid"))
+        .where(playlist_audio.c.audio_id == db.bindparam("aid"))
+        .values(position=db.bindparam("pos")),
+        [{"pid": playlist_id, "aid": aid, "pos": pos} for pos, aid in enumerate(audio_ids)],
+    )
@@ -0,0 +1,358 @@
+"""
+Lecteur léger sans libvlc : un décodeur ffmpeg par piste dont le PCM est
+envoyé à aplay (ALSA) par un pipe du noyau — aucun échantillon ne transite
+par Python, et le worker ne charge ni libvlc ni ses plugins.
+
+    ffmpeg -ss <début> -i piste.mp3 -af volume=<gain>dB -f s16le - | aplay -t raw -D $AUDIODEV
+
+Même interface publique que player.Player (play_file, play_playlist,
+pause, stop, next/prev, get_state, snapshot…), choisie par
+JUKEBOX_AUDIO_BACKEND (voir player.create_player).
+
+Fonctionnement :
+  - Les playlists sont jouées piste par piste : quand le décodeur et aplay
+    se terminent, le thread de surveillance lance la piste suivante de
+    l'ordre (_track_order, aléatoire / en boucle comme avec VLC). Un court
+    silence (démarrage d'aplay) sépare deux pistes.
+  - Pause : SIGSTOP sur les deux processus, reprise : SIGCONT.
+  - Position : horloge murale depuis le début de la piste, pauses exclues.
+    Durée : lue dans l'en-tête affiché par ffmpeg ("Duration: …").
+  - Le gain de sonie est appliqué au décodage (filtre volume).
+
+Puits (sink) :
+  - "alsa"          : aplay sur $AUDIODEV (par défaut "default") ;
+  - "null"          : PCM jeté (/dev/null) au rythme réel (-re) — tests ;
+  - "file:<chemin>" : PCM brut s16le 44,1 kHz stéréo de la piste en cours
+                      écrit dans un fichier, au rythme réel.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+
+from player import _track_order
+
+logger = logging.getLogger(__name__)
+
+_RATE = 44100
+_CHANNELS = 2
+_RE_DURATION = re.compile(r"Duration: (\d+):(\d+):([\d.]+)")
+# Pistes gardées pour « précédent » : une playlist en boucle tourne des jours
+_HISTORY_MAX = 100
+
+
+class PipePlayer:
+    def __init__(self, sink: str = "alsa", resolve_path=None, gain_for=None, on_track_start=None,
+                 device: str | None = None):
+        """
+        :param sink: "alsa", "null" ou "file:<chemin>" (voir en tête du module)
+        :param resolve_path, gain_for, on_track_start: comme pour player.Player
+        :param device: périphérique ALSA (défaut : $AUDIODEV, sinon "default")
+        """
+        if sink not in ("alsa", "null") and not sink.startswith("file:"):
+            raise ValueError(f"Sortie audio inconnue : {sink}")
+        self._sink = sink
+        self._device = device or os.environ.get("AUDIODEV") or "default"
+        self._resolve = resolve_path or (lambda path: path)
+        self._gain_for = gain_for
+        self._on_track_start = on_track_start
+        self._lock = threading.Lock()
+        # Incrémenté à chaque changement de piste ou arrêt : le thread de
+        # surveillance d'un processus remplacé ne lance rien
+        self._generation = 0
+        self._procs: list[subprocess.Popen] = []
+        self._state = "NothingSpecial"
+        self._media: str | None = None
+        self._queued: frozenset[str] = frozenset()  # chemin résolu en lecture
+        self._gain_db = 0.0
+        self._duration_ms = 0
+        self._offset_ms = 0
+        self._started_at = 0.0
+        self._paused_at: float | None = None
+        self._order = None
+        self._total = 0
+        self._history: deque[str] = deque(maxlen=_HISTORY_MAX)  # pistes jouées (piste précédente)
+        self._forward: list[str] = []   # pistes à rejouer après un « précédent »
+        self._current_playlist: list[str] = []
+        logger.info(f"Lecteur ffmpeg initialisé (sortie {sink}{' ' + self._device if sink == 'alsa' else ''})")
+
+    # ------------------------------------------------------------------
+    # Lecture
+    # ------------------------------------------------------------------
+
+    def play_file(self, file_path: str, start_ms: int = 0) -> bool:
+        """Lance la lecture d'un fichier audio unique (à start_ms si > 0)."""
+        if not os.path.isfile(file_path):
+            logger.error(f"Fichier introuvable : {file_path}")
+            return False
+        with self._lock:
+            self._order, self._total = None, 1
+            self._history.clear()
+            self._forward.clear()
+            self._current_playlist = [file_path]
+            return self._start(file_path, start_ms)
+
+    def play_playlist(
+        self,
+        file_paths: list[str],
+        shuffle: bool = False,
+        repeat: bool = False,
+        start_index: int | None = None,
+        start_ms: int = 0,
+    ) -> bool:
+        """Lance la lecture d'une liste de fichiers audio (voir player.Player.play_playlist)."""
+        if not file_paths:
+            logger.error("Playlist vide")
+            return False
+
+        if start_index is not None and not 0 <= start_index < len(file_paths):
+            start_index = None
+        order = _track_order(file_paths, shuffle, repeat, start_index)
+        first = None
+        for _, path in zip(file_paths, order):
+            if os.path.isfile(path):
+                first = path
+                break
+            logger.warning(f"Playlist : fichier introuvable ignoré : {path}")
+        if first is None:
+            logger.error("Aucun fichier valide dans la playlist")
+            return False
+
+        with self._lock:
+            self._order, self._total = order, len(file_paths)
+            self._history.clear()
+            self._forward.clear()
+            self._current_playlist = list(file_paths)
+            offset = start_ms if start_index is not None and first == file_paths[start_index] else 0
+            started = self._start(first, offset)
+        if started:
+            logger.info(
+                f"Playlist lancée : {len(file_paths)} pistes"
+                f"{' (aléatoire)' if shuffle else ''}{' (en boucle)' if repeat else ''}"
+            )
+        return started
+
+    def _commands(self, path: str, start_ms: int, gain: float) -> list[list[str]]:
+        decoder = ["ffmpeg", "-nostdin", "-hide_banner", "-nostats", "-v", "info"]
+        if self._sink != "alsa":
+            decoder.append("-re")  # rythme réel : sans carte son pour le cadencer
+        if start_ms > 0:
+            decoder += ["-ss", f"{start_ms / 1000:.3f}"]
+        decoder += ["-i", path, "-map", "0:a:0", "-vn"]
+        if gain:
+            decoder += ["-af", f"volume={gain:.2f}dB"]
+        decoder += ["-f", "s16le", "-ac", str(_CHANNELS), "-ar", str(_RATE)]
+        if self._sink == "null":
+            return [decoder + ["-y", os.devnull]]
+        if self._sink.startswith("file:"):
+            return [decoder + ["-y", self._sink[len("file:"):]]]
+        sink = ["aplay", "-q", "-t", "raw", "-f", "S16_LE", "-c", str(_CHANNELS), "-r", str(_RATE),
+                "-D", self._device]
+        return [decoder + ["-"], sink]
+
+    def _start(self, file_path: str, start_ms: int = 0) -> bool:
+        """Lance les processus d'une piste (verrou tenu)."""
+        self._generation += 1
+        generation = self._generation
+        self._kill()
+
+        name = os.path.basename(file_path)
+        gain = (self._gain_for(name) or 0.0) if self._gain_for else 0.0
+        path = self._resolve(file_path)
+        commands = self._commands(path, start_ms, gain)
+        decoder = None
+        try:
+            decoder = subprocess.Popen(
+                commands[0],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE if len(commands) > 1 else subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+                errors="replace",
+            )
+            procs = [decoder]
+            if len(commands) > 1:
+                try:
+                    procs.append(subprocess.Popen(commands[1], stdin=decoder.stdout, stderr=subprocess.DEVNULL))
+                finally:
+                    decoder.stdout.close()  # aplay est le seul lecteur du pipe
+        except OSError as e:
+            if decoder is not None:
+                decoder.kill()
+            logger.error(f"Impossible de lancer la lecture ({commands[-1][0]}) : {e}")
+            self._state = "Error"
+            return False
+
+        self._procs = procs
+        self._state = "Playing"
+        self._media = name
+        self._queued = frozenset({path})
+        self._gain_db = gain
+        self._duration_ms = 0
+        self._offset_ms = start_ms
+        self._started_at = time.monotonic()
+        self._paused_at = None
+        self._history.append(file_path)
+        logger.info(f"Lecture : {file_path}")
+        if self._on_track_start is not None:
+            self._on_track_start(name)
+        threading.Thread(
+            target=self._watch, args=(generation, procs), daemon=True, name="pipe-player"
+        ).start()
+        return True
+
+    def _watch(self, generation: int, procs: list[subprocess.Popen]):
+        """Lit l'en-tête de ffmpeg (durée), attend la fin de la piste, enchaîne."""
+        decoder = procs[0]
+        errors: list[str] = []
+        for line in decoder.stderr:
+            match = _RE_DURATION.search(line)
+            if match and not self._duration_ms:
+                h, m, s = match.groups()
+                with self._lock:
+                    if generation == self._generation:
+                        self._duration_ms = int((int(h) * 3600 + int(m) * 60 + float(s)) * 1000)
+            elif "rror" in line:
+                errors.append(line.strip())
+        for proc in procs:
+            proc.wait()
+
+        with self._lock:
+            if generation != self._generation:
+                return  # remplacé (stop, piste suivante, nouvelle lecture)
+            if decoder.returncode != 0:
+                logger.error(f"Décodage impossible de {self._media} : {errors[-1] if errors else decoder.returncode}")
+            self._advance()
+
+    def _advance(self):
+        """Piste suivante de la playlist, ou fin de lecture (verrou tenu)."""
+        path = self._next_path()
+        if path is None or not self._start(path):
+            self._procs = []
+            self._state = "Ended"
+
+    def _next_path(self) -> str | None:
+        if self._forward:
+            return self._forward.pop()
+        if self._order is None:
+            return None
+        misses = 0
+        for path in self._order:
+            if os.path.isfile(path):
+                return path
+            logger.warning(f"Playlist : fichier introuvable ignoré : {path}")
+            misses += 1
+            if misses >= self._total:
+                break  # plus aucun fichier lisible (mode repeat)
+        return None
+
+    def _kill(self):
+        for proc in self._procs:
+            if proc.poll() is None:
+                proc.kill()  # SIGKILL : fonctionne aussi sur un processus suspendu
+        self._procs = []
+
+    # ------------------------------------------------------------------
+    # Contrôles
+    # ------------------------------------------------------------------
+
+    def pause(self):
+        """Basculer pause / reprise."""
+        with self._lock:
+            self._set_pause(self._state == "Playing")
+
+    def set_pause(self, paused: bool):
+        """Met en pause (True) ou reprend (False) — sans effet si déjà dans cet état."""
+        with self._lock:
+            self._set_pause(paused)
+
+    def _set_pause(self, paused: bool):
+        if paused and self._state == "Playing":
+            self._signal(signal.SIGSTOP)
+            self._paused_at = time.monotonic()
+            self._state = "Paused"
+        elif not paused and self._state == "Paused":
+            self._signal(signal.SIGCONT)
+            self._started_at += time.monotonic() - self._paused_at
+            self._paused_at = None
+            self._state = "Playing"
+
+    def _signal(self, sig: int):
+        for proc in self._procs:
+            if proc.poll() is None:
+                proc.send_signal(sig)
+
+    def stop(self):
+        """Arrêter toute lecture."""
+        with self._lock:
+            self._generation += 1
+            self._kill()
+            self._order = None
+            self._current_playlist = []
+            self._queued = frozenset()
+            self._state = "Stopped"
+
+    def next_track(self):
+        """Piste suivante (uniquement en mode playlist)."""
+        with self._lock:
+            if self._order is None and not self._forward:
+                return
+            path = self._next_path()
+            if path is not None:
+                self._start(path)
+
+    def prev_track(self):
+        """Piste précédente (uniquement en mode playlist)."""
+        with self._lock:
+            if len(self._history) < 2:
+                return
+            self._forward.append(self._history.pop())
+            self._start(self._history.pop())
+
+    # ------------------------------------------------------------------
+    # État
+    # ------------------------------------------------------------------
+
+    def get_state(self) -> str:
+        """Playing, Paused, Stopped, Ended, Error ou NothingSpecial (noms VLC)."""
+        return self._state
+
+    def get_current_media_name(self) -> str | None:
+        return self._media
+
+    def queued_paths(self) -> frozenset[str]:
+        """Comme pour player.Player : ici la seule piste en cours, les
+        suivantes étant résolues à leur lancement."""
+        return self._queued
+
+    @property
+    def gain_db(self) -> float:
+        """Gain de sonie appliqué à la piste en cours."""
+        return self._gain_db
+
+    def _time_ms(self) -> int:
+        if self._state not in ("Playing", "Paused"):
+            return 0
+        now = self._paused_at if self._paused_at is not None else time.monotonic()
+        elapsed = self._offset_ms + int((now - self._started_at) * 1000)
+        return min(elapsed, self._duration_ms) if self._duration_ms else elapsed
+
+    def snapshot(self) -> dict:
+        """État minimal pour le journal de reprise : état, fichier, position (ms)."""
+        return {"state": self._state, "media": self._media, "time_ms": self._time_ms()}
+
+    def get_time_info(self) -> dict:
+        """Retourne la position et la durée en secondes."""
+        time_ms = self._time_ms()
+        return {
+            "time": time_ms // 1000,
+            "duration": self._duration_ms // 1000,
+            "position": round(time_ms / self._duration_ms, 3) if self._duration_ms else 0.0,
+        }
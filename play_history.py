@@ -0,0 +1,336 @@
+"""
+Historique d'écoute : scans de tags ("scan"), débuts de piste ("start") et
+pistes passées avant la fin ("skip").
+
+Chemin critique (scan → son) :
+  - record() ajoute un tuple à un tampon circulaire en mémoire (deque bornée,
+    append atomique) : ni verrou, ni SQL, ni disque. Tampon plein → l'entrée
+    la plus ancienne est perdue et comptée dans "dropped".
+
+Écriture (thread de fond, nice 10, connexion sqlite3 dédiée) :
+  - Le tampon est vidé toutes les `flush_interval` secondes, ou dès qu'il
+    contient `batch_size` entrées, en UNE transaction : INSERT executemany
+    dans play_event et mise à jour des compteurs tag_stats / audio_stats.
+    Un seul commit (donc une seule série de fsync) par lot.
+  - Fenêtre de perte bornée : au plus `flush_interval` secondes d'événements
+    en cas de coupure de courant (le tampon est vidé à l'arrêt normal).
+  - Base verrouillée (maintenance, import) : le lot est gardé et retenté au
+    tour suivant.
+
+Les débuts de piste arrivent avec le nom du fichier ; l'identifiant de
+l'audio est retrouvé par le thread écrivain (une requête IN par lot).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from urllib.parse import unquote
+
+from models import db, Audio, Tag, audio_stats, play_event, tag_stats
+
+logger = logging.getLogger(__name__)
+
+_AUDIO_STATS_UPSERT = (
+    "INSERT INTO audio_stats (audio_id, starts, skips, last_start) VALUES (?, ?, ?, ?)"
+    " ON CONFLICT (audio_id) DO UPDATE SET starts = starts + excluded.starts,"
+    " skips = skips + excluded.skips,"
+    " last_start = COALESCE(MAX(last_start, excluded.last_start), last_start, excluded.last_start)"
+)
+
+
+class PlayHistory:
+    def __init__(
+        self,
+        db_path: Path,
+        capacity: int = 4096,
+        flush_interval: float = 2.0,
+        batch_size: int = 256,
+    ):
+        """
+        :param db_path: base SQLite (tables créées par db.create_all)
+        :param capacity: taille du tampon circulaire (événements)
+        :param flush_interval: délai maximal avant écriture (s) = fenêtre de perte
+        :param batch_size: nombre d'événements qui déclenche une écriture anticipée
+        """
+        self._db_path = Path(db_path)
+        self._interval = flush_interval
+        self._batch_size = batch_size
+        self._buffer: deque[tuple] = deque(maxlen=capacity)
+        self._pending: list[tuple] = []
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closing = False
+        self._conn: sqlite3.Connection | None = None
+        self._thread: threading.Thread | None = None
+        self._stats = {
+            "recorded": 0, "dropped": 0, "written": 0, "batches": 0, "failed_batches": 0,
+            "flush_total": 0.0, "flush_max": 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def start(self):
+        self._conn = sqlite3.connect(self._db_path, timeout=5, check_same_thread=False)
+        self._thread = threading.Thread(target=self._run, daemon=True, name="play-history")
+        self._thread.start()
+
+    def close(self, timeout: float = 5.0):
+        """Écrit les événements en attente et arrête le thread écrivain."""
+        if self._thread is None:
+            return
+        self._closing = True
+        self._wake.set()
+        self._thread.join(timeout)
+        self._thread = None
+        self.flush()
+        self._conn.close()
+        self._conn = None
+
+    def record(self, kind: str, rfid_id: str | None = None, audio_id: int | None = None,
+               media: str | None = None, position_ms: int | None = None):
+        """Ajoute un événement au tampon (non bloquant, quelques µs)."""
+        buffer = self._buffer
+        if len(buffer) == buffer.maxlen:
+            self._stats["dropped"] += 1
+        buffer.append((time.time(), kind, rfid_id, audio_id, media, position_ms))
+        self._stats["recorded"] += 1
+        if len(buffer) >= self._batch_size:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Écrit immédiatement le contenu du tampon ; retourne le nombre d'événements écrits."""
+        if self._conn is None:
+            return 0
+        with self._flush_lock:
+            return self._flush()
+
+    def stats(self) -> dict:
+        s = self._stats
+        return {
+            "buffered": len(self._buffer) + len(self._pending),
+            "capacity": self._buffer.maxlen,
+            "flush_interval": self._interval,
+            "recorded": s["recorded"],
+            "dropped": s["dropped"],
+            "written": s["written"],
+            "batches": s["batches"],
+            "failed_batches": s["failed_batches"],
+            "flush_avg_ms": round(s["flush_total"] / s["batches"] * 1000, 3) if s["batches"] else None,
+            "flush_max_ms": round(s["flush_max"] * 1000, 3),
+        }
+
+    # ------------------------------------------------------------------
+    # Thread écrivain
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass
+        try:
+            with self._flush_lock:
+                self._repair_encoded_media()
+        except sqlite3.Error as e:
+            logger.warning(f"Historique : réparation des noms encodés reportée : {e}")
+        while not self._closing:
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Historique : erreur inattendue : {e}")
+
+    def _repair_encoded_media(self) -> int:
+        """Rattache à leur audio les débuts/passées enregistrés sous un nom encodé.
+
+        Avant le décodage des MRL par le lecteur VLC, un fichier 'Frère
+        Jacques.mp3' était journalisé 'Fr%C3%A8re%20Jacques.mp3' : l'événement
+        restait sans audio_id et hors des compteurs. Les lignes retrouvées
+        reçoivent leur audio_id et le nom décodé, et audio_stats est complété.
+        """
+        conn = self._conn
+        rows = conn.execute(
+            "SELECT id, ts, kind, media FROM play_event WHERE audio_id IS NULL"
+            " AND kind IN ('start', 'skip') AND media LIKE '%!%%' ESCAPE '!'"
+        ).fetchall()
+        names = {unquote(media) for _, _, _, media in rows}
+        if not names:
+            return 0
+        marks = ",".join("?" * len(names))
+        audio_ids = dict(conn.execute(f"SELECT file_path, id FROM audio WHERE file_path IN ({marks})", list(names)))
+
+        updates = []
+        audios: dict[int, list] = {}
+        for event_id, t, kind, media in rows:
+            aid = audio_ids.get(unquote(media))
+            if aid is None:
+                continue
+            updates.append((aid, unquote(media), event_id))
+            entry = audios.setdefault(aid, [0, 0, None])
+            if kind == "start":
+                entry[0] += 1
+                entry[2] = max(entry[2] or t, t)
+            else:
+                entry[1] += 1
+        if updates:
+            with conn:
+                conn.executemany("UPDATE play_event SET audio_id = ?, media = ? WHERE id = ?", updates)
+                conn.executemany(
+                    _AUDIO_STATS_UPSERT,
+                    [(aid, starts, skips, last) for aid, (starts, skips, last) in audios.items()],
+                )
+            logger.info(f"Historique : {len(updates)} événement(s) à nom encodé rattaché(s)")
+        return len(updates)
+
+    def _flush(self) -> int:
+        batch = self._pending
+        buffer = self._buffer
+        while buffer:
+            batch.append(buffer.popleft())
+        # Base indisponible depuis longtemps : on ne garde pas plus que le tampon
+        overflow = len(batch) - buffer.maxlen
+        if overflow > 0:
+            del batch[:overflow]
+            self._stats["dropped"] += overflow
+        if not batch:
+            return 0
+
+        start = time.perf_counter()
+        conn = self._conn
+        try:
+            names = {media for _, _, _, aid, media, _ in batch if aid is None and media}
+            audio_ids: dict[str, int] = {}
+            if names:
+                marks = ",".join("?" * len(names))
+                audio_ids = dict(
+                    conn.execute(f"SELECT file_path, id FROM audio WHERE file_path IN ({marks})", list(names))
+                )
+
+            events = []
+            tags: dict[str, list] = {}     # rfid → [scans, dernier scan]
+            audios: dict[int, list] = {}   # audio_id → [débuts, passées, dernier début]
+            for t, kind, rfid, aid, media, pos in batch:
+                if aid is None and media:
+                    aid = audio_ids.get(media)
+                events.append((t, kind, rfid, aid, media, pos))
+                if kind == "scan" and rfid:
+                    entry = tags.setdefault(rfid, [0, t])
+                    entry[0] += 1
+                    entry[1] = max(entry[1], t)
+                elif aid is not None and kind in ("start", "skip"):
+                    entry = audios.setdefault(aid, [0, 0, None])
+                    if kind == "start":
+                        entry[0] += 1
+                        entry[2] = max(entry[2] or t, t)
+                    else:
+                        entry[1] += 1
+
+            with conn:  # une transaction, un commit
+                conn.executemany(
+                    "INSERT INTO play_event (ts, kind, rfid_id, audio_id, media, position_ms) VALUES (?, ?, ?, ?, ?, ?)",
+                    events,
+                )
+                if tags:
+                    conn.executemany(
+                        "INSERT INTO tag_stats (rfid_id, scans, last_scan) VALUES (?, ?, ?)"
+                        " ON CONFLICT (rfid_id) DO UPDATE SET scans = scans + excluded.scans,"
+                        " last_scan = MAX(COALESCE(last_scan, 0), excluded.last_scan)",
+                        [(rfid, n, last) for rfid, (n, last) in tags.items()],
+                    )
+                if audios:
+                    conn.executemany(
+                        _AUDIO_STATS_UPSERT,
+                        [(aid, starts, skips, last) for aid, (starts, skips, last) in audios.items()],
+                    )
+        except sqlite3.Error as e:
+            self._stats["failed_batches"] += 1
+            logger.warning(f"Historique : écriture de {len(batch)} événement(s) reportée : {e}")
+            return 0
+
+        elapsed = time.perf_counter() - start
+        self._pending = []
+        s = self._stats
+        s["written"] += len(events)
+        s["batches"] += 1
+        s["flush_total"] += elapsed
+        s["flush_max"] = max(s["flush_max"], elapsed)
+        return len(events)
+
+
+# ---------------------------------------------------------------------------
+# Lecture (contexte Flask)
+# ---------------------------------------------------------------------------
+
+def counters(limit: int = 20) -> dict:
+    """Tags les plus scannés et audios les plus écoutés."""
+    top_tags = db.session.execute(
+        db.select(tag_stats).order_by(tag_stats.c.scans.desc()).limit(limit)
+    ).all()
+    labels = {
+        tag.rfid_id: tag.to_dict()["label"]
+        for tag in Tag.query.filter(Tag.rfid_id.in_([row.rfid_id for row in top_tags]))
+    } if top_tags else {}
+    top_audios = db.session.execute(
+        db.select(audio_stats, Audio.name)
+        .join(Audio, Audio.id == audio_stats.c.audio_id)
+        .order_by(audio_stats.c.starts.desc())
+        .limit(limit)
+    ).all()
+    return {
+        "tags": [
+            {"rfid_id": row.rfid_id, "label": labels.get(row.rfid_id), "known": row.rfid_id in labels,
+             "scans": row.scans, "last_scan": row.last_scan}
+            for row in top_tags
+        ],
+        "audios": [
+            {"audio_id": row.audio_id, "name": row.name, "starts": row.starts, "skips": row.skips,
+             "last_start": row.last_start}
+            for row in top_audios
+        ],
+    }
+
+
+def recent_events(limit: int = 50) -> list[dict]:
+    rows = db.session.execute(db.select(play_event).order_by(play_event.c.id.desc()).limit(limit)).all()
+    return [
+        {"ts": r.ts, "kind": r.kind, "rfid_id": r.rfid_id, "audio_id": r.audio_id,
+         "media": r.media, "position_ms": r.position_ms}
+        for r in rows
+    ]
+
+
+def recent_start_counts(days: float = 30, limit: int = 50) -> dict[str, int]:
+    """file_path → nombre de débuts de lecture sur la période (amorçage du cache RAM)."""
+    rows = db.session.execute(
+        db.select(Audio.file_path, db.func.count())
+        .select_from(play_event)
+        .join(Audio, Audio.id == play_event.c.audio_id)
+        .where(play_event.c.kind == "start", play_event.c.ts > time.time() - days * 86400)
+        .group_by(Audio.file_path)
+        .order_by(db.func.count().desc())
+        .limit(limit)
+    ).all()
+    return {fp: n for fp, n in rows}
+
+
+# ---------------------------------------------------------------------------
+# Maintenance (connexion sqlite3 dédiée)
+# ---------------------------------------------------------------------------
+
+def prune_history(ctx, retention: float) -> dict:
+    """Supprime les événements plus anciens que `retention` secondes et les compteurs orphelins."""
+    conn = ctx.conn
+    events = conn.execute("DELETE FROM play_event WHERE ts < ?", (time.time() - retention,)).rowcount
+    ctx.check()
+    audios = conn.execute("DELETE FROM audio_stats WHERE audio_id NOT IN (SELECT id FROM audio)").rowcount
+    conn.commit()
+    return {"events": events, "audio_stats": audios}
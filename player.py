@@ -3,9 +3,63 @@ from __future__ import annotations
 import threading
 import logging
 import os
+import math
+import queue
+import random
+import time
+from urllib.parse import unquote, urlparse
 
 logger = logging.getLogger(__name__)
 
+# Alimentation des playlists : la première piste est lancée tout de suite,
+# les suivantes sont ajoutées à la media list VLC par petits lots en tâche
+# de fond, en gardant au plus _FEED_AHEAD pistes d'avance sur la lecture.
+_FEED_BATCH = 10
+_FEED_AHEAD = 30
+_FEED_IDLE = 0.5
+
+# Volume VLC de référence (%) auquel s'ajoute le gain de sonie de la piste ;
+# VLC accepte jusqu'à 200 % (amplification logicielle). Le volume logiciel
+# de VLC est cubique : amplitude = (volume / 100)³, soit 100 % × 10^(dB / 60)
+_BASE_VOLUME = 100
+_MAX_VOLUME = 200
+# Gain positif maximal applicable par le volume (≈ +18 dB à 200 %)
+_MAX_GAIN_DB = 60 * math.log10(_MAX_VOLUME / _BASE_VOLUME)
+
+
+def _lazy_shuffle(n: int, rng: random.Random):
+    """Permutation aléatoire de range(n), produite élément par élément.
+
+    Fisher-Yates « creux » : seules les cases déjà échangées sont
+    mémorisées, donc O(k) mémoire pour les k premiers éléments tirés.
+    """
+    swapped: dict[int, int] = {}
+    for i in range(n):
+        j = rng.randrange(i, n)
+        yield swapped.get(j, j)
+        swapped[j] = swapped.get(i, i)
+
+
+def _track_order(file_paths: list[str], shuffle: bool, repeat: bool, start: int | None = None):
+    """Ordre de lecture : une passe (ou une infinité si repeat), aléatoire ou non.
+
+    La première passe commence à la piste d'indice `start` (reprise), sinon
+    à la première piste (ou à une piste tirée au sort si shuffle).
+    """
+    rng = random.Random()
+    first_pass = True
+    while True:
+        if shuffle:
+            if first_pass and start is not None:
+                yield file_paths[start]
+            yield from (file_paths[i] for i in _lazy_shuffle(len(file_paths), rng)
+                        if not (first_pass and start is not None and i == start))
+        else:
+            yield from (file_paths[start or 0:] if first_pass else file_paths)
+        first_pass = False
+        if not repeat:
+            return
+
 
 class Player:
     """
@@ -14,12 +68,51 @@ class Player:
     Thread-safe via un verrou interne.
     """
 
-    def __init__(self):
+    # Options VLC du profil basse mémoire : pas de vidéo, de sous-titres,
+    # de scripts Lua ni d'accès réseau aux métadonnées → modules non chargés.
+    _LOW_MEMORY_ARGS = (
+        "--no-video",
+        "--no-spu",
+        "--no-osd",
+        "--no-lua",
+        "--no-stats",
+        "--no-sub-autodetect-file",
+        "--no-snapshot-preview",
+        "--no-metadata-network-access",
+    )
+
+    def __init__(self, low_memory: bool = False, resolve_path=None, gain_for=None, on_track_start=None):
+        """
+        :param low_memory: options VLC allégées (voir _LOW_MEMORY_ARGS)
+        :param resolve_path: callable(chemin) → chemin à lire réellement
+            (ex: copie en cache RAM). Par défaut, le chemin tel quel.
+        :param gain_for: callable(nom de fichier) → gain de sonie en dB ou
+            None, appliqué par le volume VLC au début de chaque piste
+        :param on_track_start: callable(nom de fichier, décodé) appelé depuis
+            le thread "vlc-events" à chaque changement de piste (doit rendre
+            la main vite)
+        """
+        self._low_memory = low_memory
+        self._resolve = resolve_path or (lambda path: path)
+        self._gain_for = gain_for
+        self._on_track_start = on_track_start
+        self._gain_db = 0.0
         self._lock = threading.Lock()
         self._instance = None
         self._media_player = None
         self._list_player = None
         self._current_playlist: list[str] = []
+        self._media_list = None
+        # Chemins résolus donnés à VLC pour la lecture en cours (file ou media
+        # list, pistes jouées comprises) : remplacé, jamais modifié sur place,
+        # pour être lu sans verrou par queued_paths()
+        self._queued: frozenset[str] = frozenset()
+        # Incrémenté à chaque nouvelle lecture : le feeder d'une playlist
+        # précédente s'arrête de lui-même
+        self._feed_generation = 0
+        # Événements VLC traités hors du thread d'événements de libvlc, qui
+        # interdit les appels réentrants (get_media, audio_set_volume…)
+        self._events: queue.SimpleQueue[str] = queue.SimpleQueue()
         self._init_vlc()
 
     def _init_vlc(self):
@@ -27,10 +120,21 @@ class Player:
             import vlc  # type: ignore
 
             # '--aout=alsa' force la sortie jack sur Raspberry Pi
-            self._instance = vlc.Instance("--no-xlib", "--aout=alsa")
+            args = ["--no-xlib", "--aout=alsa"]
+            if self._low_memory:
+                args += self._LOW_MEMORY_ARGS
+            self._instance = vlc.Instance(*args)
             self._media_player = self._instance.media_player_new()
             self._list_player = self._instance.media_list_player_new()
             self._list_player.set_media_player(self._media_player)
+            events = self._media_player.event_manager()
+            if self._gain_for is not None:
+                events.event_attach(vlc.EventType.MediaPlayerPlaying, lambda _e: self._events.put("playing"))
+            if self._on_track_start is not None:
+                # MediaChanged et non Playing : une reprise après pause n'est pas un début
+                events.event_attach(vlc.EventType.MediaPlayerMediaChanged, lambda _e: self._events.put("changed"))
+            if self._gain_for is not None or self._on_track_start is not None:
+                threading.Thread(target=self._dispatch_events, daemon=True, name="vlc-events").start()
             logger.info("VLC initialisé avec succès")
         except Exception as e:
             logger.error(f"Impossible d'initialiser VLC : {e}")
@@ -39,8 +143,19 @@ class Player:
     # Lecture
     # ------------------------------------------------------------------
 
-    def play_file(self, file_path: str) -> bool:
-        """Lance la lecture d'un fichier audio unique."""
+    def _media(self, file_path: str, start_ms: int = 0):
+        """Media VLC d'un fichier (verrou tenu) ; son chemin résolu rejoint _queued."""
+        path = self._resolve(file_path)
+        self._queued = self._queued | {path}
+        media = self._instance.media_new(path)
+        if start_ms > 0:
+            # Appliqué à l'ouverture du fichier, contrairement à set_time()
+            # qui est ignoré tant que la lecture n'a pas démarré
+            media.add_option(f":start-time={start_ms / 1000:.3f}")
+        return media
+
+    def play_file(self, file_path: str, start_ms: int = 0) -> bool:
+        """Lance la lecture d'un fichier audio unique (à start_ms si > 0)."""
         if not self._media_player:
             logger.warning("VLC non disponible")
             return False
@@ -51,35 +166,140 @@ class Player:
         with self._lock:
             import vlc  # type: ignore
 
-            # Arrête une éventuelle playlist en cours
+            # Arrête une éventuelle playlist en cours (et son feeder)
+            self._feed_generation += 1
             self._list_player.stop()
 
-            media = self._instance.media_new(file_path)
-            self._media_player.set_media(media)
+            self._queued = frozenset()
+            self._media_player.set_media(self._media(file_path, start_ms))
             self._media_player.play()
             self._current_playlist = [file_path]
             logger.info(f"Lecture : {file_path}")
         return True
 
-    def play_playlist(self, file_paths: list[str]) -> bool:
-        """Lance la lecture d'une liste de fichiers audio."""
+    def play_playlist(
+        self,
+        file_paths: list[str],
+        shuffle: bool = False,
+        repeat: bool = False,
+        start_index: int | None = None,
+        start_ms: int = 0,
+    ) -> bool:
+        """Lance la lecture d'une liste de fichiers audio.
+
+        Seule la première piste lisible est vérifiée et chargée avant de
+        démarrer : le reste est ajouté en tâche de fond (_feed), les fichiers
+        manquants y sont ignorés.
+
+        :param shuffle: ordre aléatoire (permutation tirée au fil de l'eau)
+        :param repeat: recommence la playlist (nouveau tirage si shuffle)
+        :param start_index, start_ms: piste et position de départ (reprise) ;
+            sans start_index, la première piste (tirée au sort si shuffle)
+        """
         if not self._list_player:
             logger.warning("VLC non disponible")
             return False
+        if not file_paths:
+            logger.error("Playlist vide")
+            return False
 
-        valid = [p for p in file_paths if os.path.isfile(p)]
-        if not valid:
+        if start_index is not None and not 0 <= start_index < len(file_paths):
+            start_index = None
+        order = _track_order(file_paths, shuffle, repeat, start_index)
+        first = None
+        # Une passe au plus : en mode repeat, l'ordre est infini
+        for _, path in zip(file_paths, order):
+            if os.path.isfile(path):
+                first = path
+                break
+            logger.warning(f"Playlist : fichier introuvable ignoré : {path}")
+        if first is None:
             logger.error("Aucun fichier valide dans la playlist")
             return False
 
         with self._lock:
-            media_list = self._instance.media_list_new(valid)
-            self._list_player.set_media_list(media_list)
+            self._feed_generation += 1
+            generation = self._feed_generation
+            # La position de départ ne vaut que pour la piste demandée
+            offset = start_ms if start_index is not None and first == file_paths[start_index] else 0
+            self._queued = frozenset()
+            self._media_list = self._instance.media_list_new([self._media(first, offset)])
+            self._list_player.set_media_list(self._media_list)
             self._list_player.play()
-            self._current_playlist = valid
-            logger.info(f"Playlist lancée : {len(valid)} pistes")
+            self._current_playlist = list(file_paths)
+            logger.info(
+                f"Playlist lancée : {len(file_paths)} pistes"
+                f"{' (aléatoire)' if shuffle else ''}{' (en boucle)' if repeat else ''}"
+            )
+
+        threading.Thread(
+            target=self._feed,
+            args=(generation, self._media_list, order, len(file_paths)),
+            daemon=True,
+            name="playlist-feeder",
+        ).start()
         return True
 
+    def _feed(self, generation: int, media_list, order, total: int):
+        """Ajoute les pistes suivantes à la media list, par lots, tant que la
+        playlist est toujours celle en cours."""
+        import vlc  # type: ignore
+
+        missing: set[str] = set()
+        misses_in_a_row = 0
+        exhausted = False
+        while not exhausted:
+            with self._lock:
+                if generation != self._feed_generation:
+                    return
+                media = self._media_player.get_media()
+                current = media_list.index_of_item(media) if media else 0
+                if media:
+                    media.release()  # get_media() prend une référence
+                ahead = media_list.count() - 1 - max(0, current)
+            if ahead >= _FEED_AHEAD:
+                time.sleep(_FEED_IDLE)
+                continue
+
+            # Vérification des fichiers hors verrou (stat sur carte SD)
+            batch: list[str] = []
+            for path in order:
+                if os.path.isfile(path):
+                    misses_in_a_row = 0
+                    batch.append(self._resolve(path))
+                    if len(batch) >= _FEED_BATCH:
+                        break
+                else:
+                    if path not in missing:
+                        missing.add(path)
+                        logger.warning(f"Playlist : fichier introuvable ignoré : {path}")
+                    misses_in_a_row += 1
+                    if misses_in_a_row >= total:
+                        # Plus aucun fichier lisible (mode repeat) : on arrête
+                        exhausted = True
+                        break
+            else:
+                exhausted = True
+            if not batch:
+                break
+
+            with self._lock:
+                if generation != self._feed_generation:
+                    return
+                ended = self._list_player.get_state() == vlc.State.Ended
+                start = media_list.count()
+                media_list.lock()
+                try:
+                    for mrl in batch:
+                        media_list.add_media(mrl)
+                finally:
+                    media_list.unlock()
+                self._queued = self._queued | set(batch)
+                # Le feeder avait pris du retard sur la lecture : reprise sur
+                # la première piste ajoutée
+                if ended:
+                    self._list_player.play_item_at_index(start)
+
     # ------------------------------------------------------------------
     # Contrôles
     # ------------------------------------------------------------------
@@ -90,13 +310,21 @@ class Player:
             with self._lock:
                 self._media_player.pause()
 
+    def set_pause(self, paused: bool):
+        """Met en pause (True) ou reprend (False) — sans effet si déjà dans cet état."""
+        if self._media_player:
+            with self._lock:
+                self._media_player.set_pause(1 if paused else 0)
+
     def stop(self):
         """Arrêter toute lecture."""
         if self._media_player:
             with self._lock:
+                self._feed_generation += 1
                 self._media_player.stop()
                 self._list_player.stop()
                 self._current_playlist = []
+                self._queued = frozenset()
 
     def next_track(self):
         """Piste suivante (uniquement en mode playlist)."""
@@ -122,6 +350,11 @@ class Player:
         # Enum vlc.State -> str : "State.Playing" → "Playing"
         return str(state).split(".")[-1]
 
+    def queued_paths(self) -> frozenset[str]:
+        """Chemins résolus que VLC peut encore ouvrir (piste en cours, suivantes,
+        précédentes) : le cache RAM ne supprime pas ces copies. Sans verrou."""
+        return self._queued
+
     def get_current_media_name(self) -> str | None:
         """Retourne le nom du fichier en cours de lecture, ou None."""
         if not self._media_player:
@@ -129,10 +362,48 @@ class Player:
         media = self._media_player.get_media()
         if media:
             mrl = media.get_mrl()
-            # Convertit 'file:///path/to/file.mp3' en 'file.mp3'
-            return os.path.basename(mrl.replace("file://", ""))
+            # Convertit 'file:///path/to/mon%20fichier.mp3' en 'mon fichier.mp3' :
+            # VLC encode l'MRL (espaces, accents), la base stocke le nom décodé
+            return os.path.basename(unquote(urlparse(mrl).path))
         return None
 
+    def _dispatch_events(self):
+        """Thread des événements VLC : début de lecture → gain, nouvelle piste → on_track_start."""
+        while True:
+            kind = self._events.get()
+            try:
+                name = self.get_current_media_name()
+                if kind == "playing":
+                    self._apply_gain(name)
+                elif name:
+                    self._on_track_start(name)
+            except Exception as e:
+                logger.warning(f"Événement VLC '{kind}' non traité : {e}")
+
+    def _apply_gain(self, name: str | None):
+        """Volume = base + gain de la piste (début de piste, reprise)."""
+        # Au-delà de _MAX_GAIN_DB, le volume VLC plafonne : le gain rapporté
+        # (gain_db, /api/status) est celui réellement appliqué
+        gain = min(self._gain_for(name) or 0.0, round(_MAX_GAIN_DB, 2))
+        self._gain_db = gain
+        volume = round(_BASE_VOLUME * 10 ** (gain / 60))
+        self._media_player.audio_set_volume(max(0, min(_MAX_VOLUME, volume)))
+
+    @property
+    def gain_db(self) -> float:
+        """Gain de sonie appliqué à la piste en cours."""
+        return self._gain_db
+
+    def snapshot(self) -> dict:
+        """État minimal pour le journal de reprise : état, fichier, position (ms)."""
+        if not self._media_player:
+            return {"state": "Unavailable", "media": None, "time_ms": 0}
+        return {
+            "state": self.get_state(),
+            "media": self.get_current_media_name(),
+            "time_ms": max(0, self._media_player.get_time()),
+        }
+
     def get_time_info(self) -> dict:
         """Retourne la position et la durée en secondes."""
         if not self._media_player:
@@ -142,3 +413,18 @@ class Player:
             "duration": max(0, self._media_player.get_length() // 1000),
             "position": round(self._media_player.get_position(), 3),
         }
+
+
+def create_player(backend: str = "vlc", **kwargs):
+    """Lecteur correspondant à JUKEBOX_AUDIO_BACKEND.
+
+    :param backend: "vlc" (libvlc, défaut), "pipe" (ffmpeg → aplay, voir
+        pipe_player.py), "null" ou "file:<chemin>" (sans carte son, tests)
+    :param kwargs: arguments de Player (low_memory n'a de sens que pour VLC)
+    """
+    if backend == "vlc":
+        return Player(**kwargs)
+    from pipe_player import PipePlayer
+
+    kwargs.pop("low_memory", None)
+    return PipePlayer(sink="alsa" if backend == "pipe" else backend, **kwargs)
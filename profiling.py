@@ -0,0 +1,241 @@
+"""
+Profilage des requêtes HTTP et des requêtes SQL (opt-in).
+
+Activé par JUKEBOX_PROFILING=1 : sinon aucun hook n'est enregistré et le
+coût est nul. Une fois actif :
+  - temps mur et temps CPU (du thread) par endpoint Flask ;
+  - nombre et durée des requêtes SQL, via les événements SQLAlchemy
+    before/after_cursor_execute, par requête HTTP et par instruction ;
+  - les N requêtes HTTP les plus lentes, avec leurs requêtes SQL.
+
+Le profileur par échantillonnage (sample_stacks) est indépendant : il ne
+tourne que pendant la fenêtre demandée, puis ne coûte plus rien. Sa sortie
+"collapsed" est directement lisible par flamegraph.pl ou speedscope.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import sys
+import threading
+import time
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Bornes mémoire : le profileur ne doit pas devenir lui-même une fuite
+MAX_QUERIES_PER_REQUEST = 50
+MAX_STATEMENTS = 200
+STATEMENT_MAX_LEN = 300
+MAX_SAMPLE_SECONDS = 60
+
+
+class RequestProfiler:
+    """Statistiques par endpoint / instruction SQL et requêtes les plus lentes."""
+
+    def __init__(self, slowest: int = 20):
+        self._slowest_n = slowest
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._seq = itertools.count()
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._endpoints: dict[str, dict] = {}
+            self._statements: dict[str, dict] = {}
+            self._slowest: list[tuple[float, int, dict]] = []  # tas min de taille N
+            self._since = time.time()
+
+    # ------------------------------------------------------------------
+    # Enregistrement des hooks
+    # ------------------------------------------------------------------
+
+    def init_app(self, app):
+        """Branche les hooks Flask et SQLAlchemy (à n'appeler que si activé)."""
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+        self.enabled = True
+        logger.info("Profilage des requêtes HTTP/SQL activé")
+
+    def _before_request(self):
+        self._local.current = {
+            "wall": time.perf_counter(),
+            "cpu": time.thread_time(),
+            "queries": [],
+            "sql_count": 0,
+            "sql_time": 0.0,
+        }
+
+    def _teardown_request(self, _exc=None):
+        current = getattr(self._local, "current", None)
+        if current is None:
+            return
+        self._local.current = None
+        wall = time.perf_counter() - current["wall"]
+        cpu = time.thread_time() - current["cpu"]
+        endpoint = request.endpoint or "<404>"
+
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, {
+                "count": 0, "wall_total": 0.0, "wall_max": 0.0,
+                "cpu_total": 0.0, "sql_count": 0, "sql_time": 0.0,
+            })
+            stats["count"] += 1
+            stats["wall_total"] += wall
+            stats["wall_max"] = max(stats["wall_max"], wall)
+            stats["cpu_total"] += cpu
+            stats["sql_count"] += current["sql_count"]
+            stats["sql_time"] += current["sql_time"]
+
+            if len(self._slowest) < self._slowest_n or wall > self._slowest[0][0]:
+                record = {
+                    "endpoint": endpoint,
+                    "method": request.method,
+                    "path": request.full_path.rstrip("?"),
+                    "at": time.time(),
+                    "wall_ms": round(wall * 1000, 2),
+                    "cpu_ms": round(cpu * 1000, 2),
+                    "sql_count": current["sql_count"],
+                    "sql_ms": round(current["sql_time"] * 1000, 2),
+                    "queries": current["queries"],
+                }
+                entry = (wall, next(self._seq), record)
+                if len(self._slowest) < self._slowest_n:
+                    heapq.heappush(self._slowest, entry)
+                else:
+                    heapq.heapreplace(self._slowest, entry)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info["profiling_start"] = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop("profiling_start", None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        statement = " ".join(statement.split())[:STATEMENT_MAX_LEN]
+
+        current = getattr(self._local, "current", None)
+        if current is not None:
+            current["sql_count"] += 1
+            current["sql_time"] += elapsed
+            if len(current["queries"]) < MAX_QUERIES_PER_REQUEST:
+                current["queries"].append({"sql": statement, "ms": round(elapsed * 1000, 3)})
+
+        with self._lock:
+            stats = self._statements.get(statement)
+            if stats is None:
+                if len(self._statements) >= MAX_STATEMENTS:
+                    return
+                stats = self._statements[statement] = {"count": 0, "total": 0.0, "max": 0.0}
+            stats["count"] += 1
+            stats["total"] += elapsed
+            stats["max"] = max(stats["max"], elapsed)
+
+    # ------------------------------------------------------------------
+    # Rapport
+    # ------------------------------------------------------------------
+
+    def report(self) -> dict:
+        with self._lock:
+            endpoints = {
+                name: {
+                    "count": s["count"],
+                    "wall_avg_ms": round(s["wall_total"] / s["count"] * 1000, 2),
+                    "wall_max_ms": round(s["wall_max"] * 1000, 2),
+                    "cpu_avg_ms": round(s["cpu_total"] / s["count"] * 1000, 2),
+                    "sql_avg_count": round(s["sql_count"] / s["count"], 1),
+                    "sql_avg_ms": round(s["sql_time"] / s["count"] * 1000, 2),
+                }
+                for name, s in sorted(self._endpoints.items(), key=lambda kv: -kv[1]["wall_total"])
+            }
+            statements = [
+                {
+                    "sql": sql,
+                    "count": s["count"],
+                    "total_ms": round(s["total"] * 1000, 2),
+                    "avg_ms": round(s["total"] / s["count"] * 1000, 3),
+                    "max_ms": round(s["max"] * 1000, 3),
+                }
+                for sql, s in sorted(self._statements.items(), key=lambda kv: -kv[1]["total"])
+            ]
+            slowest = [record for _, _, record in sorted(self._slowest, reverse=True)]
+        return {
+            "enabled": self.enabled,
+            "since": self._since,
+            "endpoints": endpoints,
+            "statements": statements,
+            "slowest": slowest,
+        }
+
+
+# ---------------------------------------------------------------------------
+# Profileur par échantillonnage
+# ---------------------------------------------------------------------------
+
+_sampling_lock = threading.Lock()
+
+
+class SamplerBusy(RuntimeError):
+    """Un échantillonnage est déjà en cours."""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{code.co_name}"
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> dict:
+    """Échantillonne les piles de tous les threads pendant `seconds`.
+
+    Tourne dans le thread appelant (le thread de la requête HTTP) ; les
+    autres threads (RFID, VLC, téléchargements…) sont observés sans être
+    interrompus.
+
+    :return: {"seconds", "samples", "interval_ms", "stacks": {pile_repliée: nb}}
+    """
+    seconds = max(0.1, min(float(seconds), MAX_SAMPLE_SECONDS))
+    if not _sampling_lock.acquire(blocking=False):
+        raise SamplerBusy("Un échantillonnage est déjà en cours")
+    try:
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks: dict[str, int] = {}
+        samples = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, str(thread_id)))
+                key = ";".join(reversed(labels))
+                stacks[key] = stacks.get(key, 0) + 1
+            samples += 1
+            time.sleep(interval)
+    finally:
+        _sampling_lock.release()
+    return {
+        "seconds": seconds,
+        "samples": samples,
+        "interval_ms": interval * 1000,
+        "stacks": stacks,
+    }
+
+
+def collapsed(result: dict) -> str:
+    """Format "pile nb" ligne par ligne (flamegraph.pl, speedscope)."""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(result["stacks"].items()))
@@ -0,0 +1,269 @@
+"""
+Association de tags RFID en série (mode « provisioning »).
+
+Pour préparer des dizaines de cartes d'affilée, sans formulaire par carte :
+
+  1. On choisit une liste ordonnée de cibles ("audio:ID" / "playlist:ID").
+  2. Chaque carte inconnue posée sur le lecteur est liée aussitôt à la cible
+     suivante (en mémoire : aucune écriture en base sur le chemin du scan).
+  3. « Annuler » délie la dernière carte et remet sa cible en tête de liste.
+  4. « Enregistrer » écrit toutes les liaisons en attente par lots
+     (library_batch.apply_batch, une transaction par lot). Les cartes et les
+     cibles des liaisons refusées reviennent en tête de file : la liaison est
+     reformée, à annuler ou à réessayer.
+
+Hors mode série, les UIDs inconnus sont gardés dans une file (les plus
+récents, sans doublon) au lieu d'un seul « dernier tag » : un second scan
+n'efface plus le premier. En mode série, les scans arrivés alors qu'il ne
+reste plus de cible attendent dans cette file et sont liés dès qu'on ajoute
+des cibles. Les cartes déjà associées ne lancent pas de lecture.
+
+Les liaisons en attente vivent dans le worker : elles sont perdues à son
+redémarrage tant qu'elles n'ont pas été enregistrées.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+
+from models import db, Audio, Playlist
+
+# UIDs inconnus gardés hors mode série (les plus anciens sont oubliés)
+MAX_UNKNOWN = 32
+# Garde-fou : une liste de cibles reste un lot raisonnable pour apply_batch
+MAX_TARGETS = 500
+
+
+class ProvisioningError(ValueError):
+    """Cible invalide — le message est renvoyé tel quel au client."""
+
+
+def resolve_targets(raw: list) -> list[dict]:
+    """["audio:4", "playlist:2", …] → [{"target", "label"}, …] (une requête par table).
+
+    Lève ProvisioningError si une cible est mal formée ou introuvable.
+    """
+    if not isinstance(raw, list) or not raw:
+        raise ProvisioningError("'targets' doit être une liste non vide")
+    if len(raw) > MAX_TARGETS:
+        raise ProvisioningError(f"Trop de cibles ({len(raw)} > {MAX_TARGETS})")
+
+    parsed: list[tuple[str, int]] = []
+    for value in raw:
+        target_type, _, target_id = str(value).partition(":")
+        if target_type not in ("audio", "playlist") or not target_id.isdigit():
+            raise ProvisioningError(f"Cible invalide '{value}' (attendu 'audio:ID' ou 'playlist:ID')")
+        parsed.append((target_type, int(target_id)))
+
+    audio_ids = {i for t, i in parsed if t == "audio"}
+    playlist_ids = {i for t, i in parsed if t == "playlist"}
+    names = {
+        "audio": dict(db.session.execute(db.select(Audio.id, Audio.name).where(Audio.id.in_(audio_ids))).all())
+        if audio_ids else {},
+        "playlist": dict(
+            db.session.execute(db.select(Playlist.id, Playlist.name).where(Playlist.id.in_(playlist_ids))).all()
+        ) if playlist_ids else {},
+    }
+    targets = []
+    for target_type, target_id in parsed:
+        label = names[target_type].get(target_id)
+        if label is None:
+            raise ProvisioningError(f"{'Audio' if target_type == 'audio' else 'Playlist'} {target_id} introuvable")
+        targets.append({"target": f"{target_type}:{target_id}", "label": label})
+    return targets
+
+
+class Provisioner:
+    def __init__(self, max_unknown: int = MAX_UNKNOWN):
+        self._lock = threading.Lock()
+        # Tenu pendant tout un enregistrement (app._commit_provisioning) et
+        # par undo() : une liaison en cours d'écriture ne peut pas être annulée
+        self.commit_lock = threading.Lock()
+        # Incrémenté à chaque changement : le polling de la page ne reçoit
+        # l'état complet que s'il a changé
+        self._version = 0
+        self._unknown: deque[str] = deque(maxlen=max_unknown)
+        self._active = False
+        self._targets: deque[dict] = deque()
+        self._pending: list[dict] = []  # {"rfid_id", "target", "label", "t"}, dans l'ordre des scans
+        self._last: dict | None = None  # dernier scan vu en mode série et son issue
+        self._errors: list[dict] = []   # échecs du dernier enregistrement
+
+    @property
+    def active(self) -> bool:
+        return self._active
+
+    # ------------------------------------------------------------------
+    # Scans (thread RFID)
+    # ------------------------------------------------------------------
+
+    def capture(self, rfid_id: str, known: bool) -> str:
+        """Enregistre un scan ; retourne l'issue.
+
+        "bound"     : carte liée à la cible suivante (mode série) ;
+        "queued"    : carte inconnue mise en file (hors mode série, ou plus de cible) ;
+        "duplicate" : carte déjà liée dans cette série ;
+        "known"     : carte déjà associée en base (rien à faire).
+        """
+        with self._lock:
+            if any(p["rfid_id"] == rfid_id for p in self._pending):
+                outcome = "duplicate"
+            elif known:
+                outcome = "known"
+            else:
+                if rfid_id in self._unknown:
+                    self._unknown.remove(rfid_id)
+                self._unknown.append(rfid_id)
+                outcome = "bound" if self._active and self._pair() else "queued"
+            if self._active:
+                self._last = {"rfid_id": rfid_id, "outcome": outcome, "t": time.time()}
+                self._version += 1
+            elif outcome == "queued":
+                self._version += 1
+            return outcome
+
+    def _pair(self) -> int:
+        """Lie les UIDs en file aux cibles restantes, dans l'ordre (verrou tenu)."""
+        bound = 0
+        while self._unknown and self._targets:
+            target = self._targets.popleft()
+            self._pending.append({"rfid_id": self._unknown.popleft(), **target, "t": time.time()})
+            bound += 1
+        return bound
+
+    # ------------------------------------------------------------------
+    # File des UIDs inconnus (association classique)
+    # ------------------------------------------------------------------
+
+    def last_unknown(self) -> str | None:
+        """Dernier UID inconnu scanné, encore non associé."""
+        with self._lock:
+            return self._unknown[-1] if self._unknown else None
+
+    def unknown(self) -> list[str]:
+        with self._lock:
+            return list(self._unknown)
+
+    def discard(self, rfid_ids) -> None:
+        """Retire de la file les UIDs associés par ailleurs (formulaire, API de lot)."""
+        with self._lock:
+            before = len(self._unknown)
+            for rfid_id in rfid_ids:
+                if rfid_id in self._unknown:
+                    self._unknown.remove(rfid_id)
+            if len(self._unknown) != before:
+                self._version += 1
+
+    def clear_unknown(self) -> None:
+        """Vide la file des UIDs inconnus."""
+        with self._lock:
+            if self._unknown:
+                self._unknown.clear()
+                self._version += 1
+
+    # ------------------------------------------------------------------
+    # Série
+    # ------------------------------------------------------------------
+
+    def start(self, targets: list[dict]) -> None:
+        """Démarre une série avec des cibles résolues (resolve_targets).
+
+        Les UIDs scannés avant le démarrage sont oubliés : seules les cartes
+        posées pendant la série sont liées.
+        """
+        with self._lock:
+            if self._pending:
+                raise ProvisioningError("Des liaisons ne sont pas enregistrées")
+            self._active = True
+            self._targets = deque(targets)
+            self._unknown.clear()
+            self._last = None
+            self._errors = []
+            self._version += 1
+
+    def add_targets(self, targets: list[dict]) -> int:
+        """Ajoute des cibles en fin de liste ; retourne le nombre de cartes en file aussitôt liées."""
+        with self._lock:
+            if not self._active:
+                raise ProvisioningError("Aucune série en cours")
+            if len(self._targets) + len(targets) > MAX_TARGETS:
+                raise ProvisioningError(f"Trop de cibles (> {MAX_TARGETS})")
+            self._targets.extend(targets)
+            bound = self._pair()
+            self._version += 1
+            return bound
+
+    def undo(self) -> dict | None:
+        """Délie la dernière carte ; sa cible redevient la suivante.
+
+        Attend la fin d'un enregistrement en cours : les liaisons écrites ne
+        sont plus en attente et ne peuvent plus être annulées.
+        """
+        with self.commit_lock, self._lock:
+            if not self._pending:
+                return None
+            binding = self._pending.pop()
+            self._targets.appendleft({"target": binding["target"], "label": binding["label"]})
+            self._last = None
+            self._version += 1
+            return binding
+
+    def pending(self) -> list[dict]:
+        """Copie des liaisons à enregistrer (dans l'ordre des scans)."""
+        with self._lock:
+            return list(self._pending)
+
+    def committed(self, bindings: list[dict], results: list[dict]) -> None:
+        """Retire les liaisons traitées ; garde la trace des échecs.
+
+        Les cartes des liaisons en échec reviennent en tête de la file des
+        UIDs inconnus, et, en mode série, leurs cibles en tête de liste (dans
+        leur ordre) : la liaison est reformée et les cartes suivantes ne sont
+        pas décalées. Hors mode série, les cartes restent à associer.
+
+        :param bindings: liste passée à apply_batch (via pending())
+        :param results: résultats de apply_batch, dans le même ordre
+        """
+        with self._lock:
+            done = {b["rfid_id"] for b in bindings}
+            self._pending = [p for p in self._pending if p["rfid_id"] not in done]
+            failed = [(b, r) for b, r in zip(bindings, results) if not r["ok"]]
+            self._errors = [
+                {"rfid_id": b["rfid_id"], "label": b["label"], "error": r.get("error")} for b, r in failed
+            ]
+            for b, _ in reversed(failed):
+                if b["rfid_id"] in self._unknown:
+                    self._unknown.remove(b["rfid_id"])
+                self._unknown.appendleft(b["rfid_id"])
+                if self._active:
+                    self._targets.appendleft({"target": b["target"], "label": b["label"]})
+            if self._active:
+                self._pair()
+            self._version += 1
+
+    def stop(self) -> None:
+        """Termine la série ; les liaisons non enregistrées sont abandonnées."""
+        with self._lock:
+            self._active = False
+            self._targets.clear()
+            self._pending = []
+            self._last = None
+            self._version += 1
+
+    def state(self) -> dict:
+        with self._lock:
+            return {
+                "version": self._version,
+                "active": self._active,
+                "targets": list(self._targets),
+                "pending": list(self._pending),
+                "unknown": list(self._unknown),
+                "last": self._last,
+                "errors": list(self._errors),
+            }
+
+    @property
+    def version(self) -> int:
+        return self._version
@@ -3,7 +3,8 @@ Thread daemon de lecture RFID (RC522 via SPI/spidev).
 
 Fonctionnement :
   - Tourne en boucle dans un thread daemon (ne bloque pas Flask).
-  - Si un tag est détecté, appelle on_tag_detected(rfid_id: str).
+  - Si un tag est posé, appelle on_tag_detected(rfid_id: str).
+  - Quand il est retiré, appelle on_tag_removed(rfid_id: str).
   - Si mfrc522 n'est pas disponible (dev sur PC), passe en mode mock
     qui n'appelle jamais le callback (simulation silencieuse).
 
@@ -12,6 +13,8 @@ Optimisation réactivité :
     uniquement l'UID du tag, SANS authentification ni lecture de données.
   - Élimine les AUTH ERROR et les boucles de retry associées.
   - Détection quasi-instantanée (< 300 ms typiquement).
+  - Tag posé : une seule requête REQA par cycle de 40 ms, retrait confirmé
+    après 3 échecs consécutifs (< 200 ms).
 """
 
 from __future__ import annotations
@@ -22,21 +25,54 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-# Intervalle de polling entre deux tentatives de détection
+# Intervalle de polling entre deux tentatives de détection (aucun tag présent)
 _POLL_INTERVAL = 0.1
 
+# Tag présent : polling resserré, une seule requête REQA par cycle
+# (pas d'anticollision) pour détecter le retrait avec un minimum d'échanges SPI.
+_PRESENCE_POLL_INTERVAL = 0.04
+
+# Échecs REQA consécutifs avant de déclarer le tag retiré.
+# Un tag présent ne répond qu'une requête sur deux : après un REQA réussi il
+# reste en état READY et ignore le REQA suivant (retour en IDLE). Un échec
+# isolé est donc normal ; 3 échecs ≈ 3 × 40 ms → retrait confirmé en < 200 ms.
+_REMOVAL_MISSES = 3
+
+
+def _uid_to_str(uid) -> str:
+    """Convertit la liste d'octets en entier décimal
+    (même format que SimpleMFRC522 pour la compatibilité DB)."""
+    n = 0
+    for byte in uid[:5]:
+        n = n * 256 + byte
+    return str(n)
+
 
 class RFIDReader:
-    def __init__(self, on_tag_detected):
+    def __init__(self, on_tag_detected, on_tag_removed=None, reader_factory=None):
         """
         :param on_tag_detected: callable(rfid_id: str)
-            Appelé dans le thread RFID (pas dans le thread Flask).
+            Appelé dans le thread RFID (pas dans le thread Flask) à chaque
+            pose d'un tag (y compris le même tag reposé après un retrait).
             Doit être thread-safe.
+        :param on_tag_removed: callable(rfid_id: str), optionnel
+            Appelé dans le thread RFID quand le tag posé est retiré.
+        :param reader_factory: callable() → objet compatible MFRC522
+            (ex: MockMFRC522 pour les tests et benchmarks). Par défaut, le
+            vrai RC522 via la lib mfrc522.
         """
         self._callback = on_tag_detected
+        self._removed_callback = on_tag_removed
+        self._reader_factory = reader_factory
         self._thread = threading.Thread(target=self._run, daemon=True, name="rfid-reader")
         self._running = False
-        self._last_triggered_id: str | None = None  # dernier UID ayant déclenché le callback
+        self._present_id: str | None = None  # UID du tag actuellement posé
+        self._misses = 0                      # échecs REQA consécutifs tag posé
+
+    @property
+    def present_tag(self) -> str | None:
+        """UID du tag actuellement posé sur le lecteur, ou None."""
+        return self._present_id
 
     def start(self):
         self._running = True
@@ -49,6 +85,10 @@ class RFIDReader:
     # ------------------------------------------------------------------
 
     def _run(self):
+        if self._reader_factory is not None:
+            self._loop(self._reader_factory())
+            return
+
         try:
             import RPi.GPIO as GPIO  # type: ignore
             GPIO.setwarnings(False)
@@ -77,32 +117,104 @@ class RFIDReader:
                 )
                 time.sleep(10.0)
 
+        self._loop(reader)
+
+    def _loop(self, reader):
         while self._running:
             try:
-                # Étape 1 : cherche un tag dans le champ (REQA/WUPA)
-                (status, _tag_type) = reader.MFRC522_Request(reader.PICC_REQIDL)
-
-                if status == reader.MI_OK:
-                    # Étape 2 : récupère l'UID par anticollision — pas d'auth !
-                    (status, uid) = reader.MFRC522_Anticoll()
-
-                    if status == reader.MI_OK and uid:
-                        # Convertit la liste d'octets en entier décimal
-                        # (même format que SimpleMFRC522 pour la compatibilité DB)
-                        n = 0
-                        for byte in uid[:5]:
-                            n = n * 256 + byte
-                        tag_str = str(n)
-
-                        # Déclenche uniquement si l'UID est différent du dernier
-                        # tag ayant déclenché le callback — même tag retiré/reposé = silence
-                        if tag_str != self._last_triggered_id:
-                            self._last_triggered_id = tag_str
-                            logger.info(f"Tag détecté : {tag_str}")
-                            self._callback(tag_str)
-
+                delay = self._poll(reader)
             except Exception as e:
                 logger.error(f"Erreur lecture RFID : {e}")
-                time.sleep(1.0)
+                delay = 1.0
+            time.sleep(delay)
 
-            time.sleep(_POLL_INTERVAL)
+    def _poll(self, reader) -> float:
+        """Un cycle de la machine à états présence/absence.
+
+        :return: délai avant le prochain cycle
+        """
+        # Étape 1 : cherche un tag dans le champ (REQA)
+        (status, _tag_type) = reader.MFRC522_Request(reader.PICC_REQIDL)
+
+        if self._present_id is not None:
+            # --- Tag posé : on surveille seulement sa présence -----------
+            if status == reader.MI_OK:
+                self._misses = 0
+                return _PRESENCE_POLL_INTERVAL
+            self._misses += 1
+            if self._misses < _REMOVAL_MISSES:
+                return _PRESENCE_POLL_INTERVAL
+            removed, self._present_id, self._misses = self._present_id, None, 0
+            logger.info(f"Tag retiré : {removed}")
+            if self._removed_callback:
+                self._removed_callback(removed)
+            return _POLL_INTERVAL
+
+        # --- Aucun tag : détection + lecture de l'UID --------------------
+        if status != reader.MI_OK:
+            return _POLL_INTERVAL
+        # Étape 2 : récupère l'UID par anticollision — pas d'auth !
+        (status, uid) = reader.MFRC522_Anticoll()
+        if status != reader.MI_OK or not uid:
+            return _POLL_INTERVAL
+
+        tag_str = _uid_to_str(uid)
+        self._present_id, self._misses = tag_str, 0
+        logger.info(f"Tag détecté : {tag_str}")
+        self._callback(tag_str)
+        return _PRESENCE_POLL_INTERVAL
+
+
+class MockMFRC522:
+    """Simulation du RC522 pour les tests et benchmarks (sans matériel).
+
+    Reproduit le comportement ISO 14443-3 qui conditionne la détection du
+    retrait : un tag répond à REQA depuis l'état IDLE, passe en READY, et
+    ignore le REQA suivant (retour en IDLE). `spi_delay` simule la durée
+    d'un échange SPI + radio ; `transceives` compte les échanges.
+    """
+
+    MI_OK = 0
+    MI_NOTAGERR = 1
+    MI_ERR = 2
+    PICC_REQIDL = 0x26
+
+    def __init__(self, spi_delay: float = 0.001):
+        self.spi_delay = spi_delay
+        self.transceives = 0
+        self._uid: list[int] | None = None
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def place(self, uid: list[int]):
+        with self._lock:
+            self._uid, self._ready = list(uid), False
+
+    def remove(self):
+        with self._lock:
+            self._uid, self._ready = None, False
+
+    def _transceive(self):
+        self.transceives += 1
+        time.sleep(self.spi_delay)
+
+    def MFRC522_Request(self, req_mode):
+        self._transceive()
+        with self._lock:
+            if self._uid is None:
+                return self.MI_NOTAGERR, None
+            if self._ready:
+                self._ready = False
+                return self.MI_NOTAGERR, None
+            self._ready = True
+            return self.MI_OK, 0x10
+
+    def MFRC522_Anticoll(self):
+        self._transceive()
+        with self._lock:
+            if self._uid is None or not self._ready:
+                return self.MI_ERR, []
+            checksum = 0
+            for byte in self._uid[:4]:
+                checksum ^= byte
+            return self.MI_OK, self._uid[:4] + [checksum]
@@ -0,0 +1,204 @@
+"""
+Journal d'état du lecteur (append-only, JSON lines) pour la reprise à chaud.
+
+Quand Gunicorn tue le worker (timeout) ou que systemd le relance, le lecteur
+repart vide. Ce journal garde la trace de ce qui jouait :
+
+    {"t": 1760000000.1, "ev": "play", "tag": "584190564", "playlist_id": 3}
+    {"t": 1760000005.2, "ev": "pos", "state": "Playing", "media": "a.mp3", "time_ms": 5021}
+    {"t": 1760000007.0, "ev": "stop"}
+
+Écriture :
+  - record() ne fait que déposer l'entrée dans une file bornée : aucun appel
+    de lecture (scan de tag, route HTTP) n'attend le disque.
+  - Un thread écrivain ajoute les lignes au fichier. Les événements (play,
+    stop) sont suivis d'un fdatasync ; les positions, écrites toutes les
+    `interval` secondes seulement si elles ont changé, ne le sont pas (un
+    kill du worker ne perd pas le cache de pages, seule une coupure de
+    courant peut coûter les dernières secondes).
+  - Au-delà de `max_bytes`, le journal est compacté : réécrit avec le seul
+    état courant (fichier temporaire + os.replace, donc atomique).
+
+Lecture : load() rejoue les lignes et ignore une éventuelle dernière ligne
+tronquée par un arrêt brutal.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+_QUEUE_MAX = 256
+_STOP = object()
+
+
+def _fold(state: dict | None, record: dict) -> dict | None:
+    """Applique une entrée du journal à l'état courant."""
+    ev = record.get("ev")
+    if ev == "play":
+        return {k: v for k, v in record.items() if k != "ev"}
+    if ev == "stop":
+        return None
+    if ev == "pos" and state is not None:
+        state = dict(state)
+        state.update({k: v for k, v in record.items() if k != "ev"})
+        return state
+    return state
+
+
+class StateJournal:
+    def __init__(self, path: Path, snapshot=None, interval: float = 5.0, max_bytes: int = 64 * 1024):
+        """
+        :param path: fichier du journal
+        :param snapshot: callable() → {"state", "media", "time_ms"} lu
+            périodiquement par le thread écrivain (position de lecture)
+        :param interval: période d'enregistrement de la position (s)
+        :param max_bytes: taille au-delà de laquelle le journal est compacté
+        """
+        self._path = Path(path)
+        self._snapshot = snapshot
+        self._interval = interval
+        self._max_bytes = max_bytes
+        self._queue: queue.Queue = queue.Queue(maxsize=_QUEUE_MAX)
+        self._state = self.load()
+        self._last_pos: tuple | None = None
+        self._stats = {"records": 0, "dropped": 0, "compactions": 0, "write_total": 0.0, "write_max": 0.0}
+        self._fd: int | None = None
+        self._thread: threading.Thread | None = None
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def start(self):
+        self._fd = os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        # Dernière ligne tronquée par un arrêt brutal : on la termine pour
+        # que la prochaine entrée ne s'y colle pas
+        with open(self._path, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    os.write(self._fd, b"\n")
+        self._thread = threading.Thread(target=self._run, daemon=True, name="state-journal")
+        self._thread.start()
+
+    def close(self, timeout: float = 2.0):
+        """Vide la file et arrête le thread écrivain."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+        os.close(self._fd)
+        self._fd = None
+
+    def record(self, ev: str, **fields):
+        """Ajoute une entrée (non bloquant ; entrée perdue si la file est pleine)."""
+        entry = {"t": round(time.time(), 3), "ev": ev, **fields}
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self._stats["dropped"] += 1
+
+    def load(self) -> dict | None:
+        """État reconstitué depuis le fichier, ou None (rien en cours / pas de journal)."""
+        state = None
+        try:
+            with open(self._path, "rb") as f:
+                for line in f:
+                    try:
+                        state = _fold(state, json.loads(line))
+                    except (ValueError, AttributeError):
+                        continue  # ligne tronquée par un arrêt brutal
+        except OSError:
+            return None
+        return state
+
+    def stats(self) -> dict:
+        s = self._stats
+        written = s["records"]
+        try:
+            size = self._path.stat().st_size
+        except OSError:
+            size = 0
+        return {
+            "path": str(self._path),
+            "size_bytes": size,
+            "records": written,
+            "dropped": s["dropped"],
+            "compactions": s["compactions"],
+            "write_avg_ms": round(s["write_total"] / written * 1000, 3) if written else None,
+            "write_max_ms": round(s["write_max"] * 1000, 3),
+            "state": self._state,
+        }
+
+    # ------------------------------------------------------------------
+    # Thread écrivain
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        while True:
+            try:
+                entry = self._queue.get(timeout=self._interval)
+            except queue.Empty:
+                entry = self._position()
+                if entry is None:
+                    continue
+            if entry is _STOP:
+                return
+            try:
+                self._write(entry, sync=entry["ev"] != "pos")
+            except OSError as e:
+                logger.warning(f"Journal d'état : écriture impossible : {e}")
+
+    def _position(self) -> dict | None:
+        """Entrée de position si la lecture a avancé depuis la dernière."""
+        if self._snapshot is None or self._state is None:
+            return None
+        try:
+            snap = self._snapshot()
+        except Exception:
+            return None
+        key = (snap.get("state"), snap.get("media"), snap.get("time_ms"))
+        if key == self._last_pos:
+            return None
+        self._last_pos = key
+        return {"t": round(time.time(), 3), "ev": "pos", **snap}
+
+    def _write(self, entry: dict, sync: bool):
+        line = (json.dumps(entry, separators=(",", ":")) + "\n").encode()
+        start = time.perf_counter()
+        os.write(self._fd, line)
+        if sync:
+            os.fdatasync(self._fd)
+        elapsed = time.perf_counter() - start
+
+        self._state = _fold(self._state, entry)
+        if entry["ev"] != "pos":
+            self._last_pos = None
+        self._stats["records"] += 1
+        self._stats["write_total"] += elapsed
+        self._stats["write_max"] = max(self._stats["write_max"], elapsed)
+
+        if os.fstat(self._fd).st_size > self._max_bytes:
+            self._compact()
+
+    def _compact(self):
+        tmp = self._path.with_name(self._path.name + ".tmp")
+        with open(tmp, "w") as f:
+            if self._state is not None:
+                f.write(json.dumps({"ev": "play", **self._state}, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path)
+        os.close(self._fd)
+        self._fd = os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._stats["compactions"] += 1
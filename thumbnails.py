@@ -0,0 +1,215 @@
+"""
+Vignettes (pochettes) des audios de la bibliothèque.
+
+Sources :
+  - pochette intégrée au fichier (ID3 APIC, FLAC, MP4…) extraite par ffmpeg ;
+  - vignette YouTube (hqdefault.jpg) téléchargée avec l'audio.
+
+Pour chaque audio, un pool de fond (1 thread, ffmpeg en nice 10) génère des
+variantes carrées en JPEG et WebP dans thumbnails/<fichier>/ :
+    source.jpg   image d'origine
+    96.jpg / 96.webp / 240.jpg / 240.webp
+    none         marqueur « pas de pochette » (évite de réessayer à chaque démarrage)
+
+Les URLs contiennent un numéro de version (?v=…) : elles sont servies avec
+un cache navigateur d'un an (immutable), sans revalidation sur Wi-Fi faible.
+"""
+
+from __future__ import annotations
+
+import logging
+import shutil
+import subprocess
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SIZES = (96, 240)
+FORMATS = ("webp", "jpg")
+_FFMPEG_TIMEOUT = 60
+_DOWNLOAD_TIMEOUT = 10
+_SOURCE_MAX_BYTES = 5 * 1024 * 1024
+_NO_COVER = "none"
+
+
+class ThumbnailError(RuntimeError):
+    """ffmpeg n'a pas pu être lancé ou a dépassé le délai.
+
+    Erreur passagère : aucun marqueur « pas de pochette » n'est écrit, la
+    vignette sera retentée au prochain démarrage (backfill).
+    """
+
+
+def _ffmpeg(*args: str) -> bool:
+    """Lance ffmpeg en basse priorité ; True si la commande a réussi.
+
+    False : ffmpeg a échoué sur ce fichier (ex: aucun flux d'image).
+    Lève ThumbnailError si ffmpeg est absent ou trop lent.
+    """
+    cmd = ["nice", "-n", "10", "ffmpeg", "-v", "error", "-nostdin", "-y", *args]
+    try:
+        proc = subprocess.run(cmd, capture_output=True, timeout=_FFMPEG_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise ThumbnailError(f"ffmpeg indisponible ou trop lent : {e}")
+    if proc.returncode in (126, 127):  # nice n'a pas pu lancer ffmpeg
+        raise ThumbnailError(proc.stderr.decode(errors="replace").strip() or "ffmpeg introuvable")
+    return proc.returncode == 0
+
+
+class ThumbnailStore:
+    def __init__(self, root: Path):
+        self._root = Path(root)
+        self._root.mkdir(exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbs")
+        self._lock = threading.Lock()
+        # fichier audio → (version, WebP disponible) ; rempli une fois au démarrage
+        # pour que le rendu des pages ne fasse aucun stat()
+        self._versions: dict[str, tuple[int, bool]] = {}
+        self._pending: set[str] = set()
+        for folder in self._root.iterdir():
+            self._index(folder)
+
+    @staticmethod
+    def key(file_path: str) -> str:
+        return Path(file_path).name
+
+    def folder(self, file_path: str) -> Path:
+        return self._root / self.key(file_path)
+
+    def lookup(self, file_path: str) -> tuple[int, bool] | None:
+        """(version, WebP disponible) pour cet audio, ou None s'il n'a pas de vignette."""
+        return self._versions.get(self.key(file_path))
+
+    def _index(self, folder: Path):
+        variant = folder / f"{SIZES[0]}.jpg"
+        if variant.is_file():
+            webp = (folder / f"{SIZES[0]}.webp").is_file()
+            with self._lock:
+                self._versions[folder.name] = (int(variant.stat().st_mtime), webp)
+
+    # ------------------------------------------------------------------
+    # Planification (non bloquante)
+    # ------------------------------------------------------------------
+
+    def schedule_extract(self, audio_path: str):
+        """Extrait la pochette intégrée au fichier audio, en tâche de fond."""
+        self._submit(audio_path, self._extract, audio_path)
+
+    def schedule_remote(self, audio_path: str, url: str):
+        """Télécharge une image distante (vignette YouTube), en tâche de fond."""
+        self._submit(audio_path, self._download, audio_path, url)
+
+    def backfill(self, audio_paths: list[str]):
+        """Planifie l'extraction pour les audios jamais traités."""
+        for path in audio_paths:
+            folder = self.folder(path)
+            if self.lookup(path) is None and not (folder / _NO_COVER).exists():
+                self.schedule_extract(path)
+
+    def remove(self, file_path: str):
+        with self._lock:
+            self._versions.pop(self.key(file_path), None)
+        shutil.rmtree(self.folder(file_path), ignore_errors=True)
+
+    def rename(self, old_path: str, new_path: str):
+        """Suit le renommage d'un fichier audio (ex: réencodage .m4a → .mp3)."""
+        old, new = self.folder(old_path), self.folder(new_path)
+        if not old.is_dir():
+            return
+        shutil.rmtree(new, ignore_errors=True)
+        old.rename(new)
+        with self._lock:
+            version = self._versions.pop(self.key(old_path), None)
+            if version is not None:
+                self._versions[self.key(new_path)] = version
+
+    def prune(self, known_files: set[str]) -> dict:
+        """Supprime les vignettes des fichiers absents de la bibliothèque."""
+        removed, reclaimed = 0, 0
+        for folder in self._root.iterdir():
+            if folder.name in known_files or not folder.is_dir():
+                continue
+            reclaimed += sum(f.stat().st_size for f in folder.iterdir() if f.is_file())
+            self.remove(folder.name)
+            removed += 1
+        return {"folders": removed, "reclaimed_bytes": reclaimed}
+
+    def _submit(self, audio_path: str, fn, *args):
+        key = self.key(audio_path)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self._executor.submit(self._guarded, key, fn, *args)
+
+    def _guarded(self, key: str, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            logger.warning(f"Vignettes : échec pour {key} : {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    # ------------------------------------------------------------------
+    # Génération (thread du pool)
+    # ------------------------------------------------------------------
+
+    def _extract(self, audio_path: str):
+        folder = self.folder(audio_path)
+        folder.mkdir(exist_ok=True)
+        source = folder / "source.jpg"
+        # La pochette intégrée est exposée par ffmpeg comme un flux vidéo
+        try:
+            ok = _ffmpeg("-i", audio_path, "-an", "-map", "0:v:0", "-frames:v", "1", "-c:v", "mjpeg", str(source))
+        except ThumbnailError:
+            source.unlink(missing_ok=True)
+            raise
+        if not ok or not source.is_file():
+            source.unlink(missing_ok=True)
+            (folder / _NO_COVER).touch()
+            return
+        self._make_variants(audio_path, source)
+
+    def _download(self, audio_path: str, url: str):
+        folder = self.folder(audio_path)
+        folder.mkdir(exist_ok=True)
+        source = folder / "source.jpg"
+        try:
+            with urllib.request.urlopen(url, timeout=_DOWNLOAD_TIMEOUT) as resp:
+                data = resp.read(_SOURCE_MAX_BYTES + 1)
+        except OSError as e:
+            logger.warning(f"Vignettes : téléchargement impossible ({url}) : {e}")
+            self._extract(audio_path)
+            return
+        if len(data) > _SOURCE_MAX_BYTES:
+            raise ValueError("image trop volumineuse")
+        source.write_bytes(data)
+        self._make_variants(audio_path, source)
+
+    def _make_variants(self, audio_path: str, source: Path):
+        folder = source.parent
+        # Un seul ffmpeg pour toutes les variantes (une sortie par taille/format) ;
+        # sans libwebp dans ffmpeg, on se rabat sur le JPEG seul
+        if not _ffmpeg(*self._variant_args(source, webp=True)):
+            for stale in folder.glob("*.webp"):
+                stale.unlink()
+            if not _ffmpeg(*self._variant_args(source, webp=False)):
+                raise RuntimeError("génération des variantes impossible")
+        (folder / _NO_COVER).unlink(missing_ok=True)
+        self._index(folder)
+        logger.info(f"Vignettes générées : {self.key(audio_path)}")
+
+    @staticmethod
+    def _variant_args(source: Path, webp: bool) -> list[str]:
+        args = ["-i", str(source)]
+        for size in SIZES:
+            # Carré centré : les pochettes YouTube (16:9) sont recadrées
+            crop = f"scale={size}:{size}:force_original_aspect_ratio=increase,crop={size}:{size}"
+            args += ["-vf", crop, "-q:v", "5", str(source.parent / f"{size}.jpg")]
+            if webp:
+                args += ["-vf", crop, "-c:v", "libwebp", "-quality", "75", str(source.parent / f"{size}.webp")]
+        return args
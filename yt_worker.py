@@ -0,0 +1,251 @@
+"""
+Opérations yt-dlp (recherche, téléchargement audio).
+
+Deux modes d'utilisation :
+  - import direct depuis app.py (mode normal) ;
+  - exécution dans un sous-processus éphémère (mode basse mémoire) :
+        python yt_worker.py search '{"query": "...", "cookies_file": "..."}'
+        python yt_worker.py download '{"url": "...", "dest_dir": "...", ...}'
+    Le résultat est écrit en JSON sur stdout. yt_dlp (~30 Mo une fois importé)
+    n'est alors jamais chargé dans le worker Gunicorn et la mémoire est
+    entièrement rendue au système à la fin de la commande.
+
+Formats audio :
+  - natif (défaut) : le flux audio de YouTube est gardé tel quel (m4a/AAC
+    de préférence, sinon Opus). ffmpeg ne fait au plus qu'un changement de
+    conteneur (webm → opus), sans décodage : le fichier est lisible par VLC
+    dès la fin du téléchargement.
+  - mp3 : réencodage en MP3 192k pendant le téléchargement (ancien
+    comportement), plusieurs dizaines de secondes de CPU sur un Pi.
+  - transcode_mp3() réencode après coup un téléchargement natif (utilisé
+    par la maintenance de fond en mode différé).
+
+Ce module ne doit pas importer Flask ni l'application : il doit rester
+léger à démarrer en sous-processus.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Durée max d'une commande en sous-processus (recherche / téléchargement)
+SEARCH_TIMEOUT = 60
+DOWNLOAD_TIMEOUT = 30 * 60
+
+# Extensions possibles d'un téléchargement natif, et nom de fichier
+# <id vidéo>.<ext> donné par outtmpl
+NATIVE_EXTENSIONS = (".m4a", ".opus", ".ogg", ".webm")
+_VIDEO_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+_TRANSCODE_POLL = 0.5
+
+
+class YtWorkerError(RuntimeError):
+    """Erreur remontée par le sous-processus yt-dlp."""
+
+
+def base_opts(cookies_file: str | None = None) -> dict:
+    """Options yt-dlp communes : clients et cookies si disponibles.
+
+    Clients retenus :
+    - ios         : pas de PO token, pas de SABR — le plus fiable en 2025/2026
+    - tv_embedded : fallback, fonctionne sur les vidéos embarquables
+    NE PAS utiliser :
+    - web/mweb    : SABR forcing depuis 2025 (yt-dlp #12482), URLs directes supprimées
+    - android     : blacklisté par YouTube depuis fin 2024
+
+    IMPORTANT : mettre à jour yt-dlp régulièrement.
+    En cas d'erreur "no longer supported" ou 403 :
+      pip install -U yt-dlp && systemctl restart baby-jukebox
+    """
+    opts: dict = {
+        "quiet": True,
+        "no_warnings": True,
+        "extractor_args": {"youtube": {"player_client": ["ios", "tv_embedded"]}},
+    }
+    if cookies_file and Path(cookies_file).exists():
+        opts["cookiefile"] = str(cookies_file)
+        logger.info("YouTube : cookies chargés depuis youtube_cookies.txt")
+    return opts
+
+
+def search(query: str, cookies_file: str | None = None, limit: int = 8) -> list[dict]:
+    """Recherche YouTube : retourne les entrées brutes (id, title, duration, uploader)."""
+    import yt_dlp  # type: ignore
+
+    ydl_opts = base_opts(cookies_file) | {"extract_flat": True}
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(f"ytsearch{limit}:{query}", download=False)
+
+    return [
+        {
+            "id": entry.get("id", ""),
+            "title": entry.get("title"),
+            "duration": entry.get("duration"),
+            "uploader": entry.get("uploader") or entry.get("channel") or "",
+        }
+        for entry in (info.get("entries") or [])
+    ]
+
+
+def download(url: str, dest_dir: str, cookies_file: str | None = None, transcode: bool = False) -> dict:
+    """Télécharge l'audio d'une vidéo, dans son format natif ou en MP3 192k.
+
+    :param transcode: True = réencodage MP3 (ffmpeg, coûteux) ; False = flux
+        natif, seulement remuxé si son conteneur n'est pas un conteneur audio
+    :return: {"id", "title", "file", "thumbnail", "seconds"} — file = nom du
+             fichier dans dest_dir, thumbnail = URL de la vignette YouTube
+             (JPEG), seconds = durée téléchargement → fichier lisible
+    """
+    import yt_dlp  # type: ignore
+
+    start = time.monotonic()
+    if transcode:
+        # Aucune restriction de format : ffmpeg extrait l'audio quelle que soit la source
+        fmt = "bestaudio/best"
+        extract = {"key": "FFmpegExtractAudio", "preferredcodec": "mp3", "preferredquality": "192"}
+    else:
+        # m4a (AAC, tv_embedded/iOS) en priorité : aucun traitement après
+        # téléchargement. "best" = copie du flux audio (-acodec copy) si un
+        # changement de conteneur est nécessaire, jamais de réencodage.
+        fmt = "bestaudio[ext=m4a]/bestaudio[acodec=opus]/bestaudio/best"
+        extract = {"key": "FFmpegExtractAudio", "preferredcodec": "best"}
+
+    ydl_opts = base_opts(cookies_file) | {
+        'format': fmt,
+        'quiet': False,
+        'no_warnings': False,
+        'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/119.0.0.0 Safari/537.36',
+        'nocheckcertificate': True,
+        "postprocessors": [extract],
+        # Nomme le fichier par l'ID vidéo → nom prévisible, pas de conflit
+        "outtmpl": str(Path(dest_dir) / "%(id)s.%(ext)s"),
+        "nooverwrites": True,
+    }
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=True)
+
+    # Chemin final, après changement d'extension éventuel par ffmpeg
+    downloads = info.get("requested_downloads") or [{}]
+    final = downloads[-1].get("filepath") or f"{info['id']}.{'mp3' if transcode else info.get('ext', 'm4a')}"
+
+    return {
+        "id": info["id"],
+        "title": info["title"],
+        "file": Path(final).name,
+        # hqdefault.jpg existe pour toute vidéo et reste en JPEG, contrairement
+        # à info["thumbnail"] (souvent WebP, parfois maxres absent)
+        "thumbnail": f"https://i.ytimg.com/vi/{info['id']}/hqdefault.jpg",
+        "seconds": round(time.monotonic() - start, 2),
+    }
+
+
+def is_native_download(file_path: str) -> bool:
+    """True pour un téléchargement YouTube gardé dans son format natif (<id>.m4a…)."""
+    path = Path(file_path)
+    return path.suffix.lower() in NATIVE_EXTENSIONS and bool(_VIDEO_ID.match(path.stem))
+
+
+def transcode_mp3(src: str, dest: str, check=None) -> None:
+    """Réencode src en MP3 192k dans dest (ffmpeg en nice 19, un seul thread).
+
+    Écrit d'abord dans dest + '.part' puis renomme : un fichier partiel n'est
+    jamais pris pour un audio. check() est appelé toutes les 0,5 s ; s'il
+    lève une exception, ffmpeg est tué et l'exception propagée.
+    """
+    part = f"{dest}.part"
+    cmd = [
+        "nice", "-n", "19",
+        "ffmpeg", "-nostdin", "-v", "error", "-y", "-threads", "1",
+        "-i", src, "-map", "0:a:0", "-map_metadata", "0",
+        "-c:a", "libmp3lame", "-b:a", "192k", "-f", "mp3", part,
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        while True:
+            try:
+                proc.wait(_TRANSCODE_POLL)
+                break
+            except subprocess.TimeoutExpired:
+                if check is not None:
+                    check()
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        Path(part).unlink(missing_ok=True)
+        raise
+    if proc.returncode != 0:
+        Path(part).unlink(missing_ok=True)
+        raise YtWorkerError(f"ffmpeg : {proc.stderr.read().strip() or proc.returncode}")
+    os.replace(part, dest)
+
+
+# ---------------------------------------------------------------------------
+# Sous-processus
+# ---------------------------------------------------------------------------
+
+_COMMANDS = {"search": search, "download": download}
+
+
+def run_isolated(command: str, timeout: float, **kwargs):
+    """Exécute une commande de ce module dans un sous-processus Python éphémère.
+
+    Lève ImportError si yt-dlp est absent (même contrat que l'import direct),
+    YtWorkerError pour toute autre erreur.
+    """
+    try:
+        proc = subprocess.run(
+            [sys.executable, __file__, command, json.dumps(kwargs)],
+            # stderr hérité : les logs yt-dlp arrivent dans journald comme avant
+            stdout=subprocess.PIPE,
+            text=True,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        raise YtWorkerError(f"yt-dlp : délai dépassé ({timeout:.0f} s)")
+
+    # stdout ne contient que le résultat JSON (dernière ligne)
+    lines = proc.stdout.strip().splitlines()
+    try:
+        payload = json.loads(lines[-1]) if lines else {}
+    except json.JSONDecodeError:
+        payload = {}
+    if proc.returncode == 0 and "result" in payload:
+        return payload["result"]
+
+    if payload.get("type") == "ImportError":
+        raise ImportError(payload.get("error"))
+    message = payload.get("error") or f"yt-dlp : code de sortie {proc.returncode}"
+    raise YtWorkerError(message)
+
+
+def main(argv: list[str]) -> int:
+    logging.basicConfig(
+        level=logging.INFO,
+        stream=sys.stderr,
+        format="%(asctime)s [%(levelname)s] yt-worker — %(message)s",
+    )
+    command, raw_kwargs = argv[1], argv[2]
+    # Les messages de progression de yt-dlp (quiet=False) iraient sur stdout
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    try:
+        result = _COMMANDS[command](**json.loads(raw_kwargs))
+    except Exception as e:
+        kind = "ImportError" if isinstance(e, ImportError) else type(e).__name__
+        stdout.write(json.dumps({"error": str(e), "type": kind}) + "\n")
+        return 1
+    stdout.write(json.dumps({"result": result}) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))